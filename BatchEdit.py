@@ -0,0 +1,228 @@
+import argparse
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from KeyMacro import KeyMacro
+from MultiCursor import typeKey
+from TextBuffer import TextBuffer
+
+# files bigger than this are memory mapped instead of read
+LARGE_FILE = 64 * 1024 * 1024
+# keys a macro can use without a screen, page keys need a view height
+MACRO_KEYS = {
+    "\x1b[A": "UP",
+    "\x1b[B": "DOWN",
+    "\x1b[C": "RIGHT",
+    "\x1b[D": "LEFT",
+    "\x1b[1;5H": "CTRL_HOME",
+    "\x1b[1;5F": "CTRL_END",
+}
+
+
+def parseKeys(text):
+    # "ab\x1b[B\r" style text, with escapes, into the key names getKey returns
+    text = text.encode("latin-1", "backslashreplace").decode("unicode_escape")
+    keys = []
+    i = 0
+    while i < len(text):
+        if text[i] == "\x1b":
+            for sequence, name in MACRO_KEYS.items():
+                if text.startswith(sequence, i):
+                    keys.append(name)
+                    i += len(sequence)
+                    break
+            else:
+                raise ValueError(f"Unsupported key sequence in macro at {text[i:i + 8]!r}")
+            continue
+        char = "\r" if text[i] == "\n" else text[i]
+        if not char.isprintable() and char not in ("\r", "\x7f"):
+            raise ValueError(f"Unsupported key in macro: {char!r}")
+        keys.append(char)
+        i += 1
+    return keys
+
+
+class HeadlessEditor:
+    # the cursor movement of pyEdit on a buffer with no screen, so over
+    # lines instead of rows, and its editing through typeKey
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.line = 0
+        self.char = 0
+        self.wantChar = 0
+
+    def moveToLine(self, line):
+        self.line = min(max(line, 0), self.buffer.lineCount() - 1)
+        self.char = min(self.wantChar, len(self.buffer.getLine(self.line)))
+
+    def key(self, key):
+        buffer = self.buffer
+        if key == "UP":
+            self.moveToLine(self.line - 1)
+        elif key == "DOWN":
+            self.moveToLine(self.line + 1)
+        elif key == "LEFT":
+            self.char = self.wantChar = max(self.char - 1, 0)
+        elif key == "RIGHT":
+            self.char = self.wantChar = min(self.char + 1, len(buffer.getLine(self.line)))
+        elif key == "CTRL_HOME":
+            self.wantChar = 0
+            self.moveToLine(0)
+        elif key == "CTRL_END":
+            self.wantChar = 0
+            self.moveToLine(buffer.lineCount() - 1)
+        else:
+            (self.line, self.char), _ = typeKey(buffer, self.line, self.char, key)
+            self.wantChar = self.char
+
+
+def replaceLines(buffer, pattern, replacement, regex):
+    # only lines that change are set, the rest are saved byte for byte.
+    # They are replaced after the scan in one pass over the pieces, iterLines
+    # walks the pieces an edit splits.
+    edits = []
+    if regex:
+        pattern = re.compile(pattern)
+    for number, line in enumerate(buffer.iterLines()):
+        if regex:
+            new = pattern.sub(replacement, line)
+        elif pattern in line:
+            new = line.replace(pattern, replacement)
+        else:
+            continue
+        if new != line:
+            edits.append((number, number + 1, [new]))
+    buffer.replaceLines(edits)
+    return len(edits)
+
+
+def applyOperation(buffer, operation):
+    # returns how many lines it touched
+    kind, args = operation
+    if kind == "replace":
+        return replaceLines(buffer, args[0], args[1], regex=False)
+    if kind == "sub":
+        return replaceLines(buffer, args[0], args[1], regex=True)
+    if kind == "insert":
+        # 1-based like FILE:LINE, past the end appends
+        line = min(max(int(args[0]) - 1, 0), buffer.lineCount())
+        lines = args[1].split("\n")
+        buffer.insertLines(line, lines)
+        return len(lines)
+    if kind == "delete":
+        start, stop = int(args[0]) - 1, int(args[1])
+        before = buffer.lineCount()
+        buffer.deleteLines(max(start, 0), stop)
+        return before - buffer.lineCount()
+    if kind == "macro":
+        # the keys times over, or to the end of the buffer like Ctrl-T with
+        # an empty answer
+        editor = HeadlessEditor(buffer)
+        macro = KeyMacro()
+        macro.keys = parseKeys(args[0])
+        times = None if args[1] == "end" else int(args[1])
+        for key in macro.replay(times, lambda: buffer.lineCount() - 1 - editor.line):
+            editor.key(key)
+        return macro.runs
+    raise ValueError(f"Unknown operation {kind}")
+
+
+def save(buffer, filename):
+    # Like pyEdit.Save, written next to the file and moved into place. Runs
+    # of untouched lines are copied straight from the old bytes. A symlink
+    # is followed, so the link stays and its target is saved.
+    path = os.path.realpath(filename)
+    tempName = path + ".pyedit-save"
+    try:
+        with open(tempName, "wb") as file:
+            for chunk in buffer.encodedChunks():
+                file.write(chunk)
+        shutil.copymode(path, tempName)
+        os.replace(tempName, path)
+    except BaseException:
+        if os.path.exists(tempName):
+            os.unlink(tempName)
+        raise
+
+
+def editFile(filename, operations):
+    # runs in a worker process, returns (filename, seconds, touched, error)
+    start = time.perf_counter()
+    buffer = None
+    try:
+        large = os.path.getsize(filename) > LARGE_FILE
+        buffer = TextBuffer.fromFile(filename, large=large)
+        while buffer.indexMore() is not None:
+            pass
+        touched = sum(applyOperation(buffer, operation) for operation in operations)
+        if buffer.modified:
+            save(buffer, filename)
+        return filename, time.perf_counter() - start, touched, None
+    except (OSError, ValueError, re.error) as error:
+        return filename, time.perf_counter() - start, 0, str(error)
+    finally:
+        if buffer is not None:
+            buffer.close()
+
+
+class OperationAction(argparse.Action):
+    # keeps every edit flag in command line order in one list
+    def __call__(self, parser, namespace, values, option_string=None):
+        operations = getattr(namespace, self.dest, None) or []
+        operations.append((option_string.lstrip("-"), list(values)))
+        setattr(namespace, self.dest, operations)
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(prog="pyedit-batch", description="Apply edits to many files without a screen.")
+    parser.add_argument("files", nargs="+", help="files to edit in place")
+    parser.add_argument("--replace", nargs=2, metavar=("OLD", "NEW"), action=OperationAction, dest="operations",
+                        help="replace text on every line")
+    parser.add_argument("--sub", nargs=2, metavar=("PATTERN", "REPLACEMENT"), action=OperationAction, dest="operations",
+                        help="replace a regular expression on every line")
+    parser.add_argument("--insert", nargs=2, metavar=("LINE", "TEXT"), action=OperationAction, dest="operations",
+                        help="insert lines before a 1-based line")
+    parser.add_argument("--delete", nargs=2, metavar=("FIRST", "LAST"), action=OperationAction, dest="operations",
+                        help="delete a 1-based range of lines")
+    parser.add_argument("--macro", nargs=2, metavar=("KEYS", "TIMES"), action=OperationAction, dest="operations",
+                        help="replay keys, with escapes like \\x1b[B for down, TIMES times or 'end' for to the end of the file")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--top", type=int, default=20, help="slowest files to list, 0 lists every file")
+    args = parser.parse_args(argv)
+    if not args.operations:
+        parser.error("no edits given")
+    return args
+
+
+def main(argv=None):
+    args = parseArgs(sys.argv[1:] if argv is None else argv)
+
+    started = time.perf_counter()
+    # big batches so 10,000 small files are not 10,000 round trips
+    chunksize = max(1, len(args.files) // (args.jobs * 8))
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        results = list(executor.map(editFile, args.files, repeat(args.operations), chunksize=chunksize))
+    elapsed = time.perf_counter() - started
+
+    failed = [result for result in results if result[3] is not None]
+    results.sort(key=lambda result: result[1], reverse=True)
+    shown = results if args.top == 0 else results[:args.top]
+    for filename, seconds, touched, error in shown:
+        print(f"{seconds * 1000:9.1f} ms  {touched:8d}  {filename}" + (f"  FAILED: {error}" if error else ""))
+    # failures are always listed, however fast they were
+    listed = {result[0] for result in shown}
+    for filename, seconds, touched, error in failed:
+        if filename not in listed:
+            print(f"{seconds * 1000:9.1f} ms  {0:8d}  {filename}  FAILED: {error}")
+
+    busy = sum(result[1] for result in results)
+    print(f"{len(results)} files in {elapsed:.2f} s on {args.jobs} workers, {busy:.2f} s of work, {len(failed)} failed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
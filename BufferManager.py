@@ -0,0 +1,226 @@
+import os
+from CompressedFile import compressionFor
+from TextBuffer import TextBuffer, fileIdentity
+
+# memory the loaded buffers may use before inactive ones are unloaded
+MEMORY_LIMIT = 512 * 1024 * 1024
+
+
+class Document:
+    def __init__(self, filename):
+        self.filename = filename
+        # "gzip", "bz2" or "xz" for files opened and saved compressed
+        self.compression = compressionFor(filename) if filename else None
+        # still being decompressed into the buffer
+        self.loading = False
+        # member starts of a compressed file, see CompressedFile.py
+        self.seekPoints = None
+        # None while unloaded to save memory
+        self.buffer = None
+        self.encoding = None
+        # view state, kept while the document is in the background
+        self.linesScrolled = 0
+        self.pos = [0, 0]
+        self.wantChar = 1
+        # (identity, starts, indexed) of an unloaded buffer, so reloading an
+        # unchanged file skips indexing
+        self.keptIndex = None
+        # another program changed the file and our edits could not be moved
+        # over to its new content, saving asks before overwriting it
+        self.changedOnDisk = False
+        # split views showing the document, it stays loaded while shown
+        self.views = 0
+        # (identity, lines) of the index in the session cache, so an
+        # unchanged index is not written again
+        self.cachedIndex = None
+        # WordIndex of the loaded buffer for completion, counted in the background
+        self.words = None
+        # the document a filtered view shows lines of, its buffer is then a
+        # LineFilter
+        self.source = None
+        # lines read from a pipe, they only live in the buffer
+        self.piped = False
+        # shown like a pager, the --readonly option holds for every document
+        self.readOnly = False
+
+    def canReload(self):
+        # piped input and a file never saved cannot be read again
+        return bool(self.filename) and not self.piped
+
+    def name(self):
+        if self.source is not None:
+            return f"{self.source.name()} | {self.buffer.text}"
+        return os.path.basename(self.filename) if self.filename else "[no name]"
+
+
+class BufferManager:
+    def __init__(self, memoryLimit=MEMORY_LIMIT, large=False, sessions=None):
+        self.memoryLimit = memoryLimit
+        self.large = large
+        # SessionCache restoring the index and position of reopened files
+        self.sessions = sessions
+        # called with a document whose compressed file has to be streamed in
+        self.onStream = None
+        # in the order they were opened
+        self.documents = []
+        # loaded documents, least recently used first
+        self.recent = []
+
+    def find(self, filename):
+        path = os.path.abspath(filename) if filename else filename
+        for document in self.documents:
+            if document.filename and os.path.abspath(document.filename) == path:
+                return document
+        return None
+
+    def open(self, filename, buffer=None):
+        # an already open file is switched to instead of loaded twice
+        document = self.find(filename) if filename else None
+        if document is None:
+            document = Document(filename)
+            document.buffer = buffer
+            if buffer is None and filename and self.sessions is not None:
+                self.restore(document)
+            self.documents.append(document)
+        return self.activate(document)
+
+    def openFilter(self, source, lines):
+        # a filtered view of source, lines is its LineFilter
+        document = Document("")
+        document.source = source
+        document.buffer = lines
+        self.documents.append(document)
+        return self.activate(document)
+
+    def activate(self, document):
+        if document.buffer is None:
+            self.load(document)
+        if document in self.recent:
+            self.recent.remove(document)
+        self.recent.append(document)
+        self.trim()
+        return document
+
+    def load(self, document):
+        if document.filename and document.compression and os.path.exists(document.filename):
+            document.buffer = self.loadCompressed(document)
+        elif document.filename and os.path.exists(document.filename):
+            document.buffer = TextBuffer.fromFile(document.filename, document.encoding, self.large, document.keptIndex)
+        else:
+            # a new file, created on the first save
+            document.buffer = TextBuffer(encoding=document.encoding)
+        document.keptIndex = None
+
+    def loadCompressed(self, document):
+        from CompressedFile import MemberData, seekable
+        from LineIndex import LineIndex
+
+        file = open(document.filename, "rb")
+        identity = fileIdentity(os.fstat(file.fileno()))
+        kept = document.keptIndex
+        if kept is not None and kept[0] == identity and seekable(document.seekPoints) and kept[2] == document.seekPoints[-1][1]:
+            # indexed before and split in members, lines are decompressed
+            # only when they are looked at
+            data = MemberData(file, document.compression, document.seekPoints)
+            buffer = TextBuffer(LineIndex(data, starts=kept[1], indexed=kept[2]), document.encoding)
+        else:
+            # stream it in, the first screen shows before the rest is inflated
+            from SpooledData import SpooledData
+
+            file.close()
+            buffer = TextBuffer(LineIndex(SpooledData()), document.encoding)
+            document.loading = True
+            document.seekPoints = None
+        buffer.identity = identity
+        if document.loading and self.onStream is not None:
+            self.onStream(document, buffer)
+        return buffer
+
+    def restore(self, document):
+        # pick up where the file was left, the index is only used when the
+        # file is unchanged, fromFile checks that again
+        session = self.sessions.load(document.filename)
+        if session is None:
+            return
+        document.linesScrolled = session["linesScrolled"]
+        document.pos = session["pos"]
+        document.wantChar = session["wantChar"]
+        if session["starts"] is not None:
+            document.keptIndex = (session["identity"], session["starts"], session["indexed"])
+            document.seekPoints = session.get("seekPoints")
+            document.cachedIndex = (session["identity"], session["lines"])
+
+    def saveSessions(self):
+        if self.sessions is None:
+            return
+        for document in self.documents:
+            if not document.filename:
+                continue
+            if document.buffer is not None:
+                buffer = document.buffer
+                identity, starts, indexed = buffer.identity, buffer.index.starts, buffer.index.indexed
+            elif document.keptIndex is not None:
+                identity, starts, indexed = document.keptIndex
+            else:
+                continue
+            try:
+                current = fileIdentity(os.stat(document.filename))
+            except OSError:
+                continue
+            if identity != current or (document.buffer is not None and document.buffer.detached):
+                # saved or changed on disk, the index is of an older version,
+                # or not of the file at all
+                starts, indexed = None, 0
+            writeIndex = document.cachedIndex != (current, len(starts) if starts is not None else 0)
+            state = (document.linesScrolled, document.pos, document.wantChar)
+            if document.loading:
+                # only part of a compressed file was read
+                starts, indexed = None, 0
+            self.sessions.save(document.filename, current, starts, indexed, state, writeIndex, document.seekPoints)
+
+    def unload(self, document):
+        # keep the file identity and line index, drop the bytes and caches
+        buffer = document.buffer
+        document.encoding = buffer.encoding
+        if buffer.identity is not None:
+            document.keptIndex = (buffer.identity, buffer.index.starts, buffer.index.indexed)
+        buffer.close()
+        document.buffer = None
+        self.recent.remove(document)
+
+    def memoryUsage(self):
+        return sum(document.buffer.memoryUsage() for document in self.recent)
+
+    def trim(self):
+        # unload clean background buffers, least recently used first, until
+        # the loaded ones fit in the memory limit again
+        usage = self.memoryUsage()
+        # filtered views cannot be loaded again, and read through their source
+        sources = {document.source for document in self.recent if document.source is not None}
+        for document in list(self.recent[:-1]):
+            if usage <= self.memoryLimit:
+                break
+            if document.buffer.modified or document.views or document.loading:
+                continue
+            if not document.canReload():
+                continue
+            if document.source is not None or document in sources:
+                continue
+            usage -= document.buffer.memoryUsage()
+            self.unload(document)
+
+    def close(self, document):
+        # filtered views of the document go with it
+        for other in [other for other in self.documents if other.source is document]:
+            self.close(other)
+        if document.buffer is not None:
+            document.buffer.close()
+            self.recent.remove(document)
+        self.documents.remove(document)
+
+    def next(self, document, step=1):
+        i = self.documents.index(document)
+        return self.documents[(i + step) % len(self.documents)]
+
+    def modified(self):
+        return [document for document in self.documents if document.buffer is not None and document.buffer.modified]
@@ -0,0 +1,166 @@
+from array import array
+from LineIndex import LineIndex
+
+STREAM = "stream"
+LINE = "line"
+BLOCK = "block"
+# the order Ctrl-U goes through them
+MODES = (STREAM, LINE, BLOCK)
+# largest text sent to the terminal clipboard, terminals drop bigger ones
+EXPORT_LIMIT = 100 * 1024
+
+
+class Clip:
+    # Copied text as pieces like those of a TextBuffer. Runs of untouched
+    # lines stay (start, stop) lines of the index they came from, so copying
+    # any number of them costs the same, and nothing is decoded until the
+    # text is pasted into another buffer or exported.
+    def __init__(self, mode, buffer, pieces):
+        self.mode = mode
+        self.index = buffer.index
+        self.encoding = buffer.encoding
+        self.pieces = pieces
+        if any(isinstance(piece, tuple) for piece in pieces):
+            # the buffer closes its index before a reload, we keep a copy
+            buffer.copies.add(self)
+
+    def lineCount(self):
+        return sum(piece[1] - piece[0] if isinstance(piece, tuple) else len(piece) for piece in self.pieces)
+
+    def iterLines(self):
+        for piece in self.pieces:
+            if isinstance(piece, tuple):
+                for line in range(*piece):
+                    text = self.index.lineBytes(line).decode(self.encoding, "surrogateescape")
+                    yield text[:-1] if text.endswith("\r") else text
+            else:
+                yield from piece
+
+    def piecesFor(self, buffer):
+        # pieces to paste into a buffer, runs only go in as they are when
+        # they are lines of its index
+        if self.index is buffer.index:
+            return self.pieces
+        return [list(self.iterLines())]
+
+    def size(self):
+        # bytes of the text, without decoding it
+        size = 0
+        for piece in self.pieces:
+            if isinstance(piece, tuple):
+                start, stop = piece
+                end = self.index.starts[stop] if stop < len(self.index.starts) else self.index.indexed
+                size += end - self.index.starts[start]
+            else:
+                size += sum(len(line) + 1 for line in piece)
+        return size
+
+    def text(self):
+        text = "\n".join(self.iterLines())
+        return text + "\n" if self.mode == LINE else text
+
+    def detach(self):
+        # The bytes of the runs copied into an index of our own, for when
+        # the index they are in gets closed
+        index = self.index
+        data = bytearray()
+        starts = array("q")
+        pieces = []
+        for piece in self.pieces:
+            if isinstance(piece, list):
+                pieces.append(piece)
+                continue
+            start, stop = piece
+            first = len(starts)
+            begin = index.starts[start]
+            end = index.starts[stop] if stop < len(index.starts) else index.indexed
+            starts.extend(offset - begin + len(data) for offset in index.starts[start:stop])
+            data += index.data[begin:end]
+            if not data.endswith(b"\n"):
+                # the last line of the file
+                data += b"\n"
+            pieces.append((first, len(starts)))
+        # like LineIndex, the final newline starts an empty line
+        starts.append(len(data))
+        self.index = LineIndex(bytes(data), starts=starts, indexed=len(data))
+        self.pieces = pieces
+
+
+def ordered(anchor, cursor):
+    # the ((line, char), (line, char)) ends of a selection, first one first
+    return (anchor, cursor) if anchor <= cursor else (cursor, anchor)
+
+
+def blockColumns(anchor, cursor):
+    return min(anchor[1], cursor[1]), max(anchor[1], cursor[1])
+
+
+def selectedSpan(mode, anchor, cursor, line, length):
+    # (start, end) characters of a line that the selection covers, None
+    # when it is outside. A whole line also covers its end.
+    start, end = ordered(anchor, cursor)
+    if not start[0] <= line <= end[0]:
+        return None
+    if mode == LINE:
+        return 0, length + 1
+    if mode == BLOCK:
+        return blockColumns(anchor, cursor)
+    return (start[1] if line == start[0] else 0), (end[1] if line == end[0] else length + 1)
+
+
+def copySelection(buffer, mode, anchor, cursor):
+    start, end = ordered(anchor, cursor)
+    if mode == LINE:
+        return Clip(mode, buffer, buffer.copyPieces(start[0], end[0] + 1))
+    if mode == BLOCK:
+        left, right = blockColumns(anchor, cursor)
+        return Clip(mode, buffer, [[text[left:right] for text in buffer.getLines(start[0], end[0] + 1)]])
+    if start[0] == end[0]:
+        return Clip(mode, buffer, [[buffer.getLine(start[0])[start[1]:end[1]]]])
+    # only the first and last lines are cut, the ones between are runs
+    first = [buffer.getLine(start[0])[start[1]:]]
+    last = [buffer.getLine(end[0])[:end[1]]]
+    return Clip(mode, buffer, [first] + buffer.copyPieces(start[0] + 1, end[0]) + [last])
+
+
+def cutSelection(buffer, mode, anchor, cursor):
+    # (start, stop, pieces) replacing the selected lines without the selection
+    start, end = ordered(anchor, cursor)
+    if mode == LINE:
+        return start[0], end[0] + 1, []
+    if mode == BLOCK:
+        left, right = blockColumns(anchor, cursor)
+        lines = [text[:left] + text[right:] for text in buffer.getLines(start[0], end[0] + 1)]
+        return start[0], end[0] + 1, [lines]
+    joined = buffer.getLine(start[0])[:start[1]] + buffer.getLine(end[0])[end[1]:]
+    return start[0], end[0] + 1, [[joined]]
+
+
+def pasteClip(buffer, clip, line, char):
+    # (start, stop, pieces) putting the clip in at a position, and where the
+    # cursor goes after it
+    pieces = clip.piecesFor(buffer)
+    if clip.mode == LINE:
+        # whole lines go in before the cursor line
+        return (line, line, pieces), (line + clip.lineCount(), char)
+    if clip.mode == BLOCK:
+        # a line of the block on every line from the cursor down, short
+        # lines are padded and missing ones added at the end
+        block = pieces[0]
+        stop = min(line + len(block), buffer.lineCount())
+        lines = []
+        for i, part in enumerate(block):
+            text = buffer.getLine(line + i) if line + i < stop else ""
+            lines.append(text[:char].ljust(char) + part + text[char:])
+        return (line, stop, [lines]), (line, char)
+    text = buffer.getLine(line)
+    if clip.lineCount() == 1:
+        part = next(clip.iterLines())
+        return (line, line + 1, [[text[:char] + part + text[char:]]]), (line, char + len(part))
+    # the first and last clip lines join the cut line, runs in between go
+    # in as they are. The end lines are always in lists of their own.
+    pieces = [list(piece) if isinstance(piece, list) else piece for piece in pieces]
+    tail = pieces[-1][-1]
+    pieces[0][0] = text[:char] + pieces[0][0]
+    pieces[-1][-1] += text[char:]
+    return (line, line + 1, pieces), (line + clip.lineCount() - 1, len(tail))
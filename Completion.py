@@ -0,0 +1,118 @@
+import bisect
+import heapq
+import re
+from itertools import chain, islice
+
+# numbers are not words worth completing
+WORD = re.compile(r"[^\W\d]\w*")
+# words shorter than this are not worth completing
+MIN_WORD = 3
+# characters typed before completions are offered
+MIN_PREFIX = 2
+# buffer lines counted per step of the background scan
+SCAN_LINES = 2000
+# new words held back before they are merged into the sorted list
+MERGE_SIZE = 4096
+
+
+def wordsOf(lines):
+    return [word for word in WORD.findall("\n".join(lines)) if len(word) >= MIN_WORD]
+
+
+def prefixBefore(text, char):
+    # the part of a word that ends at the cursor, "" when not in a word
+    match = re.search(r"\w+$", text[:char])
+    return match.group() if match else ""
+
+
+class WordIndex:
+    # Word counts of one buffer with the words kept sorted for prefix
+    # lookups. New words go to a small sorted list that is merged into the
+    # big one once it has grown, so neither the scan nor typing ever sorts
+    # everything again. Words whose count drops to nothing keep a count of
+    # 0, so a word is never in the lists twice.
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.counts = {}
+        self.words = []
+        self.recent = []
+        self.unsorted = []
+        # lines above this one are counted, edits below it are left to the scan
+        self.scanned = 0
+
+    def done(self):
+        return self.scanned >= self.buffer.lineCount()
+
+    def scanMore(self, lines=SCAN_LINES):
+        # count the next lines, returns True while there are more
+        stop = min(self.scanned + lines, self.buffer.lineCount())
+        self.add(wordsOf(islice(self.buffer.iterLines(self.scanned), stop - self.scanned)), 1)
+        self.scanned = stop
+        self.flush()
+        return not self.done()
+
+    def add(self, words, sign):
+        counts = self.counts
+        for word in words:
+            if word not in counts:
+                self.unsorted.append(word)
+                counts[word] = 0
+            counts[word] = max(counts[word] + sign, 0)
+
+    def edited(self, line, old, new):
+        # Lines line.. of the buffer, old before the edit and new after it.
+        # Only what the scan already counted is updated.
+        if line >= self.scanned:
+            return
+        counted = min(len(old), self.scanned - line)
+        self.add(wordsOf(old[:counted]), -1)
+        self.add(wordsOf(new), 1)
+        if counted == len(old):
+            self.scanned += len(new) - len(old)
+        else:
+            # the edit took lines the scan had not reached yet, they are
+            # counted as part of the new lines
+            self.scanned = line + len(new)
+
+    def moved(self, line, removed, added):
+        # Lines replaced without reading them, for pastes and cuts too big to
+        # count on a key press. Frequencies are off by those lines until the
+        # buffer is scanned again.
+        if line >= self.scanned:
+            return
+        if line + removed <= self.scanned:
+            self.scanned += added - removed
+        else:
+            self.scanned = line + added
+
+    def flush(self):
+        if self.unsorted:
+            # sorting two sorted runs is a merge done by timsort
+            self.recent += self.unsorted
+            self.recent.sort()
+            self.unsorted = []
+        if len(self.recent) > max(MERGE_SIZE, len(self.words) // 4):
+            self.words += self.recent
+            self.words.sort()
+            self.recent = []
+
+    def matches(self, prefix, limit):
+        # (count, word) of the most frequent words starting with prefix
+        self.flush()
+        end = prefix + "\U0010ffff"
+        found = chain.from_iterable(
+            words[bisect.bisect_left(words, prefix):bisect.bisect_left(words, end)] for words in (self.words, self.recent))
+        counts = self.counts
+        best = heapq.nlargest(limit, (word for word in found if word != prefix and counts[word]), key=counts.get)
+        return [(counts[word], word) for word in best]
+
+
+def complete(indexes, prefix, limit=8):
+    # the best completions over several buffers, counts added up
+    if len(prefix) < MIN_PREFIX:
+        return []
+    totals = {}
+    for index in indexes:
+        for count, word in index.matches(prefix, limit):
+            totals[word] = totals.get(word, 0) + count
+    return heapq.nlargest(limit, totals, key=totals.get)
@@ -0,0 +1,162 @@
+
+class Layer:
+    def __init__(self, name, row, col, width, height, z=0, style="", transparent=None):
+        self.name = name
+        self.row = row # screen row of the first layer row (1-based)
+        self.col = col # screen column of the first layer column (1-based)
+        self.width = width
+        self.height = height
+        self.z = z
+        self.style = style
+        # cells holding this character show the layers below
+        self.transparent = transparent
+        self.visible = True
+
+        # cached rendered cells, one string per layer row
+        self.rows = []
+        # screen rows that have to be recomposed because of this layer
+        self.damage = set()
+        self.dirty = True
+
+    def coversRow(self, y):
+        return self.visible and self.row <= y < self.row + self.height
+
+    def area(self):
+        return range(self.row, self.row + self.height)
+
+    def markDirty(self, rows=None):
+        if rows is None:
+            rows = self.area()
+        self.damage.update(rows)
+        self.dirty = True
+
+    def setRows(self, rows):
+        rows = [row[:self.width] for row in rows[:self.height]]
+
+        # only rows that actually changed are damaged
+        for i in range(max(len(rows), len(self.rows))):
+            old = self.rows[i] if i < len(self.rows) else None
+            new = rows[i] if i < len(rows) else None
+            if old != new:
+                self.markDirty([self.row + i])
+
+        self.rows = rows
+
+    def setRow(self, i, text):
+        text = text[:self.width]
+        while len(self.rows) <= i:
+            self.rows.append("")
+        if self.rows[i] != text:
+            self.rows[i] = text
+            self.markDirty([self.row + i])
+
+    def setGeometry(self, row, col, width, height):
+        if (row, col, width, height) == (self.row, self.col, self.width, self.height):
+            return
+        # the area we leave and the area we cover both need recomposing
+        self.markDirty()
+        self.row, self.col, self.width, self.height = row, col, width, height
+        self.rows = [row[:width] for row in self.rows[:height]]
+        self.markDirty()
+
+    def setVisible(self, visible):
+        if visible != self.visible:
+            self.visible = visible
+            self.markDirty()
+
+    def cell(self, y):
+        i = y - self.row
+        if i < len(self.rows):
+            return self.rows[i]
+        return ""
+
+
+class Compositor:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.layers = []
+        # what is currently on screen, one composed string per row
+        self.frame = [None] * (height + 1)
+        # rows left behind by removed layers
+        self.damage = set()
+
+    def addLayer(self, layer):
+        self.layers.append(layer)
+        self.layers.sort(key=lambda layer: layer.z)
+        layer.markDirty()
+        return layer
+
+    def removeLayer(self, layer):
+        # the rows it covered show what is below it again
+        self.layers.remove(layer)
+        if layer.visible:
+            self.damage.update(layer.area())
+
+    def getLayer(self, name):
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        return None
+
+    def resize(self, width, height):
+        if width == self.width and height == self.height:
+            return False
+        self.width = width
+        self.height = height
+        self.invalidate()
+        return True
+
+    def invalidate(self):
+        # forget what is on screen, the next compose repaints everything
+        self.frame = [None] * (self.height + 1)
+        for layer in self.layers:
+            layer.markDirty()
+
+    def composeRow(self, y):
+        chars = [" "] * self.width
+        styles = [""] * self.width
+
+        # paint layers bottom to top, clean layers come straight from cache
+        for layer in self.layers:
+            if not layer.coversRow(y):
+                continue
+            text = layer.cell(y).ljust(layer.width, layer.transparent or " ")
+            start = layer.col - 1
+            for i, char in enumerate(text):
+                x = start + i
+                if 0 <= x < self.width and char != layer.transparent:
+                    chars[x] = char
+                    styles[x] = layer.style
+
+        # group cells into runs of the same style
+        out = [f"\033[{y};1H"]
+        style = ""
+        for x in range(self.width):
+            if styles[x] != style:
+                out.append("\033[0m" + styles[x])
+                style = styles[x]
+            out.append(chars[x])
+        if style:
+            out.append("\033[0m")
+        return "".join(out)
+
+    def compose(self):
+        damaged = self.damage
+        self.damage = set()
+        for layer in self.layers:
+            if layer.dirty:
+                damaged.update(layer.damage)
+                layer.damage.clear()
+                layer.dirty = False
+
+        output = []
+        for y in sorted(damaged):
+            if y < 1 or y > self.height:
+                continue
+            row = self.composeRow(y)
+            # skip rows that end up the same as what is already on screen
+            if row != self.frame[y]:
+                self.frame[y] = row
+                output.append(row)
+        return "".join(output)
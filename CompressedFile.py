@@ -0,0 +1,184 @@
+import bisect
+import os
+from collections import OrderedDict
+from PipeReader import PipeReader
+
+# file name endings of the compressed formats we open and save
+COMPRESSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+# compressed bytes fed to the decompressor at a time
+READ_CHUNK = 256 * 1024
+# plain bytes per member when saving, every member start is a seek point
+MEMBER_SIZE = 4 * 1024 * 1024
+# members bigger than this are not worth decompressing for a single line,
+# such files are streamed from the start instead
+MAX_MEMBER = 16 * 1024 * 1024
+# decompressed members kept around for random access
+MEMBER_CACHE = 8
+
+
+def compressionFor(filename):
+    return COMPRESSIONS.get(os.path.splitext(filename)[1].lower())
+
+
+def newDecompressor(kind):
+    # one member at a time, eof and unused_data mark where the next one starts
+    if kind == "gzip":
+        import zlib
+
+        return zlib.decompressobj(wbits=31)
+    if kind == "bz2":
+        import bz2
+
+        return bz2.BZ2Decompressor()
+    import lzma
+
+    return lzma.LZMADecompressor()
+
+
+def newCompressor(kind):
+    if kind == "gzip":
+        import zlib
+
+        return zlib.compressobj(wbits=31)
+    if kind == "bz2":
+        import bz2
+
+        return bz2.BZ2Compressor()
+    import lzma
+
+    return lzma.LZMACompressor(format=lzma.FORMAT_XZ)
+
+
+def decompressErrors():
+    import lzma
+    import zlib
+
+    # bz2 reports damaged data as OSError
+    return (OSError, EOFError, zlib.error, lzma.LZMAError)
+
+
+def seekable(seekPoints):
+    # random access only pays off when every member is small
+    if not seekPoints or len(seekPoints) < 2:
+        return False
+    return all(b[1] - a[1] <= MAX_MEMBER for a, b in zip(seekPoints, seekPoints[1:]))
+
+
+class DecompressReader(PipeReader):
+    # Streams the plain bytes of a compressed file into the buffer the way
+    # piped input is read, and notes where every member starts on the way.
+    # seekPoints is a list of (compressed offset, plain offset) of every
+    # member, closed by the sizes of the whole file.
+    def __init__(self, filename, kind, loop, onData, onEnd):
+        super().__init__(None, loop, onData, onEnd)
+        self.filename = filename
+        self.kind = kind
+        self.seekPoints = [(0, 0)]
+
+    def chunks(self):
+        plain = 0
+        position = 0
+        decompressor = newDecompressor(self.kind)
+        try:
+            with open(self.filename, "rb") as file:
+                while True:
+                    block = file.read(READ_CHUNK)
+                    if not block:
+                        break
+                    position += len(block)
+                    while block:
+                        if decompressor.eof:
+                            if not block.strip(b"\0"):
+                                # padding after the last member
+                                break
+                            self.seekPoints.append((position - len(block), plain))
+                            decompressor = newDecompressor(self.kind)
+                        data = decompressor.decompress(block)
+                        if data:
+                            plain += len(data)
+                            yield data
+                        block = decompressor.unused_data if decompressor.eof else b""
+        except decompressErrors():
+            # a damaged file shows what could be decompressed
+            pass
+        self.seekPoints.append((position, plain))
+
+
+class MemberData:
+    # Random access to the plain bytes of a compressed file made of several
+    # members. A slice only decompresses the members it reaches into.
+    def __init__(self, file, kind, seekPoints):
+        # an open file, so a later replacement of the path does not matter
+        self.file = file
+        self.kind = kind
+        self.seekPoints = seekPoints
+        self.plainStarts = [plain for _, plain in seekPoints]
+        self.cache = OrderedDict()
+
+    def __len__(self):
+        return self.seekPoints[-1][1]
+
+    def member(self, i):
+        data = self.cache.get(i)
+        if data is not None:
+            self.cache.move_to_end(i)
+            return data
+
+        start, stop = self.seekPoints[i][0], self.seekPoints[i + 1][0]
+        if hasattr(os, "pread"):
+            blob = os.pread(self.file.fileno(), stop - start, start)
+        else:
+            self.file.seek(start)
+            blob = self.file.read(stop - start)
+        decompressor = newDecompressor(self.kind)
+        data = decompressor.decompress(blob)
+
+        self.cache[i] = data
+        if len(self.cache) > MEMBER_CACHE:
+            self.cache.popitem(last=False)
+        return data
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("MemberData only supports slices")
+        start, stop, _ = key.indices(len(self))
+        parts = []
+        i = bisect.bisect_right(self.plainStarts, start) - 1
+        while start < stop and i < len(self.seekPoints) - 1:
+            base = self.plainStarts[i]
+            data = self.member(i)
+            parts.append(data[start - base:stop - base])
+            start = max(start, base + len(data))
+            i += 1
+        return b"".join(parts)
+
+    def close(self):
+        self.file.close()
+
+
+def writeCompressed(filename, kind, chunks, memberSize=MEMBER_SIZE):
+    # Compress the chunks into filename as a series of members, each ending
+    # once it holds memberSize plain bytes. Readers see one stream, we get a
+    # seek point at every member start. Returns the seek points.
+    seekPoints = [(0, 0)]
+    written = plain = inMember = 0
+    compressor = newCompressor(kind)
+    with open(filename, "wb") as file:
+        for chunk in chunks:
+            if inMember >= memberSize:
+                data = compressor.flush()
+                file.write(data)
+                written += len(data)
+                seekPoints.append((written, plain))
+                compressor = newCompressor(kind)
+                inMember = 0
+            data = compressor.compress(chunk)
+            file.write(data)
+            written += len(data)
+            plain += len(chunk)
+            inMember += len(chunk)
+        data = compressor.flush()
+        file.write(data)
+        written += len(data)
+    seekPoints.append((written, plain))
+    return seekPoints
@@ -0,0 +1,191 @@
+import codecs
+from Clipboard import BLOCK, copySelection, ordered
+
+# index lines whose counts are kept together, so a big range of untouched
+# lines adds up cached blocks instead of reading its bytes again
+BLOCK_LINES = 4096
+# bytes counted per step of the background scan
+SCAN_BYTES = 1024 * 1024
+# every byte mapped to space or not, words start where a space is followed
+# by anything else
+SPACES = bytes(0x20 if byte in b" \t\n\r\x0b\x0c" else 0x78 for byte in range(256))
+# bytes continuing a utf-8 character
+CONTINUATION = bytes(range(0x80, 0xC0))
+
+
+def countWords(data):
+    marked = data.translate(SPACES)
+    return marked.count(b" x") + marked.startswith(b"x")
+
+
+def countText(lines, encoding):
+    # (words, chars, bytes) of lines of text, line endings left out
+    if not lines:
+        return 0, 0, 0
+    text = "\n".join(lines)
+    data = text.encode(encoding, "surrogateescape")
+    endings = len(lines) - 1
+    return countWords(data), len(text) - endings, len(data) - endings
+
+
+class DocumentStats:
+    # Words, characters and bytes of a buffer, kept up to date from the
+    # lines every edit replaces and the lines it puts in, so the status bar
+    # never reads the whole buffer. Like the completion WordIndex, lines
+    # below scanned are counted by the background scan and edits there are
+    # left to it. Runs of untouched lines are counted from the bytes of
+    # the index, whole blocks of them are cached by block number.
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.words = self.chars = self.bytes = 0
+        # lines above this one are counted
+        self.scanned = 0
+        # (words, chars, bytes) of whole blocks of the index below
+        self.index = None
+        self.blocks = {}
+        self.utf8 = False
+
+    def done(self):
+        return self.scanned >= self.buffer.lineCount()
+
+    def reset(self):
+        # the index was replaced by other lines, everything is counted again
+        self.words = self.chars = self.bytes = 0
+        self.scanned = 0
+        self.index = None
+
+    def add(self, counts, sign=1):
+        words, chars, size = counts
+        self.words += sign * words
+        self.chars += sign * chars
+        self.bytes += sign * size
+
+    def totals(self):
+        # (lines, words, chars, bytes), bytes with the line endings as saved
+        buffer = self.buffer
+        endings = buffer.lineCount() - 1 + buffer.endsWithNewline()
+        return buffer.lineCount(), self.words, self.chars, self.bytes + endings * len(buffer.newline)
+
+    def scanMore(self, size=SCAN_BYTES):
+        # count lines after scanned until about size bytes were read,
+        # returns True while there are more
+        buffer = self.buffer
+        stop = self.scanned
+        read = 0
+        while read < size and stop < buffer.lineCount():
+            i, start = buffer.locate(stop)
+            piece = buffer.pieces[i]
+            if isinstance(piece, tuple):
+                # to the end of the block, or the piece
+                first = piece[0] + stop - start
+                last = min((first // BLOCK_LINES + 1) * BLOCK_LINES, piece[1])
+                begin, end = self.span(first, last)
+                read += end - begin
+                stop += last - first
+            else:
+                read += sum(len(line) for line in piece[stop - start:])
+                stop = start + len(piece)
+        self.add(self.countPieces(buffer.copyPieces(self.scanned, stop)))
+        self.scanned = stop
+        return not self.done()
+
+    def replaced(self, start, stop, pieces):
+        # Lines [start, stop) of the buffer are about to become pieces like
+        # those of TextBuffer.copyPieces. Only what the scan already counted
+        # is updated.
+        if start >= self.scanned:
+            return
+        counted = min(stop, self.scanned)
+        self.add(self.countPieces(self.buffer.copyPieces(start, counted)), -1)
+        self.add(self.countPieces(pieces))
+        added = sum(self.buffer.pieceLength(piece) for piece in pieces)
+        if counted == stop:
+            self.scanned += added - (stop - start)
+        else:
+            # the edit took lines the scan had not reached yet, they are
+            # counted as part of the new lines
+            self.scanned = start + added
+
+    def rescanFrom(self, line):
+        # the lines from line on are about to change under the buffer, like
+        # the last line of a growing file, they are left to the scan again
+        if line < self.scanned:
+            self.add(self.countPieces(self.buffer.copyPieces(line, self.scanned)), -1)
+            self.scanned = line
+
+    def countSelection(self, mode, anchor, cursor):
+        # (lines, words, chars) of a selection, None while blocks it covers
+        # are not counted yet, every call counts a few more of them. A block
+        # selection too tall to cut out on a key press only has its lines.
+        start, end = ordered(anchor, cursor)
+        lines = end[0] - start[0] + 1
+        if mode == BLOCK and lines > BLOCK_LINES:
+            return lines, None, None
+        counts = self.countPieces(copySelection(self.buffer, mode, anchor, cursor).pieces, budget=[SCAN_BYTES])
+        return None if counts is None else (lines, counts[0], counts[1])
+
+    def countPieces(self, pieces, budget=None):
+        # (words, chars, bytes) of pieces. With a budget, [bytes] of whole
+        # blocks that may be counted, None when they were not enough.
+        total = [0, 0, 0]
+        for piece in pieces:
+            if isinstance(piece, tuple):
+                counts = self.countRun(piece[0], piece[1], budget)
+                if counts is None:
+                    return None
+            else:
+                counts = countText(piece, self.buffer.encoding)
+            for i, count in enumerate(counts):
+                total[i] += count
+        return tuple(total)
+
+    def countRun(self, start, stop, budget=None):
+        # lines [start, stop) of the index, a block at a time
+        index = self.buffer.index
+        if index is not self.index:
+            # a saved file is a new index, blocks of the old one are no use
+            self.index = index
+            self.blocks = {}
+            self.utf8 = codecs.lookup(self.buffer.encoding).name == "utf-8"
+        # the last line of the index can still grow, its block is not kept
+        complete = index.lineCount() - 1
+        total = [0, 0, 0]
+        line = start
+        while line < stop:
+            block = line // BLOCK_LINES
+            first, last = block * BLOCK_LINES, (block + 1) * BLOCK_LINES
+            if line == first and last <= stop and last <= complete:
+                counts = self.blocks.get(block)
+                if counts is None:
+                    if budget is not None:
+                        begin, end = self.span(first, last)
+                        budget[0] -= end - begin
+                        if budget[0] < 0:
+                            return None
+                    counts = self.blocks[block] = self.countRegion(first, last)
+            else:
+                last = min(last, stop)
+                counts = self.countRegion(line, last)
+            for i, count in enumerate(counts):
+                total[i] += count
+            line = last
+        return tuple(total)
+
+    def span(self, start, stop):
+        # bytes of index lines [start, stop), line endings included
+        index = self.buffer.index
+        end = index.starts[stop] if stop < len(index.starts) else index.indexed
+        return index.starts[start], end
+
+    def countRegion(self, start, stop):
+        # (words, chars, bytes) of index lines [start, stop) from their bytes
+        begin, end = self.span(start, stop)
+        data = self.buffer.index.data[begin:end]
+        # line endings are not counted, like the text of the lines, and a
+        # last line without a newline drops its carriage return as well
+        endings = data.count(b"\n") + data.count(b"\r\n") + data.endswith(b"\r")
+        if self.utf8:
+            chars = len(data.translate(None, CONTINUATION))
+        else:
+            chars = len(data.decode(self.buffer.encoding, "surrogateescape"))
+        return countWords(data), chars - endings, len(data) - endings
@@ -0,0 +1,143 @@
+import json
+import os
+import select
+import signal
+import socket
+import stat
+import struct
+import sys
+import tempfile
+
+# every message is a kind byte and the length of the data after it
+HEADER = struct.Struct(">cI")
+# client to server: HELLO first, then KEYS as typed and SIZE after a resize
+HELLO = b"H"
+KEYS = b"K"
+SIZE = b"S"
+# server to client: FRAME bytes for the terminal, EXIT when the editor is done
+FRAME = b"F"
+EXIT = b"X"
+READ_CHUNK = 64 * 1024
+
+
+def socketDirectory():
+    # A directory only this user can get into, so no one else can put a
+    # socket where clients look for the server. The runtime directory is
+    # one, otherwise one of our own is made in the temp directory.
+    directory = os.environ.get("XDG_RUNTIME_DIR")
+    if not directory:
+        directory = os.path.join(tempfile.gettempdir(), f"pyedit-{os.getuid()}")
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{directory} is not a private directory of this user")
+    return directory
+
+
+def socketPath():
+    # one server per user
+    return os.path.join(socketDirectory(), f"pyedit-{os.getuid()}.sock")
+
+
+def ownServer(client, path):
+    # the socket and the process behind it are this user's, anything else
+    # would get every key typed and write to the terminal
+    if os.stat(path).st_uid != os.getuid():
+        return False
+    if hasattr(socket, "SO_PEERCRED"):
+        credentials = client.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        pid, uid, gid = struct.unpack("3i", credentials)
+        return uid == os.getuid()
+    return True
+
+
+def pack(kind, data):
+    return HEADER.pack(kind, len(data)) + data
+
+
+def unpack(data):
+    # (messages, rest) for the complete messages at the start of data
+    messages = []
+    offset = 0
+    while len(data) - offset >= HEADER.size:
+        kind, length = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + length
+        if end > len(data):
+            break
+        messages.append((kind, data[offset + HEADER.size:end]))
+        offset = end
+    return messages, data[offset:]
+
+
+def connect(path=None):
+    # a socket to a running server of this user, None when there is none
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        path = path or socketPath()
+        client.connect(path)
+        if not ownServer(client, path):
+            raise PermissionError(f"{path} belongs to another user")
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def attach(client, options):
+    # Run the terminal for an editor living in the server. Keys are passed
+    # on as they come, frames are written as they come, nothing else happens
+    # here, so starting costs a connect instead of loading the editor.
+    import termios
+    import tty
+    from TUI import detect_synchronized_output
+
+    fd = sys.stdin.fileno()
+    output = sys.stdout.buffer
+    oldSettings = termios.tcgetattr(fd)
+    # the window size arrives through a pipe, select wakes up for it
+    wakeRead, wakeWrite = os.pipe()
+    os.set_blocking(wakeWrite, False)
+    signal.set_wakeup_fd(wakeWrite)
+    signal.signal(signal.SIGWINCH, lambda number, frame: None)
+    code = 0
+    done = False
+    try:
+        tty.setraw(fd)
+        # the terminal answers this one, the server cannot ask it
+        options["sync"] = detect_synchronized_output(fd, sys.stdout)
+        options["size"] = list(os.get_terminal_size())
+        client.sendall(pack(HELLO, json.dumps(options).encode()))
+        pending = b""
+        while not done:
+            ready, _, _ = select.select([fd, client, wakeRead], [], [])
+            if wakeRead in ready:
+                os.read(wakeRead, 64)
+                client.sendall(pack(SIZE, json.dumps(list(os.get_terminal_size())).encode()))
+            if fd in ready:
+                client.sendall(pack(KEYS, os.read(fd, READ_CHUNK)))
+            if client in ready:
+                data = client.recv(READ_CHUNK)
+                if not data:
+                    break
+                messages, pending = unpack(pending + data)
+                for kind, data in messages:
+                    if kind == FRAME:
+                        output.write(data)
+                    elif kind == EXIT:
+                        code = int(data or b"0")
+                        done = True
+                output.flush()
+    except (BrokenPipeError, ConnectionResetError):
+        code = 1
+    finally:
+        if not done:
+            # the server went away without putting the terminal back
+            output.write(b"\033[?25h\033[?1049l")
+            output.flush()
+        signal.set_wakeup_fd(-1)
+        termios.tcsetattr(fd, termios.TCSADRAIN, oldSettings)
+        client.close()
+    return code
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+
+import pyEdit
+from BufferManager import MEMORY_LIMIT, BufferManager
+from EditorClient import EXIT, FRAME, HEADER, HELLO, KEYS, SIZE, pack, socketPath
+from SessionCache import SessionCache
+from SplitView import leaves
+from TUI import UnixTUI
+
+
+class ClientOutput:
+    # stands in for sys.stdout, every write is one frame message
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, text):
+        if not self.writer.is_closing():
+            self.writer.write(pack(FRAME, text.encode("utf-8", "surrogateescape")))
+
+    def flush(self):
+        pass
+
+
+class RemoteTUI(UnixTUI):
+    # A UnixTUI drawing for an attached client. The compositor already cuts
+    # every frame down to the rows that changed, those go over the socket,
+    # and keys come from a pipe the connection feeds. The client's terminal
+    # is put in raw mode and asked about its features at the client's end.
+    def __init__(self, writer, input_fd, size, sync):
+        self.size = os.terminal_size(size)
+        self.client_sync = sync
+        super().__init__(input_fd=input_fd, output=ClientOutput(writer))
+
+    def terminal_size(self):
+        return self.size
+
+    def enable_raw_mode(self):
+        pass
+
+    def restore_terminal(self):
+        pass
+
+    def detect_synchronized_output(self, timeout=0.2):
+        return self.client_sync
+
+
+class EditorServer:
+    # Holds the buffers, their indexes and caches for every client, so
+    # opening a file that is loaded already only costs drawing it. Each
+    # client gets an editor of its own with its own views and cursor.
+    def __init__(self, path=None, memoryLimit=None):
+        self.path = path or socketPath()
+        self.buffers = BufferManager(memoryLimit=MEMORY_LIMIT if memoryLimit is None else memoryLimit, sessions=SessionCache())
+        # a compressed file streams to the clients attached when its lines
+        # arrive, not to the one that opened it
+        self.buffers.onStream = lambda document, buffer: pyEdit.pyEdit.startLoading(self.buffers, document, buffer, lambda: self.editors)
+        self.editors = []
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            # a socket nobody listens on is left from a server that died,
+            # a running server keeps its socket and its clients
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except ConnectionRefusedError:
+                os.unlink(self.path)
+            else:
+                raise FileExistsError(f"another server is listening on {self.path}")
+            finally:
+                probe.close()
+        # the socket is made private, there is no moment anyone else can connect
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.attach, path=self.path)
+        finally:
+            os.umask(umask)
+        print(f"pyedit server listening on {self.path}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def attach(self, reader, writer):
+        try:
+            kind, data = await self.readMessage(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        if kind != HELLO:
+            writer.close()
+            return
+        options = json.loads(data)
+        keysRead, keysWrite = os.pipe()
+        editor = self.newEditor(options)
+        code = 0
+        try:
+            editor.start(RemoteTUI(writer, keysRead, options["size"], options.get("sync", False)))
+        except Exception as error:
+            print(f"pyedit client failed: {error!r}", file=sys.stderr)
+            writer.write(pack(EXIT, b"1"))
+            writer.close()
+            os.close(keysRead)
+            os.close(keysWrite)
+            return
+        self.editors.append(editor)
+        forwarding = asyncio.ensure_future(self.forwardInput(reader, editor, keysWrite))
+        running = asyncio.ensure_future(self.run(editor))
+        try:
+            # the editor quits, or the client goes away
+            await asyncio.wait([forwarding, running], return_when=asyncio.FIRST_COMPLETED)
+            if running.done() and running.exception() is not None:
+                raise running.exception()
+        except Exception as error:
+            print(f"pyedit client failed: {error!r}", file=sys.stderr)
+            code = 1
+        finally:
+            forwarding.cancel()
+            running.cancel()
+            self.editors.remove(editor)
+            editor.finish()
+            if not writer.is_closing():
+                writer.write(pack(EXIT, str(code).encode()))
+                writer.close()
+            os.close(keysRead)
+            os.close(keysWrite)
+
+    async def run(self, editor):
+        try:
+            await editor.main()
+        except KeyboardInterrupt:
+            # control c quits this client, not the server
+            pass
+
+    async def readMessage(self, reader):
+        kind, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+        return kind, await reader.readexactly(length)
+
+    async def forwardInput(self, reader, editor, keysWrite):
+        # returns when the client disconnects
+        while True:
+            try:
+                kind, data = await self.readMessage(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            if kind == KEYS:
+                os.write(keysWrite, data)
+            elif kind == SIZE:
+                editor.tui.size = os.terminal_size(json.loads(data))
+                editor.render()
+
+    def newEditor(self, options):
+        # like main.py does for a terminal of its own
+        editor = pyEdit.pyEdit(buffers=self.buffers)
+        editor.shared = True
+        editor.cwd = options.get("cwd")
+        editor.readOnly = options.get("readonly", False)
+        editor.large = options.get("large", False)
+        editor.follow = options.get("follow", False)
+        editor.afterKey = self.redrawOthers
+        editor.afterReload = self.rebindOthers
+        if options.get("file"):
+            editor.open(options["file"])
+            editor.startLine = options.get("line")
+        return editor
+
+    def redrawOthers(self, editor):
+        # other clients showing the document see the edit
+        for other in self.editors:
+            if other is editor or other.replaying is not None:
+                continue
+            shown = [view for view in leaves(other.layoutRoot) if view.document is editor.document]
+            if not shown:
+                continue
+            for view in shown:
+                view.damaged = None
+            if other.document is editor.document:
+                other.moveToLine(other.pos[1], forceRender=True)
+            else:
+                other.renderStatus()
+
+    def rebindOthers(self, editor, document):
+        # the document has a new buffer, the old one is closed
+        for other in self.editors:
+            if other is not editor:
+                other.bufferReplaced(document)
+
+
+def main(path=None, memoryLimit=None):
+    try:
+        server = EditorServer(path, memoryLimit)
+    except PermissionError as error:
+        print(f"pyedit server not started: {error}", file=sys.stderr)
+        return
+    try:
+        asyncio.get_event_loop().run_until_complete(server.serve())
+    except FileExistsError as error:
+        print(f"pyedit server not started: {error}", file=sys.stderr)
+    except KeyboardInterrupt:
+        # the loop stopped without finishing serve
+        if os.path.exists(server.path):
+            os.unlink(server.path)
+        unsaved = server.buffers.modified()
+        if unsaved:
+            print(f"pyedit server stopped, unsaved changes lost in {len(unsaved)} buffer(s)", file=sys.stderr)
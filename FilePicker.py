@@ -0,0 +1,176 @@
+import hashlib
+import heapq
+import json
+import os
+import threading
+
+# directories that are never worth listing
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv", ".tox", ".mypy_cache", ".pytest_cache"}
+# files handed to the picker at a time while walking
+BATCH_SIZE = 2000
+# candidates matched per step, so typing stays responsive on huge trees
+MATCH_STEP = 20000
+
+
+def cacheDir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pyedit")
+
+
+class FileIndex:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        # relative paths of every file found so far, only ever appended to
+        self.files = []
+        self.done = False
+        self.lock = threading.Lock()
+        self.cachePath = os.path.join(cacheDir(), "files-" + hashlib.sha1(self.root.encode()).hexdigest()[:16] + ".json")
+        self.thread = threading.Thread(target=self.walk, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def loadCache(self):
+        # {relative dir: [mtime_ns, [file names], [dir names]]}
+        try:
+            with open(self.cachePath, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def saveCache(self, dirs):
+        try:
+            os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+            tempName = self.cachePath + ".tmp"
+            with open(tempName, "w", encoding="utf-8") as file:
+                json.dump(dirs, file)
+            os.replace(tempName, self.cachePath)
+        except OSError:
+            pass
+
+    def scan(self, path):
+        files, dirs = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in SKIP_DIRS:
+                                dirs.append(entry.name)
+                        elif entry.is_file():
+                            files.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return files, dirs
+
+    def walk(self):
+        # Runs on its own thread. A directory whose mtime matches the cache
+        # reuses the cached listing, so only changed directories are scanned.
+        cached = self.loadCache()
+        seen = {}
+        batch = []
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            path = os.path.join(self.root, rel) if rel else self.root
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+
+            entry = cached.get(rel)
+            if entry is not None and entry[0] == mtime:
+                files, dirs = entry[1], entry[2]
+            else:
+                files, dirs = self.scan(path)
+            seen[rel] = [mtime, files, dirs]
+
+            for name in files:
+                batch.append(os.path.join(rel, name) if rel else name)
+            if len(batch) >= BATCH_SIZE:
+                self.publish(batch)
+                batch = []
+            for name in dirs:
+                stack.append(os.path.join(rel, name) if rel else name)
+
+        self.publish(batch)
+        self.done = True
+        if seen != cached:
+            self.saveCache(seen)
+
+    def publish(self, batch):
+        with self.lock:
+            self.files.extend(batch)
+
+
+def fuzzyScore(query, path):
+    # None when the query is not a subsequence of the path, otherwise higher
+    # is better: consecutive characters and matches in the file name count more
+    lowered = path.lower()
+    nameStart = lowered.rfind(os.sep) + 1
+    score = 0
+    position = -1
+    for char in query:
+        found = lowered.find(char, position + 1)
+        if found == -1:
+            return None
+        if found == position + 1:
+            score += 3
+        if found >= nameStart:
+            score += 2
+        position = found
+    # shorter paths win ties
+    return score - len(path) * 0.01
+
+
+class FuzzyMatcher:
+    def __init__(self, index):
+        self.index = index
+        self.query = ""
+        # (score, path) of candidates that match the query
+        self.matches = []
+        # candidates still to check from pendingFrom on, and how much of the
+        # index has been seen
+        self.pending = []
+        self.pendingFrom = 0
+        self.seen = 0
+
+    def setQuery(self, query):
+        query = query.lower()
+        if query.startswith(self.query):
+            # a longer query only narrows down the earlier matches, plus
+            # whatever was not checked yet
+            self.pending = [path for _, path in self.matches] + self.pending[self.pendingFrom:]
+        else:
+            self.pending = self.allSeen()
+        self.pendingFrom = 0
+        self.query = query
+        self.matches = []
+
+    def allSeen(self):
+        with self.index.lock:
+            return self.index.files[:self.seen]
+
+    def step(self):
+        # match a slice of the candidates, returns True while work is left
+        with self.index.lock:
+            if self.seen < len(self.index.files):
+                self.pending.extend(self.index.files[self.seen:])
+                self.seen = len(self.index.files)
+
+        work = self.pending[self.pendingFrom:self.pendingFrom + MATCH_STEP]
+        self.pendingFrom += len(work)
+        if self.pendingFrom >= len(self.pending):
+            self.pending = []
+            self.pendingFrom = 0
+
+        for path in work:
+            score = fuzzyScore(self.query, path)
+            if score is not None:
+                self.matches.append((score, path))
+        return bool(self.pending) or not self.index.done
+
+    def best(self, count):
+        return [path for _, path in heapq.nlargest(count, self.matches)]
@@ -0,0 +1,92 @@
+import bisect
+import os
+from LineIndex import LineIndex
+from TextBuffer import fileIdentity
+
+# how often open files are checked for changes by other programs
+POLL_INTERVAL = 1.0
+# bytes compared at a time when looking for the changed part of a file
+BLOCK_SIZE = 64 * 1024
+
+
+def matchingPrefix(a, b):
+    # length of the common start of two blocks, found by halving
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def changedRegion(old, new):
+    # (prefix, oldEnd, newEnd) with old[:prefix] == new[:prefix] and
+    # old[oldEnd:] == new[newEnd:], compared a block at a time from both ends
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit:
+        stop = min(prefix + BLOCK_SIZE, limit)
+        a, b = old[prefix:stop], new[prefix:stop]
+        if a != b:
+            prefix += matchingPrefix(a, b)
+            break
+        prefix = stop
+
+    # the common end may not reach into the common start
+    limit -= prefix
+    suffix = 0
+    while suffix < limit:
+        step = min(BLOCK_SIZE, limit - suffix)
+        a = old[len(old) - suffix - step:len(old) - suffix]
+        b = new[len(new) - suffix - step:len(new) - suffix]
+        if a != b:
+            suffix += matchingPrefix(a[::-1], b[::-1])
+            break
+        suffix += step
+    return prefix, len(old) - suffix, len(new) - suffix
+
+
+def changedLines(oldIndex, newIndex, prefix, oldEnd, newEnd):
+    # Lines first..stop of the old index became first..newStop of the new
+    # one, every line outside of them has the same bytes in both.
+    oldCount, newCount = oldIndex.lineCount(), newIndex.lineCount()
+    first = min(bisect.bisect_right(oldIndex.starts, prefix) - 1, oldCount)
+    stop = max(min(bisect.bisect_left(oldIndex.starts, oldEnd), oldCount), first)
+    newStop = newCount - (oldCount - stop)
+    if stop < oldCount:
+        # the unchanged lines after the region have to start at the same
+        # place in the new content, otherwise they run to the end
+        start = oldIndex.starts[stop] + newEnd - oldEnd
+        if newStop < first or newStop >= len(newIndex.starts) or newIndex.starts[newStop] != start:
+            stop, newStop = oldCount, newCount
+    return first, stop, max(newStop, first)
+
+
+def readChanges(filename, oldIndex):
+    # Runs on a worker thread. Returns ("append", identity, bytes) when the
+    # file only grew after a complete last line, or ("change", identity,
+    # index, first, stop, newStop) with the new content indexed; None when
+    # the file cannot be read.
+    old = oldIndex.data
+    try:
+        with open(filename, "rb") as file:
+            identity = fileIdentity(os.fstat(file.fileno()))
+            size = len(old)
+            if identity[0] > size and (size == 0 or old[size - 1:size] == b"\n"):
+                # growth, the end of what we have has to be unchanged
+                start = max(size - BLOCK_SIZE, 0)
+                file.seek(start)
+                if file.read(size - start) == old[start:size]:
+                    return ("append", identity, file.read(identity[0] - size))
+                file.seek(0)
+            data = bytearray(identity[0])
+            size = file.readinto(data)
+            del data[size:]
+    except OSError:
+        return None
+
+    prefix, oldEnd, newEnd = changedRegion(old, data)
+    newIndex = LineIndex(data)
+    return ("change", identity, newIndex) + changedLines(oldIndex, newIndex, prefix, oldEnd, newEnd)
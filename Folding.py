@@ -0,0 +1,134 @@
+import bisect
+
+
+def indentOf(text):
+    return len(text) - len(text.lstrip())
+
+
+def indentBlock(buffer, line, limit=1000000):
+    # [line, stop) for the lines under line that are indented deeper, blank
+    # lines inside the block included. None when nothing is indented under it.
+    # limit bounds the scan on huge files.
+    indent = indentOf(buffer.getLine(line))
+    stop = line + 1
+    end = line + 1
+    count = buffer.lineCount()
+    while end < min(count, line + limit):
+        text = buffer.getLine(end)
+        if text.strip():
+            if indentOf(text) <= indent:
+                break
+            stop = end + 1
+        end += 1
+    return (line, stop) if stop - line >= 2 else None
+
+
+class Folds:
+    # Folded line ranges [start, stop), sorted and not overlapping. The start
+    # line stays visible as one placeholder row for the whole range. Rows
+    # and lines map through bisect over the fold starts and the lines hidden
+    # before every fold, so mapping is O(log folds) whatever is folded.
+    def __init__(self):
+        self.starts = []
+        self.stops = []
+        # hiddenBefore[i] is the lines hidden by folds before fold i, with
+        # one more entry for all of them
+        self.hiddenBefore = [0]
+        # view row of every fold start
+        self.rows = []
+
+    def __bool__(self):
+        return bool(self.starts)
+
+    def rebuild(self):
+        hidden = 0
+        self.hiddenBefore = [0]
+        for start, stop in zip(self.starts, self.stops):
+            hidden += stop - start - 1
+            self.hiddenBefore.append(hidden)
+        self.rows = [start - hidden for start, hidden in zip(self.starts, self.hiddenBefore)]
+
+    def foldAt(self, line):
+        # index of the fold holding the line, None when it is not folded
+        i = bisect.bisect_right(self.starts, line) - 1
+        if i >= 0 and line < self.stops[i]:
+            return i
+        return None
+
+    def hiddenLines(self, line):
+        # lines hidden under a fold start, 0 for any other line
+        i = self.foldAt(line)
+        if i is None or self.starts[i] != line:
+            return 0
+        return self.stops[i] - line - 1
+
+    def fold(self, start, stop):
+        # folds inside the new one, or crossing it, become part of it
+        if stop - start < 2:
+            return
+        first = bisect.bisect_right(self.stops, start)
+        last = bisect.bisect_left(self.starts, stop)
+        if first < last:
+            start = min(start, self.starts[first])
+            stop = max(stop, self.stops[last - 1])
+        self.starts[first:last] = [start]
+        self.stops[first:last] = [stop]
+        self.rebuild()
+
+    def unfold(self, line):
+        # opens the fold holding the line, returns False when there is none
+        i = self.foldAt(line)
+        if i is None:
+            return False
+        del self.starts[i]
+        del self.stops[i]
+        self.rebuild()
+        return True
+
+    def clear(self):
+        self.__init__()
+
+    def rowOf(self, line):
+        # view row of a line, a folded line is on the row of its fold
+        i = bisect.bisect_right(self.starts, line) - 1
+        if i >= 0 and line < self.stops[i]:
+            return self.rows[i]
+        return line - self.hiddenBefore[i + 1]
+
+    def lineAt(self, row):
+        # the line shown on a row
+        i = bisect.bisect_right(self.rows, row) - 1
+        if i < 0:
+            return row
+        if row == self.rows[i]:
+            return self.starts[i]
+        return row + self.hiddenBefore[i + 1]
+
+    def rowCount(self, lineCount):
+        return lineCount - self.hiddenBefore[-1]
+
+    def replaced(self, start, stop, count):
+        # Lines [start, stop) of the buffer were replaced by count lines.
+        # Folds after them move, a fold with the change inside its hidden
+        # lines grows or shrinks, and a fold whose start line was split or
+        # joined, or whose edge was crossed, opens.
+        if not self.starts:
+            return
+        delta = count - (stop - start)
+        # folds ending before the change stay as they are
+        first = bisect.bisect_right(self.stops, start)
+        starts, stops = self.starts[:first], self.stops[:first]
+        for foldStart, foldStop in zip(self.starts[first:], self.stops[first:]):
+            if foldStart >= stop:
+                starts.append(foldStart + delta)
+                stops.append(foldStop + delta)
+            elif start == foldStart and stop == start + 1 and count == 1:
+                # only the text of the start line changed
+                starts.append(foldStart)
+                stops.append(foldStop)
+            elif start > foldStart and stop <= foldStop:
+                if foldStop + delta - foldStart >= 2:
+                    starts.append(foldStart)
+                    stops.append(foldStop + delta)
+        self.starts, self.stops = starts, stops
+        self.rebuild()
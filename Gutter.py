@@ -0,0 +1,97 @@
+
+class Gutter:
+    def __init__(self, minDigits=2):
+        self.minDigits = minDigits
+        self.digits = 0
+        self.width = 0
+
+        # gutter strings by line number, valid for the current digit count
+        self.cache = {}
+        # rendered rows for the visible range
+        self.rows = []
+        self.firstLine = -1
+        self.height = 0
+        self.lineCount = 0
+        # first line whose row may have shifted since the last update
+        self.changedFrom = None
+        # DiskDiff whose marks go in the separating column, and the
+        # generation of them on the rows
+        self.marks = None
+        self.marksGeneration = None
+
+    def widthFor(self, lineCount):
+        # digits of the highest line number plus a separating space
+        return max(len(str(lineCount)), self.minDigits) + 1
+
+    def linesChanged(self, fromLine):
+        # a line was inserted or deleted at fromLine, rows below it shift
+        if self.changedFrom is None or fromLine < self.changedFrom:
+            self.changedFrom = fromLine
+
+    def label(self, line):
+        label = self.cache.get(line)
+        if label is None:
+            label = f"{line + 1:>{self.digits}} "
+            self.cache[line] = label
+        if self.marks is not None and self.marks.marks:
+            mark = self.marks.markAt(line)
+            if mark != " ":
+                return label[:-1] + mark
+        return label
+
+    def rowFor(self, line):
+        if line < self.lineCount:
+            return self.label(line)
+        return " " * self.width
+
+    def update(self, lineCount, firstLine, height, lines=None, marks=None):
+        # lines is the line on every row when some are folded away, marks a
+        # DiskDiff of the buffer
+        digits = self.widthFor(lineCount) - 1
+        fullRedraw = lines is not None
+
+        generation = marks.generation if marks is not None else None
+        # an edit changes marks on rows it did not shift as well, those rows
+        # are looked at again but only drawn when their mark changed
+        marksChanged = marks is self.marks and generation != self.marksGeneration
+        if marks is not self.marks:
+            fullRedraw = True
+        self.marks = marks
+        self.marksGeneration = generation
+
+        if digits != self.digits:
+            # crossed a digit boundary, every label changes width
+            self.digits = digits
+            self.width = digits + 1
+            self.cache.clear()
+            fullRedraw = True
+        if firstLine != self.firstLine or height != self.height:
+            fullRedraw = True
+
+        if lineCount != self.lineCount:
+            # the buffer grew or shrank under us, like another client's
+            # buffer being indexed, rows past the shorter end change
+            self.linesChanged(min(lineCount, self.lineCount))
+        self.lineCount = lineCount
+
+        if lines is not None:
+            # the next update without folds starts over as well
+            self.firstLine = -1
+            self.height = height
+            self.rows = [self.label(line) for line in lines] + [" " * self.width] * (height - len(lines))
+        elif fullRedraw:
+            self.firstLine = firstLine
+            self.height = height
+            self.rows = [self.rowFor(firstLine + i) for i in range(height)]
+        elif self.changedFrom is not None or marksChanged:
+            # only the rows from the edited line downwards can have shifted
+            shifted = height if self.changedFrom is None else min(max(self.changedFrom - firstLine, 0), height)
+            if marksChanged:
+                for i in range(min(shifted, lineCount - firstLine)):
+                    if self.rows[i][-1] != marks.markAt(firstLine + i):
+                        self.rows[i] = self.label(firstLine + i)
+            for i in range(shifted, height):
+                self.rows[i] = self.rowFor(firstLine + i)
+
+        self.changedFrom = None
+        return self.rows
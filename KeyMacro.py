@@ -0,0 +1,49 @@
+# control k starts and stops recording, control t replays
+RECORD_KEY = "\x0b"
+REPLAY_KEY = "\x14"
+# runs of one replay at most, however many were asked for
+MAX_RUNS = 1000000
+# replayed keys between two looks at the terminal, a key typed stops the replay
+CHECK_KEYS = 256
+
+
+class KeyMacro:
+    def __init__(self):
+        # keys of the last finished recording
+        self.keys = []
+        # keys typed since recording started, None when not recording
+        self.recording = None
+        # how many times the keys went through in the last replay
+        self.runs = 0
+
+    def start(self):
+        self.recording = []
+
+    def record(self, key):
+        # every key read while recording, answers to prompts included, so
+        # a replay goes down the same paths
+        if self.recording is not None and key not in (RECORD_KEY, REPLAY_KEY):
+            self.recording.append(key)
+
+    def stop(self):
+        # an empty recording keeps the previous macro
+        keys, self.recording = self.recording, None
+        if keys:
+            self.keys = keys
+        return bool(keys)
+
+    def replay(self, times, linesBelow):
+        # The keys times over, up to MAX_RUNS. With times None they go on
+        # while every run leaves fewer lines below the cursor, so a macro
+        # that moves down stops at the end of the buffer, and one that adds
+        # lines as fast as it moves down stops instead of running forever.
+        # The generator resumes only when the next key is wanted, so
+        # linesBelow is read after the last key of a run was done.
+        self.runs = 0
+        limit = MAX_RUNS if times is None else min(times, MAX_RUNS)
+        while self.runs < limit:
+            below = linesBelow()
+            yield from self.keys
+            self.runs += 1
+            if times is None and linesBelow() >= below:
+                break
@@ -0,0 +1,204 @@
+import bisect
+
+# marks in the gutter: lines added, lines changed, lines removed below
+ADDED = "+"
+CHANGED = "~"
+REMOVED = "_"
+# regions with more lines than this are marked changed without reading them
+MAX_REGION = 20000
+# edit steps looked for before a region counts as changed as a whole
+MAX_EDITS = 256
+
+
+def middleSnake(a, aLo, aHi, b, bLo, bHi, limit):
+    # The snake (x, y, u, v) in the middle of a shortest edit script of
+    # a[aLo:aHi] and b[bLo:bHi], found by running Myers' search from both
+    # ends until the paths overlap. None after limit steps from each end.
+    n, m = aHi - aLo, bHi - bLo
+    delta = n - m
+    odd = delta & 1
+    offset = n + m + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+    for d in range(min((n + m + 1) // 2, limit) + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start = x
+            while x < n and y < m and a[aLo + x] == b[bLo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and delta - d < k < delta + d and x + backward[offset + delta - k] >= n:
+                return aLo + start, bLo + start - k, aLo + x, bLo + y
+        # backwards x and y count from the ends
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start = x
+            while x < n and y < m and a[aHi - 1 - x] == b[bHi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return aHi - x, bHi - y, aHi - start, bHi - start + k
+    return None
+
+
+def findBlocks(a, aLo, aHi, b, bLo, bHi, limit, blocks):
+    # adds the (aStart, bStart, length) blocks the two have in common,
+    # False when a part needs more than limit steps
+    start = aLo
+    while aLo < aHi and bLo < bHi and a[aLo] == b[bLo]:
+        aLo += 1
+        bLo += 1
+    if aLo > start:
+        blocks.append((start, bLo - (aLo - start), aLo - start))
+    end = aHi
+    while aHi > aLo and bHi > bLo and a[aHi - 1] == b[bHi - 1]:
+        aHi -= 1
+        bHi -= 1
+    if aLo < aHi and bLo < bHi:
+        # both ends differ, so the snake splits it in two smaller parts
+        snake = middleSnake(a, aLo, aHi, b, bLo, bHi, limit)
+        if snake is None:
+            return False
+        x, y, u, v = snake
+        if not findBlocks(a, aLo, x, b, bLo, y, limit, blocks):
+            return False
+        if u > x:
+            blocks.append((x, y, u - x))
+        if not findBlocks(a, u, aHi, b, v, bHi, limit, blocks):
+            return False
+    if end > aHi:
+        blocks.append((aHi, bHi, end - aHi))
+    return True
+
+
+def changedRanges(a, b, limit=MAX_EDITS):
+    # (aStart, aStop, bStart, bStop) where two sequences of lines differ, in
+    # linear space. Lines are compared by a number per distinct text, so
+    # every comparison is between two ints.
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a]
+    b = [ids.setdefault(line, len(ids)) for line in b]
+    blocks = []
+    if not findBlocks(a, 0, len(a), b, 0, len(b), limit, blocks):
+        return [(0, len(a), 0, len(b))]
+    ranges = []
+    x = y = 0
+    for aStart, bStart, length in blocks + [(len(a), len(b), 0)]:
+        if aStart > x or bStart > y:
+            ranges.append((x, aStart, y, bStart))
+        x, y = aStart + length, bStart + length
+    return ranges
+
+
+class DiskDiff:
+    # Lines of a buffer changed since its file was loaded or saved, for the
+    # gutter. Runs of untouched lines are lines of the file as they are, so
+    # only the edited lines between two runs are compared with the lines of
+    # the file the runs skip, and a region not edited again keeps its result.
+    def __init__(self, buffer):
+        self.buffer = buffer
+        # what the marks were worked out for
+        self.key = None
+        # marked buffer lines [start, stop) and their mark, sorted
+        self.starts = []
+        self.marks = []
+        # bumped whenever the marks change, the gutter redraws then
+        self.generation = 0
+        # changed ranges of every compared region by its lines
+        self.compared = {}
+        self.added = self.changed = self.removed = 0
+
+    def update(self):
+        buffer = self.buffer
+        key = (buffer.version, buffer.index, buffer.index.lineCount(), buffer.count)
+        if key == self.key:
+            return self
+        self.key = key
+        compared = {}
+        marks = []
+        self.added = self.changed = self.removed = 0
+        if buffer.detached:
+            # the index is not the file any more, every line counts as changed
+            marks = [(0, buffer.count, CHANGED)]
+            self.changed = buffer.count
+            regions = []
+        else:
+            regions = self.regions()
+        for oldStart, oldStop, newStart, newStop in regions:
+            for a, b, c, d in self.compare(oldStart, oldStop, newStart, newStop, compared):
+                self.mark(marks, oldStart + a, oldStart + b, newStart + c, newStart + d)
+        self.compared = compared
+        if marks != self.marks:
+            self.marks = marks
+            self.starts = [start for start, stop, mark in marks]
+            self.generation += 1
+        return self
+
+    def regions(self):
+        # (oldStart, oldStop, newStart, newStop) between runs of untouched
+        # lines, lines of the file and of the buffer. A run moved before
+        # lines it came after counts as new lines.
+        buffer = self.buffer
+        # an empty file has no lines, not one empty line
+        total = buffer.index.lineCount() if buffer.index.indexed else 0
+        old = newStart = line = 0
+        for piece in buffer.pieces:
+            length = buffer.pieceLength(piece)
+            if isinstance(piece, tuple) and piece[0] >= old:
+                if piece[0] > old or line > newStart:
+                    yield old, piece[0], newStart, line
+                old = piece[1]
+                newStart = line + length
+            line += length
+        if total > old or buffer.count > newStart:
+            yield old, max(total, old), newStart, buffer.count
+
+    def compare(self, oldStart, oldStop, newStart, newStop, compared):
+        # changed ranges of a region, counted from its start
+        n, m = oldStop - oldStart, newStop - newStart
+        if n == 0 or m == 0 or n + m > MAX_REGION:
+            return [(0, n, 0, m)]
+        buffer = self.buffer
+        new = tuple(buffer.getLines(newStart, newStop))
+        key = (oldStart, oldStop, new)
+        ranges = self.compared.get(key)
+        if ranges is None:
+            old = [buffer.decode(buffer.index.lineBytes(line)) for line in range(oldStart, oldStop)]
+            ranges = changedRanges(old, new)
+        compared[key] = ranges
+        return ranges
+
+    def mark(self, marks, oldStart, oldStop, newStart, newStop):
+        removed, added = oldStop - oldStart, newStop - newStart
+        changed = min(removed, added)
+        self.changed += changed
+        self.added += added - changed
+        self.removed += removed - changed
+        if changed:
+            marks.append((newStart, newStart + changed, CHANGED))
+        if added > changed:
+            marks.append((newStart + changed, newStop, ADDED))
+        if not added:
+            # on the line after the removed ones, or the last line
+            line = min(newStart, self.buffer.count - 1)
+            if not marks or marks[-1][1] <= line:
+                marks.append((line, line + 1, REMOVED))
+
+    def markAt(self, line):
+        i = bisect.bisect_right(self.starts, line) - 1
+        if i >= 0 and line < self.marks[i][1]:
+            return self.marks[i][2]
+        return " "
+
+    def summary(self):
+        return f"+{self.added} ~{self.changed} -{self.removed}"
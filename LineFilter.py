@@ -0,0 +1,281 @@
+import bisect
+import re
+import threading
+from array import array
+from Folding import Folds
+
+# bytes of untouched lines searched at a time, matches are published after
+# every chunk so the first ones show while the rest is searched
+SCAN_CHUNK = 1024 * 1024
+# how often the editor looks for new matches and changed sources
+POLL_INTERVAL = 0.1
+
+
+def bytesSafe(regex):
+    # Whether the pattern matches the bytes of a line exactly where it
+    # matches its text. Only ASCII patterns without classes, dots, escapes,
+    # line ends or case folding do; anything else could match part of a
+    # multibyte character, miss a whole one or see a carriage return.
+    pattern = regex.pattern
+    return pattern.isascii() and not regex.flags & re.IGNORECASE and not any(char in pattern for char in "[.\\$(")
+
+
+def parsePattern(text):
+    # /text/ is a regular expression, anything else is looked for as it is.
+    # Raises re.error for a bad expression.
+    if len(text) > 2 and text.startswith("/") and text.endswith("/"):
+        return re.compile(text[1:-1])
+    return None
+
+
+class LineFilter:
+    # The lines of a document matching a pattern, as a read only buffer.
+    # Every row is nothing but the number of a source line, the text is read
+    # through the source buffer, so no matching line is copied. A worker
+    # thread searches the bytes of untouched runs a chunk at a time, and
+    # only lines that were edited are matched as text.
+    def __init__(self, document, text):
+        self.document = document
+        self.text = text
+        self.regex = parsePattern(text)
+        # source line of every row, in order
+        self.matches = array("q")
+        self.lock = threading.Lock()
+        self.folds = Folds()
+        self.modified = False
+        self.identity = None
+        self.mappedFile = None
+        # the buffer and version searched, and the source lines it covers
+        self.searched = None
+        self.version = None
+        self.searchedTo = 0
+        # the running search checks this is still its own before publishing
+        self.token = None
+        self.done = True
+        # bumped when the rows start over, for redrawing all of them
+        self.generation = 0
+
+    @property
+    def source(self):
+        return self.document.buffer
+
+    # runs of the source index are copied and pasted as they are, see Clip
+    @property
+    def index(self):
+        return self.source.index
+
+    @property
+    def encoding(self):
+        return self.source.encoding
+
+    @property
+    def newline(self):
+        return self.source.newline
+
+    @property
+    def copies(self):
+        return self.source.copies
+
+    def lineCount(self):
+        # no matches still shows one empty row
+        return max(len(self.matches), 1)
+
+    def sourceLineCount(self):
+        return self.source.lineCount()
+
+    def sourceLine(self, row):
+        # the source line shown on a row, None when there is none
+        if row >= len(self.matches) or self.matches[row] >= self.source.lineCount():
+            return None
+        return self.matches[row]
+
+    def sourceLines(self, rows):
+        lines = []
+        for row in rows:
+            line = self.sourceLine(row)
+            if line is None:
+                break
+            lines.append(line)
+        return lines
+
+    def getLine(self, row):
+        line = self.sourceLine(row)
+        return "" if line is None else self.source.getLine(line)
+
+    def getLines(self, start, stop):
+        return [self.getLine(row) for row in range(max(start, 0), min(stop, self.lineCount()))]
+
+    def iterLines(self, start=0):
+        for row in range(start, self.lineCount()):
+            yield self.getLine(row)
+
+    def find(self, text, start=0):
+        for row, content in enumerate(self.iterLines(start), start):
+            if text in content:
+                return row
+        return None
+
+    def matchColumn(self, text):
+        # where the pattern is in a line of text, 0 when it is not
+        if self.regex is not None:
+            match = self.regex.search(text)
+            return match.start() if match else 0
+        return max(text.find(self.text), 0)
+
+    def copyPieces(self, start, stop):
+        # The rows as pieces of the source, so copied matches are runs of
+        # its index like any other copy. Neighbouring source lines join up.
+        pieces = []
+        for row in range(max(start, 0), min(stop, len(self.matches))):
+            line = self.matches[row]
+            for piece in self.source.copyPieces(line, line + 1):
+                last = pieces[-1] if pieces else None
+                if isinstance(piece, tuple) and isinstance(last, tuple) and last[1] == piece[0]:
+                    pieces[-1] = (last[0], piece[1])
+                elif isinstance(piece, list) and isinstance(last, list):
+                    last.extend(piece)
+                else:
+                    pieces.append(piece)
+        return pieces
+
+    def memoryUsage(self):
+        return self.matches.itemsize * len(self.matches)
+
+    def close(self):
+        # a running search stops at its next chunk
+        self.token = None
+
+    def refresh(self):
+        # Called on the editor's thread. Searches everything again when the
+        # source was edited or reloaded, and only the new lines when it grew
+        # at the end, once the running search is done.
+        buffer = self.source
+        if buffer is None:
+            return
+        if buffer is not self.searched or buffer.version != self.version:
+            self.token = None
+            with self.lock:
+                self.matches = array("q")
+            self.folds.clear()
+            self.generation += 1
+            self.searched = buffer
+            self.version = buffer.version
+            self.start(0)
+        elif self.done and buffer.lineCount() > self.searchedTo:
+            # the last line may have been cut short before, it is searched again
+            first = max(self.searchedTo - 1, 0)
+            with self.lock:
+                while self.matches and self.matches[-1] >= first:
+                    self.matches.pop()
+            self.start(first)
+
+    def start(self, first):
+        buffer = self.source
+        self.searchedTo = buffer.lineCount()
+        # Runs are line numbers and edited lines are copied, so the worker
+        # is not disturbed by edits made while it searches
+        pieces = buffer.copyPieces(first, self.searchedTo)
+        self.token = token = object()
+        self.done = False
+        threading.Thread(target=self.search, args=(token, buffer.index, buffer.encoding, pieces, first),
+                         daemon=True).start()
+
+    def publish(self, token, found):
+        # False once the search was stopped or replaced
+        with self.lock:
+            if self.token is not token:
+                return False
+            self.matches.extend(found)
+            return True
+
+    def search(self, token, index, encoding, pieces, line):
+        # Runs on the worker thread, line is the source line of the first piece
+        try:
+            byteRegex = needle = textRegex = None
+            try:
+                if self.regex is None:
+                    needle = self.text.encode(encoding, "surrogateescape")
+                elif bytesSafe(self.regex):
+                    byteRegex = re.compile(self.regex.pattern.encode(encoding, "surrogateescape"), re.MULTILINE)
+                else:
+                    # chunks are decoded and searched as text
+                    textRegex = re.compile(self.regex.pattern, self.regex.flags | re.MULTILINE)
+            except (UnicodeError, re.error):
+                # no untouched line can match what the encoding cannot hold
+                pass
+            for piece in pieces:
+                if isinstance(piece, tuple):
+                    if (byteRegex or needle or textRegex) and \
+                            not self.searchRun(token, index, encoding, piece, line, byteRegex or textRegex, needle):
+                        return
+                    line += piece[1] - piece[0]
+                    continue
+                if self.regex is not None:
+                    found = [line + i for i, text in enumerate(piece) if self.regex.search(text)]
+                else:
+                    found = [line + i for i, text in enumerate(piece) if self.text in text]
+                if not self.publish(token, found):
+                    return
+                line += len(piece)
+        except (ValueError, OSError):
+            # the source was closed under us, a reload searches it again
+            if self.token is token:
+                self.searched = None
+        finally:
+            if self.token is token:
+                self.done = True
+
+    def searchRun(self, token, index, encoding, piece, line, regex, needle):
+        # lines piece of the index, a chunk of whole lines at a time. A text
+        # regex gets the chunk decoded like lines are, without carriage
+        # returns before the newlines.
+        start, stop = piece
+        starts = index.starts
+        while start < stop:
+            begin = starts[start]
+            end = min(bisect.bisect_left(starts, begin + SCAN_CHUNK, start + 1, stop), stop)
+            finish = starts[end] if end < len(starts) else index.indexed
+            chunk = index.data[begin:finish]
+            if regex is not None and isinstance(regex.pattern, str):
+                chunk = chunk.decode(encoding, "surrogateescape")
+                if "\r" in chunk:
+                    chunk = chunk.replace("\r\n", "\n")
+                    if finish == index.indexed:
+                        # like decode, the last line drops it without a newline
+                        chunk = chunk.removesuffix("\r")
+            found = array("q", self.matchingLines(chunk, line, regex, needle))
+            if not self.publish(token, found):
+                return False
+            line += end - start
+            start = end
+        return True
+
+    def matchingLines(self, chunk, line, regex, needle):
+        # Every line of chunk with a match, once, line is the first one.
+        # chunk is bytes, or text for a text regex. Lines are counted by
+        # the newlines between matches, so lines without a match cost no
+        # more than the search skipping them. After the final newline is no
+        # line, an empty match there does not count.
+        newline = "\n" if isinstance(chunk, str) else b"\n"
+        limit = len(chunk) - 1 if chunk.endswith(newline) else len(chunk)
+        pos = 0
+        while pos <= limit:
+            if needle is not None:
+                found = chunk.find(needle, pos, limit)
+                if found < 0:
+                    return
+                matchEnd = found + len(needle)
+            else:
+                match = regex.search(chunk, pos, limit)
+                if match is None:
+                    return
+                found, matchEnd = match.span()
+            line += chunk.count(newline, pos, found)
+            lineEnd = chunk.find(newline, found, limit)
+            if lineEnd < 0:
+                lineEnd = limit
+            # a match running into the next line has to be found in its own
+            if matchEnd <= lineEnd or regex.search(chunk, chunk.rfind(newline, 0, found) + 1, lineEnd) is not None:
+                yield line
+            line += 1
+            pos = lineEnd + 1
@@ -0,0 +1,77 @@
+from array import array
+from itertools import accumulate
+
+# how much of the data is split at once while indexing
+INDEX_CHUNK = 16 * 1024 * 1024
+
+
+class LineIndex:
+    def __init__(self, data=None, lazy=False, starts=None, indexed=0):
+        # data can be bytes, a bytearray or an mmap, anything that slices to
+        # bytes; append needs a bytearray
+        self.data = data if data is not None else bytearray()
+        # byte offset where every line starts, starts and indexed can come
+        # from an earlier index of the same bytes so they are not scanned again
+        self.starts = starts if starts is not None else array("q", [0])
+        self.indexed = indexed if starts is not None else 0
+        # a lazy index is built a chunk at a time with indexMore
+        if not lazy:
+            self.indexFrom(self.indexed)
+
+    def indexFrom(self, start, stop=None):
+        # record the start of every line after a newline in data[start:stop]
+        length = len(self.data) if stop is None else stop
+        while start < length:
+            chunk = self.data[start:min(start + INDEX_CHUNK, length)]
+            parts = chunk.split(b"\n")
+            # lengths of the complete lines (newline included) added up give the offsets
+            lengths = map((1).__add__, map(len, parts[:-1]))
+            self.starts.extend(accumulate(lengths, initial=start))
+            # the first value is the chunk start, which is either recorded
+            # already or in the middle of a line
+            del self.starts[len(self.starts) - len(parts)]
+            start += len(chunk)
+        self.indexed = length
+
+    def indexMore(self):
+        # index the next chunk, returns True while there is more to do
+        self.indexFrom(self.indexed, min(self.indexed + INDEX_CHUNK, len(self.data)))
+        return not self.complete()
+
+    def complete(self):
+        return self.indexed >= len(self.data)
+
+    def append(self, data):
+        # new bytes at the end (a growing log file), only the new part is indexed
+        self.data += data
+        self.indexFrom(self.indexed)
+
+    def grow(self, data):
+        # the data was replaced by a longer view of the same bytes (a
+        # remapped mmap), only index the new part
+        self.data = data
+        self.indexFrom(self.indexed)
+
+    def memoryUsage(self):
+        # bytes held in memory, a mapped file is paged by the OS instead
+        held = self.starts.itemsize * len(self.starts)
+        if isinstance(self.data, (bytes, bytearray)):
+            held += len(self.data)
+        return held
+
+    def lineCount(self):
+        count = len(self.starts)
+        # a final newline ends the last line instead of starting an empty one
+        if count > 1 and self.starts[-1] == self.indexed:
+            count -= 1
+        return count
+
+    def lineSpan(self, i):
+        start = self.starts[i]
+        if i + 1 < len(self.starts):
+            return start, self.starts[i + 1] - 1
+        return start, self.indexed
+
+    def lineBytes(self, i):
+        start, end = self.lineSpan(i)
+        return self.data[start:end]
@@ -0,0 +1,200 @@
+import bisect
+import heapq
+import pickle
+import tempfile
+from itertools import count
+from LineIndex import LineIndex
+from SpooledData import SpooledData
+
+SORT = "sort"
+UNIQUE = "unique"
+REVERSE = "reverse"
+# by the letter typed at the prompt
+OPERATIONS = {"s": SORT, "u": UNIQUE, "r": REVERSE}
+# bytes of lines held in memory, above this sorted runs go to temp files and
+# the result is spooled instead of held as text
+SORT_MEMORY = 64 * 1024 * 1024
+# lines sorted at once, so the worker never holds the interpreter for long
+RUN_LINES = 50000
+# records pickled together in a run file
+BLOCK_RECORDS = 4096
+# bytes of lines read from the index at a time
+READ_CHUNK = 1024 * 1024
+# a record's size in memory besides its bytes, roughly
+RECORD_OVERHEAD = 100
+
+
+class Cancelled(Exception):
+    pass
+
+
+def piecesSize(index, pieces):
+    # bytes of the lines of pieces, without reading them
+    size = 0
+    for piece in pieces:
+        if isinstance(piece, tuple):
+            start, stop = piece
+            end = index.starts[stop] if stop < len(index.starts) else index.indexed
+            size += end - index.starts[start]
+        else:
+            size += sum(len(line) + 1 for line in piece)
+    return size
+
+
+def runLines(index, start, stop, reverse=False):
+    # the bytes of lines [start, stop) of an index, without line endings,
+    # split a chunk of whole lines at a time
+    starts = index.starts
+    chunks = []
+    first = start
+    while first < stop:
+        last = min(bisect.bisect_left(starts, starts[first] + READ_CHUNK, first + 1, stop), stop)
+        chunks.append((first, last))
+        first = last
+    for first, last in reversed(chunks) if reverse else chunks:
+        end = starts[last] if last < len(starts) else index.indexed
+        lines = index.data[starts[first]:end].split(b"\n")
+        del lines[last - first:]
+        if any(line.endswith(b"\r") for line in lines):
+            lines = [line[:-1] if line.endswith(b"\r") else line for line in lines]
+        yield from reversed(lines) if reverse else lines
+
+
+def pieceLines(index, encoding, pieces, reverse=False):
+    # the lines of pieces like those of TextBuffer.copyPieces, as bytes
+    for piece in reversed(pieces) if reverse else pieces:
+        if isinstance(piece, tuple):
+            yield from runLines(index, piece[0], piece[1], reverse)
+        else:
+            for line in reversed(piece) if reverse else piece:
+                yield line.encode(encoding, "surrogateescape")
+
+
+class RunSorter:
+    # Sorts more records than fit in memory. Records are sorted RUN_LINES
+    # at a time into runs, held in memory up to SORT_MEMORY bytes and merged
+    # into a temp file once there are more, and all runs are merged at the end.
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+        self.runs = []
+        self.held = 0
+        self.files = []
+
+    def add(self, records, size):
+        # size is the bytes the records hold
+        if self.cancelled():
+            raise Cancelled()
+        records.sort()
+        self.runs.append(records)
+        self.held += size + RECORD_OVERHEAD * len(records)
+        if self.held > SORT_MEMORY:
+            self.spill()
+
+    def addAll(self, records, sizeOf):
+        batch = []
+        size = 0
+        for record in records:
+            batch.append(record)
+            size += sizeOf(record)
+            if len(batch) >= RUN_LINES:
+                self.add(batch, size)
+                batch = []
+                size = 0
+        if batch:
+            self.add(batch, size)
+
+    def spill(self):
+        file = tempfile.TemporaryFile()
+        block = []
+        for record in heapq.merge(*self.runs):
+            block.append(record)
+            if len(block) >= BLOCK_RECORDS:
+                pickle.dump(block, file, pickle.HIGHEST_PROTOCOL)
+                block = []
+                if self.cancelled():
+                    file.close()
+                    raise Cancelled()
+        pickle.dump(block, file, pickle.HIGHEST_PROTOCOL)
+        file.seek(0)
+        self.files.append(file)
+        self.runs = []
+        self.held = 0
+
+    def readRun(self, file):
+        with file:
+            while True:
+                try:
+                    block = pickle.load(file)
+                except EOFError:
+                    return
+                if self.cancelled():
+                    raise Cancelled()
+                yield from block
+
+    def merged(self):
+        return heapq.merge(*self.runs, *[self.readRun(file) for file in self.files])
+
+
+def transform(operation, lines, cancelled):
+    # the lines after the operation, every one read only once
+    if operation == REVERSE:
+        return lines
+    if operation == SORT:
+        sorter = RunSorter(cancelled)
+        sorter.addAll(lines, len)
+        return sorter.merged()
+    return firstOccurrences(lines, cancelled)
+
+
+def firstOccurrences(lines, cancelled):
+    # Equal lines sorted next to each other with their line numbers show
+    # which one came first, those go back in their order by a second sort
+    byText = RunSorter(cancelled)
+    byText.addAll(zip(lines, count()), lambda record: len(record[0]))
+    byNumber = RunSorter(cancelled)
+    byNumber.addAll(firstOfEach(byText.merged()), lambda record: len(record[1]))
+    for number, line in byNumber.merged():
+        yield line
+
+
+def firstOfEach(records):
+    previous = None
+    for line, number in records:
+        if line != previous:
+            yield number, line
+            previous = line
+
+
+def runOperation(operation, index, encoding, pieces, before, after, newline, finalNewline, cancelled):
+    # Runs on a worker thread. Returns ("lines", lines) with the new text of
+    # the lines when it is small, or ("index", index) with the whole buffer
+    # spooled and indexed otherwise. None when cancelled.
+    try:
+        lines = transform(operation, pieceLines(index, encoding, pieces, reverse=operation == REVERSE), cancelled)
+        if piecesSize(index, pieces) <= SORT_MEMORY:
+            return "lines", [line.decode(encoding, "surrogateescape") for line in lines]
+
+        # the lines around the changed ones are copied along, so the new
+        # index holds the whole buffer
+        data = SpooledData()
+        chunk = []
+        size = 0
+        for part in (pieceLines(index, encoding, before), lines, pieceLines(index, encoding, after)):
+            for line in part:
+                chunk.append(line)
+                size += len(line) + 1
+                if size >= READ_CHUNK:
+                    # the newline before a chunk ends the last line of the one before
+                    data += (newline if len(data) else b"") + newline.join(chunk)
+                    chunk = []
+                    size = 0
+                    if cancelled():
+                        data.close()
+                        return None
+        if chunk:
+            data += (newline if len(data) else b"") + newline.join(chunk)
+        if finalNewline:
+            data += newline
+        return "index", LineIndex(data)
+    except Cancelled:
+        return None
@@ -0,0 +1,172 @@
+import re
+from itertools import groupby
+
+WORD = re.compile(r"\w+")
+
+
+class Cursor:
+    __slots__ = ("line", "char", "anchor")
+
+    def __init__(self, line, char, anchor=None):
+        self.line = line
+        self.char = char
+        # the other end of a selection on the same line, None without one
+        self.anchor = anchor
+
+    def span(self):
+        if self.anchor is None:
+            return self.char, self.char
+        return min(self.char, self.anchor), max(self.char, self.anchor)
+
+    def key(self):
+        return (self.line,) + self.span()
+
+
+class Block:
+    # Consecutive lines an edit replaces, start and stop are lines of the
+    # buffer before the edit. Cursors in it are kept as row and column
+    # counted from its end, which edits before them do not change.
+    def __init__(self, start, lines):
+        self.start = start
+        self.stop = start + 1
+        self.lines = lines
+        self.cursors = []
+
+    def place(self, cursor, row, char):
+        self.cursors.append((cursor, len(self.lines) - 1 - row, len(self.lines[row]) - char))
+
+
+def unique(cursors, keep=None):
+    # cursors that ended up in the same place become one, keep wins
+    seen = {}
+    for cursor in cursors:
+        if cursor.key() not in seen or cursor is keep:
+            seen[cursor.key()] = cursor
+    return sorted(seen.values(), key=Cursor.key)
+
+
+def applyKey(buffer, cursors, key):
+    # A typed character, enter or backspace at every cursor as one buffer
+    # transaction. Cursors go from the last to the first, so the positions
+    # of the ones still to do stay valid, and the changed lines are written
+    # with one replaceLines. Returns the changed buffer lines, whether lines
+    # were inserted or removed, and (start, old lines, new lines) of every
+    # block in the buffer before the edit.
+    blocks = []
+    block = None
+    ordered = sorted(cursors, key=Cursor.key, reverse=True)
+    for line, group in groupby(ordered, key=lambda cursor: cursor.line):
+        # a backspace at the start of the line below may have joined this
+        # line into the block already
+        if block is None or block.start != line:
+            block = Block(line, [buffer.getLine(line)])
+            blocks.append(block)
+        for cursor in group:
+            start, end = cursor.span()
+            text = block.lines[0]
+            text = text[:start] + text[end:]
+            if key == "\r":
+                block.lines[0:1] = [text[:start], text[start:]]
+                block.place(cursor, 1, 0)
+            elif key == "\x7f" and start == end and start > 0:
+                block.lines[0] = text[:start - 1] + text[start:]
+                block.place(cursor, 0, start - 1)
+            elif key == "\x7f" and start == end and block.start > 0:
+                previous = buffer.getLine(block.start - 1)
+                block.lines[0] = previous + text
+                block.start -= 1
+                block.place(cursor, 0, len(previous))
+            elif key == "\x7f":
+                # a selection is deleted, backspace at the first line is nothing
+                block.lines[0] = text
+                block.place(cursor, 0, start)
+            else:
+                block.lines[0] = text[:start] + key + text[start:]
+                block.place(cursor, 0, start + len(key))
+
+    blocks.reverse()
+    edits = [(block.start, buffer.getLines(block.start, block.stop), block.lines) for block in blocks]
+    buffer.replaceLines([(block.start, block.stop, block.lines) for block in blocks])
+
+    # where the cursors are now, lines above them may have been added or removed
+    shift = 0
+    changed = []
+    for block in blocks:
+        start = block.start + shift
+        changed.append(start)
+        for cursor, row, fromEnd in block.cursors:
+            row = len(block.lines) - 1 - row
+            cursor.line = start + row
+            cursor.char = len(block.lines[row]) - fromEnd
+            cursor.anchor = None
+        shift += len(block.lines) - (block.stop - block.start)
+    return changed, any(len(block.lines) != block.stop - block.start for block in blocks), edits
+
+
+def typeKey(buffer, line, char, key):
+    # A typed character, enter or backspace at a single cursor, the way the
+    # editor and batch macros both do it. Returns the (line, char) of the
+    # cursor after it and (start, old lines, new lines) of the edit, None
+    # when nothing changed.
+    text = buffer.getLine(line)
+    if key == "\r":
+        if char == 0:
+            # an empty line before this one, which moves down untouched
+            # and keeps its fold
+            buffer.insertLines(line, [""])
+            return (line + 1, 0), (line, [], [""])
+        buffer.setLine(line, text[:char])
+        buffer.insertLines(line + 1, [text[char:]])
+        return (line + 1, 0), (line, [text], [text[:char], text[char:]])
+    if key == "\x7f":
+        if char > 0:
+            new = text[:char - 1] + text[char:]
+            buffer.setLine(line, new)
+            return (line, char - 1), (line, [text], [new])
+        if line == 0:
+            return (line, char), None
+        # joined onto the end of the line above
+        previous = buffer.getLine(line - 1)
+        buffer.setLine(line - 1, previous + text)
+        buffer.deleteLines(line, line + 1)
+        return (line - 1, len(previous)), (line - 1, [previous, text], [previous + text])
+    new = text[:char] + key + text[char:]
+    buffer.setLine(line, new)
+    return (line, char + len(key)), (line, [text], [new])
+
+
+def moveCursors(buffer, cursors, key):
+    # arrow keys move every cursor and end the selections
+    last = buffer.lineCount() - 1
+    for cursor in cursors:
+        if key in ("UP", "DOWN"):
+            cursor.line = min(max(cursor.line + (1 if key == "DOWN" else -1), 0), last)
+            cursor.char = min(cursor.char, len(buffer.getLine(cursor.line)))
+        elif key == "LEFT":
+            cursor.char = max(cursor.char - 1, 0)
+        elif key == "RIGHT":
+            cursor.char = min(cursor.char + 1, len(buffer.getLine(cursor.line)))
+        cursor.anchor = None
+
+
+def wordAt(text, char):
+    # (start, end) of the word the cursor is in or right after, None in between words
+    for match in WORD.finditer(text):
+        if match.start() <= char <= match.end():
+            return match.span()
+        if match.start() > char:
+            break
+    return None
+
+
+def nextOccurrence(buffer, text, line, char):
+    # (line, start) of the next text after a position, wrapping around the end
+    found = buffer.getLine(line).find(text, char)
+    if found >= 0:
+        return line, found
+    following = buffer.find(text, line + 1)
+    if following is None:
+        following = buffer.find(text, 0)
+    if following is None:
+        return None
+    return following, buffer.getLine(following).find(text)
@@ -0,0 +1,42 @@
+import os
+import threading
+
+# bytes read from the pipe at a time
+PIPE_CHUNK = 1024 * 1024
+# chunks handed to the loop but not yet added to the buffer
+MAX_PENDING = 8
+
+
+class PipeReader:
+    def __init__(self, fd, loop, onData, onEnd):
+        self.fd = fd
+        self.loop = loop
+        self.onData = onData
+        self.onEnd = onEnd
+        # keeps the reader from running far ahead of the loop
+        self.pending = threading.Semaphore(MAX_PENDING)
+        self.thread = threading.Thread(target=self.read, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def chunks(self):
+        while True:
+            try:
+                data = os.read(self.fd, PIPE_CHUNK)
+            except OSError:
+                return
+            if not data:
+                return
+            yield data
+
+    def read(self):
+        # runs on its own thread, the buffer is only touched on the loop
+        for data in self.chunks():
+            self.pending.acquire()
+            self.loop.call_soon_threadsafe(self.deliver, data)
+        self.loop.call_soon_threadsafe(self.onEnd)
+
+    def deliver(self, data):
+        self.pending.release()
+        self.onData(data)
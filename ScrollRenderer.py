@@ -1,46 +1,109 @@
 
 class ScrollRenderer:
-    def __init__(self, width, height, linesScrolled, text):
+    def __init__(self, width, height, linesScrolled, buffer):
         self.width = width
         self.height = height
         self.linesScrolled = linesScrolled
-        self.text = text
+        # TextBuffer, only the visible lines are ever read from it
+        self.buffer = buffer
+        # optional line number gutter, see Gutter.py
+        self.gutter = None
 
-    def formatTextForWidth(self, text):
+    def gutterWidth(self):
+        if self.gutter is None:
+            return 0
+        return self.gutter.widthFor(self.labelCount())
+
+    def textWidth(self):
+        # columns left for text once the gutter is drawn
+        return max(self.width - self.gutterWidth(), 1)
+
+    def lineCount(self):
+        return self.buffer.lineCount()
+
+    def labelCount(self):
+        # the highest line number in the gutter, a filtered view shows the
+        # line numbers of its source
+        if hasattr(self.buffer, "sourceLines"):
+            return self.buffer.sourceLineCount()
+        return self.lineCount()
+
+    def maxScroll(self):
+        # the top line of the last page, counted in rows when lines are folded
+        folds = self.buffer.folds
+        return folds.lineAt(max(folds.rowCount(self.lineCount()) - self.height, 0))
+
+    def rowLines(self):
+        # the line shown on every row, linesScrolled is the line on the first
+        folds = self.buffer.folds
+        if not folds:
+            return range(self.linesScrolled, min(self.linesScrolled + self.height, self.lineCount()))
+        top = folds.rowOf(self.linesScrolled)
+        rows = min(top + self.height, folds.rowCount(self.lineCount()))
+        return [folds.lineAt(row) for row in range(top, rows)]
+
+    def lineText(self, line):
+        # a folded range shows as its first line with the hidden line count
+        text = self.buffer.getLine(line)
+        hidden = self.buffer.folds.hiddenLines(line)
+        if hidden:
+            text += f" [+{hidden} lines]"
+        return text
+
+    def visibleLines(self):
+        if self.linesScrolled > self.maxScroll():
+            raise RenderException("Cannot scroll past end of file")
+        if self.linesScrolled < 0:
+            raise RenderException("Cannot scroll past beginning of file")
+
+        return [self.lineText(line) for line in self.rowLines()]
+
+    def formatTextForWidth(self, lines):
+        width = self.textWidth()
         formattedText = []
-        for line in text.splitlines():
-            if len(line) > self.width:
-                formattedText.append(line[:self.width])
+        for line in lines:
+            if len(line) > width:
+                formattedText.append(line[:width])
             else:
                 formattedText.append(line)
         return formattedText
 
-    def render(self):
-        formattedText = self.formatTextForWidth(self.text.splitlines())
+    def renderRow(self, i):
+        # a single row of the view, for redrawing only what an edit touched
+        folds = self.buffer.folds
+        row = folds.rowOf(self.linesScrolled) + i
+        if row >= folds.rowCount(self.lineCount()):
+            return ""
+        return self.formatTextForWidth([self.lineText(folds.lineAt(row))])[0]
 
-        if self.linesScrolled > len(formattedText) - self.height:
-            raise RenderException("Cannot scroll past end of file")
-        if self.linesScrolled < 0:
-            raise RenderException("Cannot scroll past beginning of file")
+    def render(self):
+        formattedText = self.formatTextForWidth(self.visibleLines())
 
-        for line in formattedText[self.linesScrolled:self.linesScrolled + self.height]:
+        for line in formattedText:
             print(line)
 
     def renderLines(self):
-        formattedText = self.formatTextForWidth(self.text)
-
-        if self.linesScrolled > len(formattedText) - self.height:
-            raise RenderException("Cannot scroll past end of file")
-        if self.linesScrolled < 0:
-            raise RenderException("Cannot scroll past beginning of file")
+        formattedText = self.formatTextForWidth(self.visibleLines())
 
         output = []
-        for line in formattedText[self.linesScrolled:self.linesScrolled + self.height]:
+        for line in formattedText:
             output.append(line + "\n")
         
         # convert list to string with newlines
         return "".join(output)
 
+    def renderGutter(self):
+        if self.gutter is None:
+            return None
+        if hasattr(self.buffer, "sourceLines"):
+            return self.gutter.update(self.labelCount(), self.linesScrolled, self.height,
+                                      self.buffer.sourceLines(self.rowLines()))
+        # lines changed since the file was saved are marked next to their number
+        marks = self.buffer.changes()
+        if self.buffer.folds:
+            return self.gutter.update(self.lineCount(), self.linesScrolled, self.height, self.rowLines(), marks)
+        return self.gutter.update(self.lineCount(), self.linesScrolled, self.height, marks=marks)
+
 # custom render exception
 class RenderException(Exception):
     pass
\ No newline at end of file
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+from array import array
+from FilePicker import cacheDir
+from TextBuffer import fileIdentity
+
+# smaller files are indexed faster than their cached index is read back,
+# counted in plain bytes for compressed files
+INDEX_MIN_SIZE = 1024 * 1024
+
+
+class SessionCache:
+    # Where a file was left and its line index, keyed by the file's path and
+    # checked against its size, mtime and inode before anything is used.
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(cacheDir(), "sessions")
+
+    def paths(self, filename):
+        key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:16]
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".index"
+
+    def load(self, filename):
+        # {identity, starts, indexed, lines, linesScrolled, pos, wantChar,
+        # seekPoints}, None when nothing was saved or the file changed since
+        metaPath, indexPath = self.paths(filename)
+        try:
+            with open(metaPath, "r", encoding="utf-8") as file:
+                session = json.load(file)
+            identity = fileIdentity(os.stat(filename))
+        except (OSError, ValueError):
+            return None
+        if session.get("path") != os.path.abspath(filename):
+            return None
+        if tuple(session.get("identity", ())) != identity:
+            # the file was edited or replaced, nothing saved for it holds
+            self.forget(filename)
+            return None
+
+        session["identity"] = identity
+        session["starts"] = None
+        if session.get("lines"):
+            starts = array("q")
+            try:
+                with open(indexPath, "rb") as file:
+                    starts.fromfile(file, session["lines"])
+            except (OSError, EOFError):
+                starts = None
+            # a damaged index is ignored, the file is indexed again; the plain
+            # size of a compressed file is where its last member ends
+            seekPoints = session.get("seekPoints")
+            size = seekPoints[-1][1] if seekPoints else identity[0]
+            if starts and starts[0] == 0 and session.get("indexed", 0) <= size:
+                session["starts"] = starts
+            else:
+                session["lines"] = 0
+        return session
+
+    def save(self, filename, identity, starts, indexed, state, writeIndex=True, seekPoints=None):
+        # state is (linesScrolled, pos, wantChar), starts None to only keep
+        # the position. seekPoints locate the members of a compressed file.
+        linesScrolled, pos, wantChar = state
+        metaPath, indexPath = self.paths(filename)
+        lines = 0
+        if starts is not None and indexed >= INDEX_MIN_SIZE:
+            lines = len(starts)
+        session = {
+            "path": os.path.abspath(filename),
+            "identity": list(identity),
+            "indexed": indexed if lines else 0,
+            "lines": lines,
+            "linesScrolled": linesScrolled,
+            "pos": list(pos),
+            "wantChar": wantChar,
+            "seekPoints": seekPoints if lines else None,
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if lines and writeIndex:
+                tempName = indexPath + ".tmp"
+                with open(tempName, "wb") as file:
+                    starts.tofile(file)
+                os.replace(tempName, indexPath)
+            elif not lines and os.path.exists(indexPath):
+                os.remove(indexPath)
+            # the index is in place before the metadata that points to it
+            tempName = metaPath + ".tmp"
+            with open(tempName, "w", encoding="utf-8") as file:
+                json.dump(session, file)
+            os.replace(tempName, metaPath)
+        except OSError:
+            pass
+
+    def forget(self, filename):
+        for path in self.paths(filename):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
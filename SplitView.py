@@ -0,0 +1,136 @@
+# smallest view a split may leave behind
+MIN_WIDTH = 10
+MIN_HEIGHT = 2
+
+
+class View:
+    # One viewport onto a document. Views of the same document share its
+    # buffer and line index, a view only keeps its own position and rows.
+    def __init__(self, document, renderer, pane):
+        self.document = document
+        self.renderer = renderer
+        # TUI pane the view is drawn in, None when the terminal has one view
+        self.pane = pane
+        self.parent = None
+        self.linesScrolled = 0
+        self.pos = [0, 0]
+        self.wantChar = 1
+        self.row, self.col, self.width, self.height = 2, 1, 0, 0
+        # view rows that have to be read again, None for all of them
+        self.damaged = None
+        self.drawnWidth = None
+
+    def setGeometry(self, row, col, width, height):
+        if (row, col, width, height) != (self.row, self.col, self.width, self.height):
+            self.row, self.col, self.width, self.height = row, col, width, height
+            self.damaged = None
+            if self.pane is not None:
+                self.pane.setGeometry(row, col, width, height)
+
+    def linesChanged(self, line, shifted):
+        # An edit in another view of the same buffer. A changed line damages
+        # its row, inserted or removed lines damage every row below them.
+        if self.damaged is None:
+            return
+        # rows, not lines, lines can be folded away
+        folds = self.document.buffer.folds
+        top = folds.rowOf(self.linesScrolled)
+        row = folds.rowOf(line)
+        if shifted:
+            if self.renderer.gutter is not None:
+                self.renderer.gutter.linesChanged(line)
+            if row < top + self.height:
+                self.damaged.update(range(max(row - top, 0), self.height))
+        elif top <= row < top + self.height:
+            self.damaged.add(row - top)
+
+    def needsDrawing(self):
+        return self.damaged is None or bool(self.damaged)
+
+    def draw(self, tui):
+        renderer = self.renderer
+        # the document may have been reloaded into a new buffer
+        if renderer.buffer is not self.document.buffer:
+            renderer.buffer = self.document.buffer
+            self.damaged = None
+        renderer.width, renderer.height = self.width, self.height
+        # a fold made elsewhere can hide the top line
+        folds = renderer.buffer.folds
+        scrolled = min(folds.lineAt(folds.rowOf(self.linesScrolled)), renderer.maxScroll())
+        if scrolled != self.linesScrolled or renderer.textWidth() != self.drawnWidth:
+            self.linesScrolled = scrolled
+            self.damaged = None
+        renderer.linesScrolled = self.linesScrolled
+
+        gutter = renderer.renderGutter()
+        if self.damaged is None:
+            rows = renderer.formatTextForWidth(renderer.visibleLines())
+            tui.draw_pane(self.pane, rows, gutter)
+        else:
+            for i in sorted(self.damaged):
+                tui.draw_pane_row(self.pane, i, renderer.renderRow(i), gutter[i] if gutter else None)
+        self.drawnWidth = renderer.textWidth()
+        self.damaged = set()
+
+
+class Split:
+    # two nodes side by side (vertical) or one above the other
+    def __init__(self, vertical, first, second):
+        self.vertical = vertical
+        self.first = first
+        self.second = second
+        self.parent = None
+        first.parent = self
+        second.parent = self
+
+    def replace(self, old, new):
+        if self.first is old:
+            self.first = new
+        else:
+            self.second = new
+        new.parent = self
+
+
+def leaves(node):
+    # views in screen order, left to right and top to bottom
+    if isinstance(node, View):
+        return [node]
+    return leaves(node.first) + leaves(node.second)
+
+
+def splitView(root, view, newView, vertical):
+    # put newView next to view, returns the new root
+    parent = view.parent
+    split = Split(vertical, view, newView)
+    if parent is None:
+        return split
+    parent.replace(view, split)
+    return root
+
+
+def removeView(root, view):
+    # the sibling takes the space of the view, returns the new root
+    parent = view.parent
+    view.parent = None
+    if parent is None:
+        return root
+    sibling = parent.second if parent.first is view else parent.first
+    if parent.parent is None:
+        sibling.parent = None
+        return sibling
+    parent.parent.replace(parent, sibling)
+    return root
+
+
+def layout(node, row, col, width, height):
+    # give every view its part of the area, a blank row or column between
+    if isinstance(node, View):
+        node.setGeometry(row, col, width, height)
+    elif node.vertical:
+        left = (width - 1) // 2
+        layout(node.first, row, col, left, height)
+        layout(node.second, row, col + left + 1, width - left - 1, height)
+    else:
+        top = (height - 1) // 2
+        layout(node.first, row, col, width, top)
+        layout(node.second, row + top + 1, col, width, height - top - 1)
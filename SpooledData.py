@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+# how much piped input is kept in memory before it moves to a temp file
+SPOOL_THRESHOLD = 64 * 1024 * 1024
+
+
+class SpooledData:
+    def __init__(self, threshold=SPOOL_THRESHOLD):
+        # Bytes that only ever grow at the end, like input read from a pipe.
+        # They stay in memory up to the threshold and are spilled to an
+        # anonymous temp file after that, so memory use stays bounded.
+        self.threshold = threshold
+        self.memory = bytearray()
+        self.file = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iadd__(self, data):
+        if self.file is None and self.size + len(data) > self.threshold:
+            self.spill()
+
+        if self.file is None:
+            self.memory += data
+        else:
+            self.file.seek(0, os.SEEK_END)
+            self.file.write(data)
+        self.size += len(data)
+        return self
+
+    def spill(self):
+        self.file = tempfile.TemporaryFile()
+        self.file.write(self.memory)
+        self.memory = None
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("SpooledData only supports slices")
+        start, stop, _ = key.indices(self.size)
+        if stop <= start:
+            return b""
+        if self.file is None:
+            return bytes(self.memory[start:stop])
+
+        self.file.flush()
+        if hasattr(os, "pread"):
+            return os.pread(self.file.fileno(), stop - start, start)
+        self.file.seek(start)
+        return self.file.read(stop - start)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
@@ -1,11 +1,96 @@
+import base64
 import sys
 import os
+import time
 from abc import ABC, abstractmethod
-import asyncio
-from asyncio.subprocess import PIPE, STDOUT
-from ScrollRenderer import ScrollRenderer
-import ctypes
-from ctypes import wintypes
+from Compositor import Compositor, Layer
+
+STATUS_STYLE = "\033[47m\033[30m" # white background, black text
+OVERLAY_STYLE = "\033[7m"
+MARK_STYLE = "\033[7m"
+# cells of the mark layer that show the text below
+CLEAR = "\0"
+
+# DEC private mode escape codes
+ALT_SCREEN_ENTER = "\033[?1049h"
+ALT_SCREEN_EXIT = "\033[?1049l"
+SYNC_BEGIN = "\033[?2026h"
+SYNC_END = "\033[?2026l"
+SYNC_QUERY = "\033[?2026$p"
+DEVICE_ATTRIBUTES_QUERY = "\033[c"
+# OSC 52, the terminal puts the base64 text on the system clipboard
+CLIPBOARD_SET = "\033]52;c;{}\a"
+
+
+def detect_synchronized_output(fd, output, timeout=0.2):
+    # PYEDIT_SYNC=0/1 skips the query
+    override = os.environ.get("PYEDIT_SYNC")
+    if override is not None:
+        return override == "1"
+
+    import select
+
+    # Ask for the mode 2026 state, then for device attributes. Every
+    # terminal answers the second query, so if its reply arrives first the
+    # terminal does not know about synchronized output.
+    output.write(SYNC_QUERY + DEVICE_ATTRIBUTES_QUERY)
+    output.flush()
+
+    reply = b""
+    deadline = time.monotonic() + timeout
+    while not reply.endswith(b"c"):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            break
+        reply += os.read(fd, 64)
+
+    # ?2026;1$y (set) or ?2026;2$y (reset) mean the mode is supported
+    return b"?2026;1$y" in reply or b"?2026;2$y" in reply
+
+
+class Pane:
+    # a viewport on screen, the line number gutter with the text next to it
+    def __init__(self, compositor, prefix, row, col, width, height):
+        self.compositor = compositor
+        self.gutter_layer = compositor.addLayer(Layer(prefix + "gutter", row, col, 0, height, z=0))
+        self.text_layer = compositor.addLayer(Layer(prefix + "text", row, col, width, height, z=0))
+        # extra cursors and selections, drawn over the text
+        self.mark_layer = compositor.addLayer(Layer(prefix + "marks", row, col, width, height, z=2,
+                                                    style=MARK_STYLE, transparent=CLEAR))
+        self.row, self.col, self.width, self.height = row, col, width, height
+
+    def setGeometry(self, row, col, width, height):
+        self.row, self.col, self.width, self.height = row, col, width, height
+        self.layout()
+
+    def layout(self):
+        # the text area starts right after the gutter
+        gutter_width = min(self.gutter_layer.width, self.width) if self.gutter_layer.visible else 0
+        self.gutter_layer.setGeometry(self.row, self.col, gutter_width, self.height)
+        self.text_layer.setGeometry(self.row, self.col + gutter_width, self.width - gutter_width, self.height)
+        self.mark_layer.setGeometry(self.row, self.col + gutter_width, self.width - gutter_width, self.height)
+
+    def set_gutter(self, gutter):
+        if gutter is None:
+            self.gutter_layer.setVisible(False)
+        else:
+            width = len(gutter[0]) if gutter else 0
+            self.gutter_layer.setVisible(True)
+            self.gutter_layer.setGeometry(self.row, self.col, width, self.height)
+            self.gutter_layer.setRows(gutter)
+        self.layout()
+
+    def set_marks(self, marks):
+        # rows of CLEAR with the marked cells filled in, None for no marks
+        self.mark_layer.setRows(marks or [])
+
+    def remove(self):
+        self.compositor.removeLayer(self.gutter_layer)
+        self.compositor.removeLayer(self.text_layer)
+        self.compositor.removeLayer(self.mark_layer)
 
 
 class BaseTUI(ABC):
@@ -15,6 +100,8 @@ class BaseTUI(ABC):
         self.width = 0
         self.height = 0
         self.pos = [0, 0] # [char x, line y]
+        # where the cursor is drawn, None without split view support
+        self.active_pane = None
 
     @abstractmethod
     def enable_raw_mode(self):
@@ -48,83 +135,214 @@ class BaseTUI(ABC):
     def render(self, text, status):
         pass
 
+    # Session mode hooks, no-ops for terminals without VT support
+    def enter_alternate_screen(self):
+        pass
+
+    def exit_alternate_screen(self):
+        pass
+
+    def set_clipboard(self, text):
+        pass
+
+    def terminal_size(self):
+        return os.get_terminal_size()
+
+    # Split views need a compositor, None means the terminal has one view
+    def add_pane(self):
+        return None
+
 
 class UnixTUI(BaseTUI):
-    def __init__(self):
+    def __init__(self, input_fd=None, output=None):
         super().__init__()
         self.old_settings = None
-
-        self.width, self.height = os.get_terminal_size()
+        self.sync_output = False
+        self.alternate_screen = False
+        # frames go to the terminal, or to an attached client, see EditorServer.py
+        self.output = output if output is not None else sys.stdout
+
+        # keys come from the terminal even when stdin is a pipe being paged
+        if input_fd is not None:
+            self.input_fd = input_fd
+        elif os.isatty(sys.stdin.fileno()):
+            self.input_fd = sys.stdin.fileno()
+        else:
+            self.input_fd = os.open("/dev/tty", os.O_RDONLY)
+
+        self.width, self.height = self.terminal_size()
+
+        # status bar on the first row, text area below it, popups on top
+        self.compositor = Compositor(self.width, self.height)
+        # split views each get a pane, the cursor is drawn in the active one
+        self.panes = [Pane(self.compositor, "", 2, 1, self.width, self.height - 1)]
+        self.active_pane = self.panes[0]
+        self.pane_count = 1
+        self.status_layer = self.compositor.addLayer(Layer("status", 1, 1, self.width, 1, z=1, style=STATUS_STYLE))
+        self.overlay_layer = self.compositor.addLayer(Layer("overlay", 2, 1, 0, 0, z=10, style=OVERLAY_STYLE))
+        self.overlay_layer.visible = False
 
     def enable_raw_mode(self):
         import termios
         import tty
 
-        fd = sys.stdin.fileno()
+        fd = self.input_fd
         self.old_settings = termios.tcgetattr(fd)
-        tty.setraw(sys.stdin.fileno())
+        tty.setraw(fd)
 
     def restore_terminal(self):
         import termios
 
-        fd = sys.stdin.fileno()
+        fd = self.input_fd
         termios.tcsetattr(fd, termios.TCSADRAIN, self.old_settings)
 
+    def enter_alternate_screen(self):
+        # needs raw mode so the capability reply is not echoed
+        self.sync_output = self.detect_synchronized_output()
+        self.output.write(ALT_SCREEN_ENTER)
+        self.output.flush()
+        self.alternate_screen = True
+
+    def exit_alternate_screen(self):
+        if self.alternate_screen:
+            self.output.write(ALT_SCREEN_EXIT)
+            self.output.flush()
+            self.alternate_screen = False
+
+    def set_clipboard(self, text):
+        data = base64.b64encode(text.encode("utf-8", "surrogateescape")).decode("ascii")
+        self.output.write(CLIPBOARD_SET.format(data))
+        self.output.flush()
+
+    def detect_synchronized_output(self, timeout=0.2):
+        return detect_synchronized_output(self.input_fd, self.output, timeout)
+
     async def read_key(self):
+        import asyncio
         import select
 
         while True:
-            if select.select([sys.stdin], [], [], 0) == ([sys.stdin], [], []):
-                return sys.stdin.read(1)
+            if select.select([self.input_fd], [], [], 0)[0]:
+                return os.read(self.input_fd, 1).decode("utf-8", "replace")
             await asyncio.sleep(0.01)  # Add a small delay to reduce CPU usage
 
     def clear_screen(self):
-        sys.stdout.write("\033[2J")
-        sys.stdout.flush()
+        self.output.write("\033[2J")
+        self.output.flush()
+        # the screen no longer shows the cached frame
+        self.compositor.invalidate()
 
     def move_cursor(self, x, y):
-        sys.stdout.write(f"\033[{y};{x}H")
-        sys.stdout.flush()
+        self.output.write(f"\033[{y};{x}H")
+        self.output.flush()
 
     def show_cursor(self):
-        sys.stdout.write("\033[?25h")
-        sys.stdout.flush()
+        self.output.write("\033[?25h")
+        self.output.flush()
 
     def hide_cursor(self):
-        sys.stdout.write("\033[?25l")
-        sys.stdout.flush()
-
-    def render(self, text, status, overlay=None):
-        self.clear_screen()
-
-        if overlay is not None:
-            for line in overlay.splitlines():
-                # write right-aligned
-                sys.stdout.write(" " * (self.width - len(line)))
-
-        self.width, self.height = os.get_terminal_size()
-
-        linenum = 2
-        for line in text.splitlines():
-            sys.stdout.write(f"\033[{linenum};0H")
-            sys.stdout.write(line)
-            linenum += 1
-
-        sys.stdout.write(f"\033[0;0H")
-        # white background, black text
-        sys.stdout.write("\033[47m\033[30m")
-        sys.stdout.write(status)
-        # add whitespace to clear the rest of the line
-        sys.stdout.write(" " * (self.width - len(status)))
-        sys.stdout.write("\n")
-        # reset colors
-        sys.stdout.write("\033[0m")
-        self.move_cursor(self.cursor_x, self.cursor_y)
-        sys.stdout.flush()
+        self.output.write("\033[?25l")
+        self.output.flush()
+
+    def resize(self):
+        width, height = self.terminal_size()
+        if self.compositor.resize(width, height):
+            self.width, self.height = width, height
+            self.status_layer.setGeometry(1, 1, width, 1)
+        self.layout()
+
+    def layout(self):
+        # a single pane fills the screen below the status bar, split panes
+        # are placed by the editor
+        if len(self.panes) == 1:
+            self.panes[0].setGeometry(2, 1, self.width, self.height - 1)
+        for pane in self.panes:
+            pane.layout()
+
+    def set_gutter(self, gutter):
+        self.active_pane.set_gutter(gutter)
+
+    def add_pane(self):
+        self.pane_count += 1
+        pane = Pane(self.compositor, f"pane{self.pane_count}-", 2, 1, 0, 0)
+        self.panes.append(pane)
+        return pane
+
+    def remove_pane(self, pane):
+        pane.remove()
+        self.panes.remove(pane)
+
+    def draw_pane(self, pane, rows, gutter):
+        # fill an inactive pane, drawn with the next frame
+        pane.set_gutter(gutter)
+        pane.text_layer.setRows(rows)
+
+    def draw_pane_row(self, pane, i, text, gutter_label=None):
+        if gutter_label is not None:
+            pane.gutter_layer.setRow(i, gutter_label)
+        pane.text_layer.setRow(i, text)
+
+    def set_overlay(self, overlay):
+        if overlay is None:
+            self.overlay_layer.setVisible(False)
+            return
+
+        lines = overlay.splitlines()
+        width = min(max((len(line) for line in lines), default=0), self.width)
+        # right-aligned popup below the status bar
+        self.overlay_layer.setGeometry(2, self.width - width + 1, width, len(lines))
+        self.overlay_layer.setRows(lines)
+        self.overlay_layer.setVisible(True)
+
+    def render(self, text, status, overlay=None, gutter=None, marks=None):
+        self.resize()
+
+        self.set_gutter(gutter)
+        self.active_pane.text_layer.setRows(text.splitlines())
+        self.active_pane.set_marks(marks)
+        self.status_layer.setRows([status])
+        self.set_overlay(overlay)
+
+        self.draw_frame()
+
+    def render_status(self, status):
+        # only the status bar changed, the text area stays cached
+        self.resize()
+        self.status_layer.setRows([status])
+        self.draw_frame()
+
+    def render_overlay(self, overlay):
+        # only the popup changed, the text area stays cached
+        self.resize()
+        self.set_overlay(overlay)
+        self.draw_frame()
+
+    def draw_frame(self):
+        # Only the rows touched by dirty layers get written, the whole frame
+        # goes out in one write wrapped in synchronized update markers when
+        # the terminal supports them.
+        frame = []
+        if self.sync_output:
+            frame.append(SYNC_BEGIN)
+        frame.append("\033[?25l")
+        frame.append(self.compositor.compose())
+        # the cursor is relative to the text area of the active pane
+        text_layer = self.active_pane.text_layer
+        frame.append(f"\033[{self.cursor_y + text_layer.row - 2};{self.cursor_x + text_layer.col - 1}H")
+        frame.append("\033[?25h")
+        if self.sync_output:
+            frame.append(SYNC_END)
+
+        self.output.write("".join(frame))
+        self.output.flush()
 
 class WindowsTUI(BaseTUI):
     def __init__(self):
         super().__init__()
+        # ctypes is only loaded on Windows
+        import ctypes
+        from ctypes import wintypes
+
         self.kernel32 = ctypes.windll.kernel32
         self.GetStdHandle = self.kernel32.GetStdHandle
         self.SetConsoleCursorPosition = self.kernel32.SetConsoleCursorPosition
@@ -136,9 +354,13 @@ class WindowsTUI(BaseTUI):
         self.hstdout = self.GetStdHandle(self.STD_OUTPUT_HANDLE)
         self.hstdin = self.GetStdHandle(self.STD_INPUT_HANDLE)
         self.original_mode = wintypes.DWORD()
+        self.last_text = ""
+        self.last_status = ""
         self.enable_raw_mode()
 
     def enable_raw_mode(self):
+        import ctypes
+
         self.GetConsoleMode(self.hstdin, ctypes.byref(self.original_mode))
         new_mode = self.original_mode.value & ~(0x0001 | 0x0004)  # Clear ENABLE_PROCESSED_INPUT and ENABLE_LINE_INPUT flags
         self.SetConsoleMode(self.hstdin, new_mode)
@@ -147,6 +369,8 @@ class WindowsTUI(BaseTUI):
         self.SetConsoleMode(self.hstdin, self.original_mode)
 
     async def read_key(self):
+        import asyncio
+
         while True:
             import msvcrt
             if msvcrt.kbhit():
@@ -157,6 +381,8 @@ class WindowsTUI(BaseTUI):
         os.system("cls")
 
     def move_cursor(self, x, y):
+        from ctypes import wintypes
+
         coord = wintypes._COORD(x, y)
         self.SetConsoleCursorPosition(self.hstdout, coord)
 
@@ -171,6 +397,9 @@ class WindowsTUI(BaseTUI):
         self._set_console_info(console_info)
 
     def _get_console_info(self):
+        import ctypes
+        from ctypes import wintypes
+
         class CONSOLE_CURSOR_INFO(ctypes.Structure):
             _fields_ = [("dwSize", wintypes.DWORD),
                         ("bVisible", wintypes.BOOL)]
@@ -180,12 +409,23 @@ class WindowsTUI(BaseTUI):
         return console_info
 
     def _set_console_info(self, console_info):
+        import ctypes
+
         self.kernel32.SetConsoleCursorInfo(self.hstdout, ctypes.byref(console_info))
 
-    def render(self, text, status, overlay=None):
+    def render(self, text, status, overlay=None, gutter=None, marks=None):
+        self.last_text = text
+        self.last_status = status
         self.clear_screen()
         sys.stdout.write("\033[0;0H")  # Move to the top-left corner
         sys.stdout.write(status + "\n")
         sys.stdout.write(text)
         self.move_cursor(self.cursor_x, self.cursor_y)  # Move the cursor to its current position
         sys.stdout.flush()
+
+    def render_status(self, status):
+        # no frame cache on the Windows console, redraw with the last text
+        self.render(self.last_text, status)
+
+    def render_overlay(self, overlay):
+        self.render(self.last_text, self.last_status, overlay)
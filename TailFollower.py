@@ -0,0 +1,30 @@
+import os
+
+
+class TailFollower:
+    def __init__(self, filename, size, interval=0.25):
+        self.filename = filename
+        # how much of the file is already in the buffer
+        self.size = size
+        self.interval = interval
+
+    def poll(self):
+        # New bytes at the end of the file, b"" when nothing changed and None
+        # when the file got shorter (truncated or rotated) and needs a reload.
+        # Only the appended part is read, never the whole file.
+        try:
+            size = os.stat(self.filename).st_size
+        except OSError:
+            return b""
+
+        if size == self.size:
+            return b""
+        if size < self.size:
+            self.size = size
+            return None
+
+        with open(self.filename, "rb") as file:
+            file.seek(self.size)
+            data = file.read(size - self.size)
+        self.size += len(data)
+        return data
@@ -0,0 +1,663 @@
+import bisect
+import locale
+import os
+import weakref
+from collections import OrderedDict
+from Folding import Folds
+from LineIndex import LineIndex
+
+# bytes looked at to guess the encoding and line endings of a file
+SAMPLE_SIZE = 64 * 1024
+# decoded lines kept, a few screens worth
+DECODE_CACHE = 4096
+# most bytes copied at once when saving untouched lines
+COPY_CHUNK = 1024 * 1024
+
+
+def fileIdentity(stat):
+    # changes whenever the file is rewritten or replaced
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def detectFormat(sample):
+    # (encoding, newline) guessed from the start of a file. Undecodable bytes
+    # survive a round trip either way, the guess only decides how they show.
+    encoding = "utf-8"
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as error:
+        # a character cut off at the end of the sample is still utf-8
+        if error.start < len(sample) - 3:
+            preferred = locale.getpreferredencoding(False)
+            if preferred.lower().replace("-", "") in ("utf8", "ascii", "ansi_x3.41968"):
+                preferred = "latin-1"
+            encoding = preferred
+    crlf = sample.count(b"\r\n")
+    newline = "\r\n" if crlf > sample.count(b"\n") - crlf else "\n"
+    return encoding, newline
+
+
+class TextBuffer:
+    def __init__(self, index=None, encoding=None):
+        self.index = index if index is not None else LineIndex()
+        # the open file behind a memory mapped index
+        self.mappedFile = None
+        # size, mtime and inode of the file when it was loaded
+        self.identity = None
+        self.encoding = encoding or "utf-8"
+        # guessed from the first bytes of the file unless one was given
+        self.guessEncoding = encoding is None
+        # line ending given to edited lines, untouched lines keep their own
+        self.newline = "\n"
+        self.detectFormat()
+        # decoded text of index lines, by line number
+        self.decoded = OrderedDict()
+        # folded ranges shown by every view of the buffer, moved by edits
+        self.folds = Folds()
+        # copies holding runs of lines of the index, see Clipboard.Clip
+        self.copies = weakref.WeakSet()
+
+        # The buffer is a list of pieces. A tuple (start, stop) is a run of
+        # untouched lines read through the line index, a list holds lines that
+        # were edited or inserted.
+        self.pieces = [(0, self.index.lineCount())]
+        # buffer line number where every piece starts, rebuilt after edits
+        self.pieceStarts = None
+        self.count = self.index.lineCount()
+        # edited since it was loaded or saved
+        self.modified = False
+        # bumped by every edit, what was worked out from the lines compares
+        # it to tell when that is out of date
+        self.version = 0
+        # the index holds lines that are not the file's, see replaceIndex
+        self.detached = False
+        # DiskDiff of the lines changed since the file was loaded or saved,
+        # made once the gutter first shows them
+        self.diff = None
+        # DocumentStats of the words, characters and bytes, made once the
+        # status bar first shows them and told about every edit after that
+        self.stats = None
+
+    @classmethod
+    def fromFile(cls, filename, encoding=None, large=False, index=None):
+        # index is an (identity, starts, indexed) kept from an earlier load,
+        # used as is when the file is still the same
+        with open(filename, "rb") as file:
+            identity = fileIdentity(os.fstat(file.fileno()))
+            starts, indexed = None, 0
+            if index is not None and index[0] == identity:
+                starts, indexed = index[1], index[2]
+
+            if large and identity[0] > 0:
+                # map the file instead of reading it and index it in the background
+                import mmap
+
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                buffer = cls(LineIndex(data, lazy=True, starts=starts, indexed=indexed), encoding)
+                # keep our own handle, the mapping is grown through it later
+                buffer.mappedFile = os.fdopen(os.dup(file.fileno()), "rb")
+                buffer.identity = identity
+                return buffer
+
+            # a bytearray so a growing file can be appended to without copying
+            data = bytearray(identity[0])
+            size = file.readinto(data)
+            del data[size:]
+        buffer = cls(LineIndex(data, starts=starts, indexed=indexed), encoding)
+        buffer.identity = identity
+        return buffer
+
+    @classmethod
+    def fromText(cls, text, encoding=None):
+        buffer = cls(encoding=encoding)
+        buffer.pieces = [text.split("\n")]
+        buffer.count = len(buffer.pieces[0])
+        return buffer
+
+    def lineCount(self):
+        return self.count
+
+    def changes(self):
+        # the DiskDiff of the buffer, up to date, see LineDiff.py
+        if self.diff is None:
+            from LineDiff import DiskDiff
+
+            self.diff = DiskDiff(self)
+        return self.diff.update()
+
+    def statistics(self):
+        # the DocumentStats of the buffer, see DocumentStats.py
+        if self.stats is None:
+            from DocumentStats import DocumentStats
+
+            self.stats = DocumentStats(self)
+        return self.stats
+
+    def edited(self, start, stop, pieces):
+        # lines [start, stop) are about to be replaced by pieces
+        if self.stats is not None:
+            self.stats.replaced(start, stop, pieces)
+
+    def growing(self):
+        # The last line of the index may get longer when the index grows,
+        # it is counted again from the first place it shows
+        if self.stats is None:
+            return
+        last = self.index.lineCount() - 1
+        line = 0
+        for piece in self.pieces:
+            if isinstance(piece, tuple) and piece[0] <= last < piece[1]:
+                self.stats.rescanFrom(line + last - piece[0])
+                return
+            line += self.pieceLength(piece)
+
+    def detectFormat(self):
+        sample = self.index.data[:SAMPLE_SIZE]
+        if not sample:
+            return
+        encoding, self.newline = detectFormat(sample)
+        if self.guessEncoding:
+            self.encoding = encoding
+            self.guessEncoding = False
+
+    def endsWithNewline(self):
+        # saving keeps the final newline of the file, or its absence; new
+        # files get one
+        size = len(self.index.data)
+        if size == 0:
+            return True
+        return self.index.data[size - 1:size] == b"\n"
+
+    def memoryUsage(self):
+        # rough number of bytes this buffer keeps in memory
+        held = self.index.memoryUsage()
+        for piece in self.pieces:
+            if isinstance(piece, list):
+                held += sum(len(line) for line in piece)
+        return held
+
+    def close(self):
+        # mapped, spooled and compressed data hold a file open, copies of
+        # its lines take their bytes along first
+        close = getattr(self.index.data, "close", None)
+        if close is not None:
+            for copy in list(self.copies):
+                copy.detach()
+            self.copies.clear()
+            close()
+        if self.mappedFile is not None:
+            self.mappedFile.close()
+            self.mappedFile = None
+
+    def decode(self, data):
+        # surrogateescape keeps undecodable bytes intact for saving
+        line = data.decode(self.encoding, "surrogateescape")
+        if line.endswith("\r"):
+            line = line[:-1]
+        return line
+
+    def startsOfPieces(self):
+        # first line of every piece, edits keep it up to date from the piece
+        # they change on, a whole new piece list builds it again
+        if self.pieceStarts is None:
+            self.pieceStarts = []
+            start = 0
+            for piece in self.pieces:
+                self.pieceStarts.append(start)
+                start += self.pieceLength(piece)
+        return self.pieceStarts
+
+    def locate(self, line):
+        # index of the piece holding the line and where that piece starts
+        self.startsOfPieces()
+        i = bisect.bisect_right(self.pieceStarts, line) - 1
+        return i, self.pieceStarts[i]
+
+    def pieceLength(self, piece):
+        if isinstance(piece, tuple):
+            return piece[1] - piece[0]
+        return len(piece)
+
+    def getLine(self, line):
+        if line < 0 or line >= self.count:
+            raise IndexError("Line number out of range of buffer")
+        i, start = self.locate(line)
+        piece = self.pieces[i]
+        if isinstance(piece, list):
+            return piece[line - start]
+
+        # only lines that are shown get decoded, and only once
+        number = piece[0] + line - start
+        text = self.decoded.get(number)
+        if text is None:
+            text = self.decode(self.index.lineBytes(number))
+            self.decoded[number] = text
+            if len(self.decoded) > DECODE_CACHE:
+                self.decoded.popitem(last=False)
+        else:
+            self.decoded.move_to_end(number)
+        return text
+
+    def getLines(self, start, stop):
+        return [self.getLine(line) for line in range(max(start, 0), min(stop, self.count))]
+
+    def iterLines(self, start=0):
+        if start >= self.count:
+            return
+        first, pieceStart = self.locate(start)
+        offset = start - pieceStart
+        for piece in self.pieces[first:]:
+            if isinstance(piece, tuple):
+                for line in range(piece[0] + offset, piece[1]):
+                    yield self.decode(self.index.lineBytes(line))
+            else:
+                yield from piece[offset:]
+            offset = 0
+
+    def find(self, text, start=0):
+        # first line at or after start containing the text
+        for line, content in enumerate(self.iterLines(start), start):
+            if text in content:
+                return line
+        return None
+
+    def getText(self):
+        return "\n".join(self.iterLines())
+
+    def byteParts(self, starts=None):
+        # The lines as bytes with their line endings. Runs of untouched lines
+        # are copied from the original bytes as they are, edited lines are
+        # encoded with the file's line ending. starts gets the byte offset of
+        # every line after the first.
+        newline = self.newline.encode("ascii")
+        index = self.index
+        offset = 0
+        # the output so far ends with a line ending, or is empty
+        ended = True
+        for piece in self.pieces:
+            if isinstance(piece, tuple):
+                first, stop = piece
+                if first >= stop:
+                    continue
+                if not ended:
+                    # the last line of the file has more lines after it now
+                    yield newline
+                    offset += len(newline)
+                begin = index.starts[first]
+                end = index.starts[stop] if stop < len(index.starts) else index.indexed
+                if starts is not None:
+                    if offset:
+                        starts.append(offset)
+                    starts.extend(start + offset - begin for start in index.starts[first + 1:stop])
+                for cut in range(begin, end, COPY_CHUNK):
+                    yield index.data[cut:min(cut + COPY_CHUNK, end)]
+                offset += end - begin
+                ended = index.data[end - 1:end] == b"\n" if end > begin else False
+            else:
+                for line in piece:
+                    if not ended:
+                        yield newline
+                        offset += len(newline)
+                    if starts is not None and offset:
+                        starts.append(offset)
+                    data = line.encode(self.encoding, "surrogateescape") + newline
+                    yield data
+                    offset += len(data)
+                    ended = True
+
+    def encodedChunks(self, starts=None, size=COPY_CHUNK):
+        # The buffer as the bytes of the file, a chunk at a time so it can be
+        # written without holding all of it
+        if len(self.index.data) == 0 and self.count == 1 and self.getLine(0) == "":
+            # an empty new buffer is an empty file, a file holding just a
+            # line ending keeps it
+            return
+        finalNewline = self.endsWithNewline()
+        chunk = []
+        length = total = 0
+        last = None
+        for part in self.byteParts(starts):
+            if last is not None:
+                chunk.append(last)
+                length += len(last)
+                total += len(last)
+                if length >= size:
+                    yield b"".join(chunk)
+                    chunk = []
+                    length = 0
+            last = part
+
+        # the end of the last line follows the original file
+        if finalNewline and not last.endswith(b"\n"):
+            last += self.newline.encode("ascii")
+        elif not finalNewline and last.endswith(b"\n"):
+            last = last[:-2] if last.endswith(b"\r\n") else last[:-1]
+        chunk.append(last)
+        if finalNewline and starts is not None:
+            # like LineIndex, a final newline starts an empty line
+            starts.append(total + len(last))
+        yield b"".join(chunk)
+
+    def appendData(self, data):
+        # Bytes appended to the file behind the buffer. Only the new bytes are
+        # indexed and the new lines join the last run of untouched lines.
+        # Returns the first line that may have changed.
+        oldCount = self.index.lineCount()
+        changedFrom = self.count - 1
+        self.growing()
+        if self.mappedFile is not None:
+            # the bytes are already in the file, map it again at its new size
+            import mmap
+
+            self.index.grow(mmap.mmap(self.mappedFile.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            self.index.append(data)
+        self.indexGrew(oldCount)
+        return changedFrom
+
+    def indexMore(self):
+        # index the next chunk of a lazily indexed file, returns the first
+        # line that may have changed or None when the index is complete
+        if self.index.complete():
+            return None
+        oldCount = self.index.lineCount()
+        changedFrom = self.count - 1
+        self.growing()
+        self.index.indexMore()
+        self.indexGrew(oldCount)
+        return changedFrom
+
+    def indexGrew(self, oldCount):
+        # new lines at the end of the index join the last untouched run
+        newCount = self.index.lineCount()
+
+        # the last line may have been cut short before
+        self.decoded.pop(oldCount - 1, None)
+        if self.guessEncoding:
+            self.detectFormat()
+
+        if newCount > oldCount:
+            last = self.pieces[-1]
+            if isinstance(last, tuple) and last[1] == oldCount:
+                self.pieces[-1] = (last[0], newCount)
+            else:
+                self.pieces.append((oldCount, newCount))
+                if self.pieceStarts is not None:
+                    self.pieceStarts.append(self.count)
+            self.count += newCount - oldCount
+
+    def rebase(self, index, identity, first, stop, newStop):
+        # The file changed on disk. Lines first..stop of our index became
+        # first..newStop of the new index, the lines around them are the same.
+        # Edits are moved over to the new index, when one touches the changed
+        # lines the buffer is left alone and False is returned.
+        shift = newStop - stop
+        # runs of untouched lines that follow each other are joined, so the
+        # changed lines fall in one run unless an edit splits them
+        pieces = []
+        for piece in self.pieces:
+            if pieces and isinstance(piece, tuple) and isinstance(pieces[-1], tuple) and pieces[-1][1] == piece[0]:
+                pieces[-1] = (pieces[-1][0], piece[1])
+            else:
+                pieces.append(piece)
+
+        rebased = []
+        placed = False
+        # buffer line of the first changed line, for the folds
+        line = changedLine = 0
+        for piece in pieces:
+            length = self.pieceLength(piece)
+            line += length
+            if isinstance(piece, list):
+                rebased.append(piece)
+                continue
+            start, end = piece
+            if not placed and start <= first and stop <= end:
+                rebased.append((start, end + shift))
+                placed = True
+                changedLine = line - length + first - start
+            elif end <= first:
+                rebased.append(piece)
+            elif start >= stop:
+                rebased.append((start + shift, end + shift))
+            else:
+                return False
+        if not placed:
+            if first != stop or first != self.index.lineCount():
+                # the changed lines were edited or deleted here as well
+                return False
+            # lines added after an edited last line
+            rebased.append((first, newStop))
+            changedLine = self.count
+
+        self.folds.replaced(changedLine, changedLine + stop - first, newStop - first)
+        self.version += 1
+        if self.stats is not None:
+            self.stats.reset()
+        self.close()
+        self.index = index
+        self.identity = identity
+        self.decoded.clear()
+        self.pieces = rebased
+        self.count += shift
+        self.normalize()
+        return True
+
+    def replaceBase(self, index, identity):
+        # the whole buffer was written to the file, it is the new base
+        self.close()
+        self.index = index
+        self.identity = identity
+        self.decoded.clear()
+        self.pieces = [(0, index.lineCount())]
+        self.count = index.lineCount()
+        self.pieceStarts = None
+        self.modified = False
+        self.detached = False
+
+    def replaceIndex(self, index):
+        # Every line replaced by the lines of another index in one edit, for
+        # results too big to hold as text, like a sort spooled to a temp
+        # file. Untouched runs are no longer lines of the file then, so
+        # changes on disk cannot be merged in until the buffer is saved.
+        oldCount = self.count
+        self.close()
+        self.index = index
+        self.decoded.clear()
+        self.pieces = [(0, index.lineCount())]
+        self.count = index.lineCount()
+        self.pieceStarts = None
+        self.modified = True
+        self.version += 1
+        self.detached = True
+        if self.stats is not None:
+            self.stats.reset()
+        self.folds.replaced(0, oldCount, self.count)
+
+    def splitAt(self, line):
+        # make sure a piece starts at the line, returns the index of that piece
+        if line >= self.count:
+            return len(self.pieces)
+        i, start = self.locate(line)
+        if start == line:
+            return i
+        piece = self.pieces[i]
+        offset = line - start
+        if isinstance(piece, tuple):
+            before, after = (piece[0], piece[0] + offset), (piece[0] + offset, piece[1])
+        else:
+            before, after = piece[:offset], piece[offset:]
+        self.pieces[i:i + 1] = [before, after]
+        self.pieceStarts.insert(i + 1, line)
+        return i + 1
+
+    def setLine(self, line, text):
+        if line < 0 or line >= self.count:
+            raise IndexError("Line number out of range of buffer")
+        self.modified = True
+        self.version += 1
+        self.edited(line, line + 1, [[text]])
+        i, start = self.locate(line)
+        piece = self.pieces[i]
+        if isinstance(piece, list):
+            # already an edited line, no structural change
+            piece[line - start] = text
+            return
+        first = self.splitAt(line)
+        self.splitAt(line + 1)
+        self.splice(first, first + 1, [[text]])
+
+    def insertLines(self, line, lines):
+        if not lines:
+            return
+        self.modified = True
+        self.version += 1
+        self.edited(line, line, [lines])
+        first = self.splitAt(line)
+        self.count += len(lines)
+        self.splice(first, first, [list(lines)])
+        self.folds.replaced(line, line, len(lines))
+
+    def deleteLines(self, start, stop):
+        stop = min(stop, self.count)
+        if start >= stop:
+            return
+        self.modified = True
+        self.version += 1
+        self.edited(start, stop, [])
+        first = self.splitAt(start)
+        last = self.splitAt(stop)
+        self.count -= stop - start
+        self.splice(first, last, [])
+        self.folds.replaced(start, stop, 0)
+
+    def copyPieces(self, start, stop):
+        # Lines [start, stop) as pieces. Runs of untouched lines are only
+        # their line numbers and edited lines are copied, so the copy does not
+        # change with later edits and costs the same for any number of
+        # untouched lines.
+        pieces = []
+        line = max(start, 0)
+        stop = min(stop, self.count)
+        while line < stop:
+            i, pieceStart = self.locate(line)
+            piece = self.pieces[i]
+            end = min(stop, pieceStart + self.pieceLength(piece))
+            pieces.append(self.slicePiece(piece, line - pieceStart, end - pieceStart))
+            line = end
+        return pieces
+
+    def replacePieces(self, start, stop, pieces):
+        # Lines [start, stop) replaced by pieces like those of copyPieces,
+        # their runs have to be lines of this buffer's index
+        self.modified = True
+        self.version += 1
+        count = sum(self.pieceLength(piece) for piece in pieces)
+        self.edited(start, stop, pieces)
+        first = self.splitAt(start)
+        last = self.splitAt(stop)
+        self.count += count - (stop - start)
+        # lists are copied, splice extends them in place
+        self.splice(first, last, [piece if isinstance(piece, tuple) else list(piece) for piece in pieces])
+        self.folds.replaced(start, stop, count)
+
+    def replaceLines(self, edits):
+        # Many (start, stop, lines) replacements, sorted and not overlapping,
+        # in one pass over the pieces instead of a split and normalize each
+        if not edits:
+            return
+        self.modified = True
+        self.version += 1
+        # from the last edit back, so the line numbers of the rest hold
+        for start, stop, lines in reversed(edits):
+            self.edited(start, stop, [lines])
+        pieces = []
+        line = 0
+        i = 0
+        for piece in self.pieces:
+            length = self.pieceLength(piece)
+            end = line + length
+            # lines of the piece up to here are copied or replaced already
+            done = line
+            while i < len(edits) and edits[i][0] < end:
+                start, stop, lines = edits[i]
+                if start > done:
+                    pieces.append(self.slicePiece(piece, done - line, start - line))
+                if start >= line:
+                    # an edit going on from an earlier piece is in already
+                    pieces.append(list(lines))
+                if stop > end:
+                    done = end
+                    break
+                done = max(done, stop)
+                i += 1
+            if done < end:
+                pieces.append(self.slicePiece(piece, done - line, length))
+            line = end
+        # lines added at the very end
+        for start, stop, lines in edits[i:]:
+            pieces.append(list(lines))
+
+        self.count += sum(len(lines) - (stop - start) for start, stop, lines in edits)
+        self.pieces = pieces
+        self.normalize()
+        if self.folds:
+            # from the last edit back, so the line numbers of the rest hold
+            for start, stop, lines in reversed(edits):
+                self.folds.replaced(start, stop, len(lines))
+
+    def slicePiece(self, piece, start, stop):
+        if isinstance(piece, tuple):
+            return (piece[0] + start, piece[0] + stop)
+        return piece[start:stop]
+
+    def splice(self, first, last, pieces):
+        # Pieces [first, last) replaced by pieces, split at the edit already.
+        # Like normalize, but only the pieces next to the edit are joined and
+        # only the piece starts from there on are moved, so an edit costs the
+        # same for any number of earlier edits.
+        starts = self.startsOfPieces()
+        # counted first, merging extends the lists
+        shift = sum(self.pieceLength(piece) for piece in pieces)
+        shift -= sum(self.pieceLength(piece) for piece in self.pieces[first:last])
+        # the neighbours on either side may be edited lines to join with
+        low = max(first - 1, 0)
+        high = min(last + 1, len(self.pieces))
+        line = starts[low]
+        around = self.pieces[low:first] + pieces + self.pieces[last:high]
+        merged = []
+        for piece in around:
+            if self.pieceLength(piece) == 0:
+                continue
+            if merged and isinstance(piece, list) and isinstance(merged[-1], list):
+                merged[-1].extend(piece)
+            else:
+                merged.append(piece)
+        news = []
+        for piece in merged:
+            news.append(line)
+            line += self.pieceLength(piece)
+        self.pieces[low:high] = merged
+        starts[low:high] = news
+        if shift:
+            rest = low + len(news)
+            starts[rest:] = [start + shift for start in starts[rest:]]
+        if not self.pieces:
+            self.pieces = [[""]]
+            self.count = 1
+            self.pieceStarts = [0]
+
+    def normalize(self):
+        # join edited pieces with edited neighbours and drop empty pieces
+        self.pieces = [piece for piece in self.pieces if self.pieceLength(piece) > 0]
+        merged = []
+        for piece in self.pieces:
+            if merged and isinstance(piece, list) and isinstance(merged[-1], list):
+                merged[-1].extend(piece)
+            else:
+                merged.append(piece)
+        if not merged:
+            merged = [[""]]
+            self.count = 1
+        self.pieces = merged
+        self.pieceStarts = None
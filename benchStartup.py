@@ -0,0 +1,84 @@
+import argparse
+import fcntl
+import os
+import pty
+import select
+import statistics
+import struct
+import sys
+import tempfile
+import termios
+import time
+
+# launch to first frame, in seconds
+STARTUP_BUDGET = 0.5
+# the status bar colours only show up once the first frame is drawn
+FIRST_FRAME = b"\033[47m\033[30m"
+DEVICE_ATTRIBUTES_QUERY = b"\033[c"
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+def makeSampleFile(lines):
+    file = tempfile.NamedTemporaryFile("w", suffix=".log", delete=False)
+    for i in range(lines):
+        file.write(f"2024-01-01T00:00:00 INFO service line {i} with some payload text\n")
+    file.close()
+    return file.name
+
+def timeToFirstFrame(args, timeout=10):
+    start = time.perf_counter()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.execv(sys.executable, [sys.executable, MAIN] + args)
+    # an 80x24 terminal
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", 24, 80, 0, 0))
+
+    output = b""
+    try:
+        while FIRST_FRAME not in output:
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError("No frame drawn within %d seconds" % timeout)
+            ready, _, _ = select.select([fd], [], [], 0.05)
+            if not ready:
+                continue
+            data = os.read(fd, 65536)
+            if not data:
+                raise RuntimeError("Editor exited before drawing a frame")
+            output += data
+            # answer the capability probe like a terminal would
+            if DEVICE_ATTRIBUTES_QUERY in data:
+                os.write(fd, b"\033[?62;c")
+        return time.perf_counter() - start
+    finally:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        os.close(fd)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure launch to first frame of the editor.")
+    parser.add_argument("file", nargs="?", help="file to open, a generated log by default")
+    parser.add_argument("--lines", type=int, default=200000, help="lines in the generated file")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET)
+    args = parser.parse_args()
+
+    filename = args.file or makeSampleFile(args.lines)
+    failed = False
+    try:
+        for flags in ([], ["--large"]):
+            times = [timeToFirstFrame([filename] + flags) for _ in range(args.runs)]
+            median = statistics.median(times)
+            over = median > args.budget
+            failed = failed or over
+            name = " ".join(["main.py", os.path.basename(filename)] + flags)
+            print(f"{name}: median {median * 1000:.0f} ms, best {min(times) * 1000:.0f} ms"
+                  + (" OVER BUDGET" if over else ""))
+    finally:
+        if args.file is None:
+            os.unlink(filename)
+
+    print(f"budget {args.budget * 1000:.0f} ms")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,79 @@
-import ScrollRenderer
+import argparse
 import os
-import pyEdit
+import sys
 
-def main():
-    
-    Program = pyEdit.pyEdit()
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(prog="pyedit", description="A small terminal text editor.")
+    parser.add_argument("file", nargs="?", help="file to open, FILE:LINE opens it at a line, - pages stdin")
+    parser.add_argument("--readonly", action="store_true", help="open the file without allowing edits")
+    parser.add_argument("--large", action="store_true", help="memory map the file and index it in the background")
+    parser.add_argument("--follow", action="store_true", help="follow the file as it grows, like tail -f")
+    parser.add_argument("--server", action="store_true",
+                        help="run an editor server that later launches attach to and share buffers through")
+    parser.add_argument("--memory-limit", type=int, metavar="MB",
+                        help="unload unchanged background files once the loaded ones take more memory than this")
+    parser.add_argument("--standalone", action="store_true", help="do not attach to a running editor server")
+    return parser.parse_args(argv)
+
+def splitFileLine(path):
+    # FILE:LINE, unless a file with that exact name exists
+    name, sep, line = path.rpartition(":")
+    if sep and name and line.isdigit() and not os.path.exists(path):
+        return name, int(line)
+    return path, None
+
+def attachToServer(args):
+    # exit code of the editor in a running server, None when there is no
+    # server to attach to. Only the client is loaded, not the editor.
+    if os.name != "posix" or args.standalone:
+        return None
+    from EditorClient import attach, connect
+
+    client = connect()
+    if client is None:
+        return None
+    options = {"readonly": args.readonly, "large": args.large, "follow": args.follow, "cwd": os.getcwd()}
+    if args.file is not None:
+        filename, line = splitFileLine(args.file)
+        options["file"] = os.path.abspath(filename)
+        options["line"] = line
+    return attach(client, options)
+
+def main(argv=None):
+    args = parseArgs(sys.argv[1:] if argv is None else argv)
+
+    # megabytes on the command line, bytes for the buffer manager
+    memoryLimit = None if args.memory_limit is None else args.memory_limit * 1024 * 1024
+
+    if args.server:
+        import EditorServer
+
+        EditorServer.main(memoryLimit=memoryLimit)
+        return
+
+    # the pager reads our own stdin, it never goes to a server
+    pager = args.file == "-" or (args.file is None and not sys.stdin.isatty())
+    if not pager:
+        code = attachToServer(args)
+        if code is not None:
+            sys.exit(code)
+
+    import pyEdit
+
+    Program = pyEdit.pyEdit(memoryLimit=memoryLimit)
+    Program.readOnly = args.readonly
+    Program.large = args.large
+    Program.follow = args.follow
+
+    # "-" or a pipe on stdin opens the read-only pager
+    if pager:
+        Program.openPipe(sys.stdin.fileno())
+    elif args.file is not None:
+        filename, line = splitFileLine(args.file)
+        Program.open(filename)
+        Program.startLine = line
 
     Program.run()
 
 if __name__ == "__main__":
     main()
-
-    # wait for user to press enter
-    print("Press enter to exit")
-    input()
\ No newline at end of file
@@ -1,14 +1,50 @@
 import ScrollRenderer
-import asyncio
 import os
-import sys
+import re
+from BufferManager import MEMORY_LIMIT, BufferManager
+from CompressedFile import compressionFor
+from SessionCache import SessionCache
+from Folding import indentBlock
+from Gutter import Gutter
+from KeyMacro import CHECK_KEYS, RECORD_KEY, REPLAY_KEY, KeyMacro
+from Clipboard import EXPORT_LIMIT, LINE, MODES, copySelection, cutSelection, pasteClip, selectedSpan
+from Completion import SCAN_LINES, WordIndex, complete, prefixBefore
+from MultiCursor import Cursor, applyKey, moveCursors, nextOccurrence, typeKey, unique, wordAt
+from SplitView import MIN_HEIGHT, MIN_WIDTH, View, layout, leaves, removeView, splitView
+from TextBuffer import TextBuffer, fileIdentity
 from TUI import UnixTUI
 from TUI import WindowsTUI
-from TUI import BaseTUI
+
+# escape sequences of the keys we handle, by key name
+ESCAPE_SEQUENCES = {
+    "\x1b[A": "UP",
+    "\x1b[B": "DOWN",
+    "\x1b[C": "RIGHT",
+    "\x1b[D": "LEFT",
+    "\x1b[5~": "PGUP",
+    "\x1b[6~": "PGDN",
+    "\x1b[1;5H": "CTRL_HOME",
+    "\x1b[1;5F": "CTRL_END",
+    "\x1b[7^": "CTRL_HOME",
+    "\x1b[8^": "CTRL_END",
+    "\x1b[1;3B": "ALT_DOWN",
+}
 
 class pyEdit:
-    def __init__(self):
-        self.text = ""
+    def __init__(self, buffers=None, memoryLimit=None):
+        self.buffer = None
+        # every open file, the active one is self.document. An editor server
+        # hands every client the same one.
+        if buffers is None:
+            buffers = BufferManager(memoryLimit=MEMORY_LIMIT if memoryLimit is None else memoryLimit, sessions=SessionCache())
+            # a server streams a compressed file to every client showing it
+            buffers.onStream = lambda document, buffer: pyEdit.startLoading(buffers, document, buffer, lambda: [self])
+        self.buffers = buffers
+        self.document = None
+        # split views, the active one is self.view and its position lives
+        # in the attributes below while it has the focus
+        self.view = None
+        self.layoutRoot = None
         self.linesScrolled = 0
         self.pos = [0, 0] # [char x, line y]
         self.numChar = 0
@@ -16,37 +52,57 @@ class pyEdit:
         self.wantChar = 0
         self.debug = ""
         self.filename = ""
+        self.lineNumbers = True
+        self.promptText = None
+        # tail -f style following of the open file
+        self.follow = False
+        self.follower = None
+        self.readOnly = False
+        # pager mode, the buffer is filled from this pipe while we run
+        self.pipeFd = None
+        self.pipeOpen = False
+        self.lastSearch = ""
+        self.lastFilter = ""
+        # memory map big files and index them in the background
+        self.large = False
+        # line to open the file at, 1-based like FILE:LINE on the command line
+        self.startLine = None
+        # popup drawn over the text, like the file picker
+        self.overlayText = None
+        self.pickOnStart = False
+        # keyboard macro, replayed keys are read from replaying instead of
+        # the terminal and nothing is drawn until they run out
+        self.macro = KeyMacro()
+        self.replaying = None
+        self.replayedKeys = 0
+        # cursors besides the one at self.pos, and the other end of a
+        # selection at self.pos on the same line
+        self.cursors = []
+        self.anchor = None
+        # line marked as the other end of a manual fold
+        self.foldMark = None
+        # words offered in the completion popup, Tab takes the first
+        self.completions = []
+        # (mode, line, char) where the selection started, the cursor is its
+        # other end, and the last copied or cut Clip
+        self.selection = None
+        self.register = None
+        # the status bar shows the words and characters of the selection
+        self.selectionCounted = True
+        # attached to an editor server, whose buffers outlive this client
+        self.shared = False
+        # directory the file picker starts in, the client's when attached
+        self.cwd = None
+        # called after every key, the server redraws other clients with it
+        self.afterKey = None
+        # called with a document whose buffer was loaded again, the server
+        # has the other clients showing it draw from the new one
+        self.afterReload = None
+        # background tasks, cancelled when the editor finishes
+        self.tasks = []
 
-    def getFilePath(self):
-        # search current directory for a file
-        dir = os.listdir()
-
-        print("Choose a file to open: ")
-
-        textFiles = []
-
-        for file in dir:
-            if file.endswith(".txt"):
-                textFiles.append(file)
-
-        for i in range(len(textFiles)):
-            print(f"{i+1}: {textFiles[i]}")
-
-        # listen for user input of a number
-        while True:
-            try:
-                choice = int(input())
-                if choice > len(textFiles) or choice < 1:
-                    print("Invalid choice")
-                else:
-                    break
-            except:
-                print("Invalid choice")
-
-        return textFiles[choice-1]
-                
     def setWidthHeight(self):
-        size = os.get_terminal_size()
+        size = self.tui.terminal_size()
         self.width = size.columns
         self.height = size.lines
 
@@ -63,189 +119,1598 @@ class pyEdit:
             else:
                 raise NotImplementedError("Unsupported operating system")
 
-            if self.text == "":
-                self.filename = self.getFilePath()
-                file = open(self.filename, "r")
-                self.text = file.read()
-
-                file.close()
+            self.start(TUI())
 
-            self.tui = TUI()
-            self.tui.enable_raw_mode()
-            self.tui.hide_cursor()
-            self.tui.clear_screen()
-            self.tui.cursor_y = 2
-
-            self.setWidthHeight()
-            self.Scrollrenderer = ScrollRenderer.ScrollRenderer(self.width, self.height, self.linesScrolled, self.text)
+            import asyncio
 
             loop = asyncio.get_event_loop()
-            self.render()
             loop.run_until_complete(self.main())
         finally:
-            self.tui.move_cursor(0, 0)
-            self.tui.show_cursor()
-            self.tui.clear_screen()
-            self.tui.restore_terminal()
+            self.finish()
 
-    def Down(self):
-        if self.linesScrolled + 5 < len(self.text) - self.height and self.tui.cursor_y == self.height - 1:
-            self.linesScrolled += 5
-            self.tui.cursor_y -= 5
-            self.placeCursor(self.wantChar, self.tui.cursor_y)
-            self.render()
-        elif self.linesScrolled == len(self.text) - self.height and self.tui.cursor_y == self.height - 1:
-            self.linesScrolled = len(self.text) - self.height
-            self.tui.cursor_y += 1
-            self.placeCursor(self.wantChar, self.tui.cursor_y)
-            self.render()
+    def start(self, tui):
+        # set up the screen and draw the first frame, main then runs on the
+        # event loop, here or in an editor server
+        if self.buffer is None:
+            # no file given, start empty and open the file picker
+            self.open("")
+            self.pickOnStart = True
+
+        self.tui = tui
+        self.tui.enable_raw_mode()
+        self.tui.enter_alternate_screen()
+        self.tui.hide_cursor()
+        self.tui.clear_screen()
+        self.tui.cursor_y = 2
+
+        self.setWidthHeight()
+        self.Scrollrenderer = ScrollRenderer.ScrollRenderer(self.width, self.height, self.linesScrolled, self.buffer)
+        if self.lineNumbers:
+            self.Scrollrenderer.gutter = Gutter()
+        self.view = View(self.document, self.Scrollrenderer, self.tui.active_pane)
+        self.document.views += 1
+        self.layoutRoot = self.view
+        self.layoutViews()
+
+        # draw the first frame before loading the event loop machinery,
+        # at FILE:LINE or where the file was left last time
+        if self.startLine is not None and self.startLine <= self.buffer.lineCount():
+            self.moveToLine(self.startLine - 1, forceRender=True)
+            self.startLine = None
+        elif self.startLine is not None and self.buffer.index.complete():
+            # past the end, the last line
+            self.moveToLine(self.buffer.lineCount() - 1, forceRender=True)
+            self.startLine = None
         else:
-            self.tui.cursor_y += 1
-            self.placeCursor(self.wantChar, self.tui.cursor_y)  # Update the cursor position
-            self.render()
+            # a lazy index may not have reached FILE:LINE yet, indexFile
+            # moves there once it has
+            self.moveToLine(self.pos[1], forceRender=True)
 
+    def finish(self):
+        for task in self.tasks:
+            task.cancel()
+        if self.view is not None:
+            self.saveSessions()
+            # the documents stay loaded in a server for the next client
+            for view in leaves(self.layoutRoot):
+                view.document.views -= 1
+        self.tui.move_cursor(0, 0)
+        self.tui.show_cursor()
+        self.tui.clear_screen()
+        # back to the primary screen, as it was before we started
+        self.tui.exit_alternate_screen()
+        self.tui.restore_terminal()
 
+    def startTask(self, coroutine):
+        import asyncio
 
-    def Up(self):
-        if self.linesScrolled - 5 > 0 and self.tui.cursor_y == 2:
-            self.linesScrolled -= 5
-            self.tui.cursor_y += 5
-            self.placeCursor(self.wantChar, self.tui.cursor_y)
-            self.render()
-        elif self.linesScrolled > 0 and self.tui.cursor_y == 2:
-            self.linesScrolled = 0
-            self.tui.cursor_y -= 1
-            self.placeCursor(self.wantChar, self.tui.cursor_y)
-            self.render()
+        self.tasks = [task for task in self.tasks if not task.done()]
+        self.tasks.append(asyncio.ensure_future(coroutine))
+
+    def open(self, filename, buffer=None):
+        # open or switch to a file, the buffer manager loads it
+        self.buffers.large = self.large
+        self.setDocument(self.buffers.open(filename, buffer))
+
+    def setDocument(self, document):
+        self.document = document
+        self.buffer = document.buffer
+        self.filename = document.filename
+        self.linesScrolled = document.linesScrolled
+        self.pos = list(document.pos)
+        self.wantChar = document.wantChar
+        self.clearCursors()
+
+    def keepViewState(self):
+        # remember where we were in the document we are leaving
+        self.document.linesScrolled = self.linesScrolled
+        self.document.pos = list(self.pos)
+        self.document.wantChar = self.wantChar
+
+    def switchToDocument(self, document):
+        if document is self.document:
+            return
+        previous = self.document
+        self.keepViewState()
+
+        # the old file's follower stops with it
+        self.follower = None
+        self.follow = False
+
+        # the active view shows the new document from now on
+        previous.views -= 1
+        document.views += 1
+        self.view.document = document
+
+        self.setDocument(self.buffers.activate(document))
+        # an untouched empty buffer from starting without a file goes away
+        if not previous.filename and not previous.buffer.modified and not previous.views and not previous.piped \
+                and previous.source is None:
+            self.buffers.close(previous)
+
+        self.Scrollrenderer.buffer = self.buffer
+        self.linesScrolled = min(self.linesScrolled, self.maxScroll())
+        self.linesChanged(0)
+        self.moveToLine(self.pos[1], forceRender=True)
+
+    def switchToFile(self, filename):
+        # an already open file is switched to, anything else is loaded
+        self.switchToDocument(self.buffers.open(filename))
+
+    def closeDocument(self):
+        # returns True when the last buffer was closed
+        if self.shared:
+            # other clients may show it, the server keeps it loaded with
+            # any unsaved changes for the next client
+            return True
+        if self.buffer.modified:
+            self.debug = "Unsaved changes, save before closing"
+            self.renderStatus()
+            return False
+        if len(self.buffers.documents) == 1:
+            return True
+        closing = self.document
+        # filtered views of the document close with it
+        following = self.buffers.next(closing)
+        while following.source is closing:
+            following = self.buffers.next(following)
+        if following is closing:
+            return True
+        self.switchToDocument(following)
+        # an unnamed empty buffer is already closed by the switch
+        if closing in self.buffers.documents:
+            self.buffers.close(closing)
+        self.renderStatus()
+        return False
+
+    def saveSessions(self):
+        # every view's position goes to its document, the active view wins
+        # when a document is shown twice
+        for view in leaves(self.layoutRoot):
+            if view is not self.view:
+                view.document.linesScrolled = view.linesScrolled
+                view.document.pos = list(view.pos)
+                view.document.wantChar = view.wantChar
+        self.keepViewState()
+        self.buffers.saveSessions()
+
+    def viewHeight(self):
+        # rows of the active view, the whole screen below the status bar
+        # unless it was split
+        return self.view.height
+
+    def layoutViews(self):
+        # the first row is the status bar
+        layout(self.layoutRoot, 2, 1, self.width, self.height - 1)
+
+    def drawViews(self):
+        # the other views only read the rows an edit or a resize damaged
+        for view in leaves(self.layoutRoot):
+            if view is not self.view and view.needsDrawing():
+                view.draw(self.tui)
+
+    def damageViews(self, line, shifted=False):
+        # an edit in the active view, other views of the document redraw
+        # the changed line, or everything below it when lines shifted
+        for view in leaves(self.layoutRoot):
+            if view is not self.view and view.document is self.document:
+                view.linesChanged(line, shifted)
+
+    def splitCurrentView(self, vertical):
+        if self.tui.active_pane is None:
+            self.debug = "Split views need a VT terminal"
+            self.renderStatus()
+            return
+        if vertical:
+            room = self.view.width >= 2 * MIN_WIDTH + 1
+        else:
+            room = self.view.height >= 2 * MIN_HEIGHT + 1
+        if not room:
+            self.debug = "No room for another view"
+            self.renderStatus()
+            return
+
+        # the new view shares the document's buffer, only its position is new
+        renderer = ScrollRenderer.ScrollRenderer(0, 0, self.linesScrolled, self.buffer)
+        if self.lineNumbers:
+            renderer.gutter = Gutter()
+        view = View(self.document, renderer, self.tui.add_pane())
+        view.linesScrolled = self.linesScrolled
+        view.pos = list(self.pos)
+        view.wantChar = self.wantChar
+        self.document.views += 1
+        self.layoutRoot = splitView(self.layoutRoot, self.view, view, vertical)
+        self.focusView(view)
+
+    def focusView(self, view):
+        if view is self.view:
+            return
+        # the view losing the focus keeps its position, its pane still
+        # shows what was rendered last
+        old = self.view
+        old.linesScrolled = self.linesScrolled
+        old.pos = list(self.pos)
+        old.wantChar = self.wantChar
+        old.damaged = set()
+        old.drawnWidth = old.renderer.textWidth()
+
+        if view.document is not self.document:
+            # the old file's follower stops with it
+            self.follower = None
+            self.follow = False
+
+        self.view = view
+        self.document = self.buffers.activate(view.document)
+        self.buffer = self.document.buffer
+        self.filename = self.document.filename
+        self.linesScrolled = view.linesScrolled
+        self.pos = list(view.pos)
+        self.wantChar = view.wantChar
+        self.Scrollrenderer = view.renderer
+        self.Scrollrenderer.buffer = self.buffer
+        # extra cursors stay behind, the old pane stops showing them
+        if old.pane is not None:
+            old.pane.set_marks(None)
+        self.clearCursors()
+        self.tui.active_pane = view.pane
+
+        self.layoutViews()
+        self.moveToLine(self.pos[1], forceRender=True)
+
+    def closeView(self):
+        views = leaves(self.layoutRoot)
+        closing = self.view
+        following = views[(views.index(closing) + 1) % len(views)]
+        self.layoutRoot = removeView(self.layoutRoot, closing)
+        self.tui.remove_pane(closing.pane)
+        closing.document.views -= 1
+        self.focusView(following)
+
+    def maxScroll(self):
+        # the top line of the last page, folded lines take no rows
+        folds = self.buffer.folds
+        return folds.lineAt(max(folds.rowCount(self.buffer.lineCount()) - self.viewHeight(), 0))
+
+    def rowOf(self, line):
+        return self.buffer.folds.rowOf(line)
+
+    def lineAtRow(self, row):
+        # the line on a row counted from the top of the buffer, clamped to it
+        folds = self.buffer.folds
+        row = min(max(row, 0), folds.rowCount(self.buffer.lineCount()) - 1)
+        return folds.lineAt(row)
+
+    def scrollToLine(self, line):
+        # scroll so the line is visible, returns True when the view moved.
+        # Rows rather than lines, so folds count as one.
+        top = self.rowOf(self.linesScrolled)
+        row = self.rowOf(line)
+        if top <= row < top + self.viewHeight():
+            return False
+
+        if row == top - 1:
+            # arrow key just above the view, scroll up by 5 lines
+            top = row - 4
+        elif row == top + self.viewHeight():
+            # arrow key just below the view, scroll down by 5 lines
+            top = row - self.viewHeight() + 5
         else:
-            self.tui.cursor_y -= 1
-            self.placeCursor(self.wantChar, self.tui.cursor_y)
+            # a jump, show the line in the middle of the view
+            top = row - self.viewHeight() // 2
+
+        self.linesScrolled = self.lineAtRow(min(top, self.rowOf(self.maxScroll())))
+        return True
+
+    def moveToLine(self, line, forceRender=False):
+        # Only the target line is read from the buffer, so jumping to the
+        # last line of a huge file costs the same as moving down by one.
+        # A folded line moves the cursor to the start of its fold.
+        line = self.lineAtRow(self.rowOf(min(max(line, 0), self.buffer.lineCount() - 1)))
+        scrolled = self.scrollToLine(line)
+        self.placeCursor(self.wantChar, self.rowOf(line) - self.rowOf(self.linesScrolled) + 2)
+        if scrolled or forceRender:
             self.render()
+        else:
+            self.renderStatus()
+
+    def Down(self):
+        self.moveToLine(self.lineAtRow(self.rowOf(self.pos[1]) + 1))
+
+    def Up(self):
+        self.moveToLine(self.lineAtRow(self.rowOf(self.pos[1]) - 1))
+
+    def PageDown(self):
+        # move the view and the cursor by a whole page
+        top = min(self.rowOf(self.linesScrolled) + self.viewHeight(), self.rowOf(self.maxScroll()))
+        self.linesScrolled = self.lineAtRow(top)
+        self.moveToLine(self.lineAtRow(self.rowOf(self.pos[1]) + self.viewHeight()), forceRender=True)
+
+    def PageUp(self):
+        self.linesScrolled = self.lineAtRow(self.rowOf(self.linesScrolled) - self.viewHeight())
+        self.moveToLine(self.lineAtRow(self.rowOf(self.pos[1]) - self.viewHeight()), forceRender=True)
+
+    def ToggleFold(self):
+        # Open the fold at the cursor, or fold from the fold mark to the
+        # cursor, or fold the lines indented under the cursor line
+        folds = self.buffer.folds
+        line = self.pos[1]
+        if folds.unfold(line):
+            self.debug = "Unfolded"
+        elif self.foldMark is not None:
+            start, stop = sorted((self.foldMark, line))
+            self.foldMark = None
+            folds.fold(start, min(stop + 1, self.buffer.lineCount()))
+            line = start
+        else:
+            block = indentBlock(self.buffer, line)
+            if block is None:
+                self.debug = "Nothing indented under this line to fold"
+                self.renderStatus()
+                return
+            folds.fold(*block)
+        self.foldsChanged()
+        self.moveToLine(line, forceRender=True)
+
+    def SetFoldMark(self):
+        self.foldMark = self.pos[1]
+        self.debug = f"Fold mark at line {self.pos[1] + 1}, Ctrl-Y folds from it to the cursor"
+        self.renderStatus()
+
+    def foldsChanged(self):
+        # every view of the document shows other rows now
+        for view in leaves(self.layoutRoot):
+            if view.document is self.document:
+                view.damaged = None
+        self.linesScrolled = self.lineAtRow(self.rowOf(self.linesScrolled))
+
+    def JumpToStart(self):
+        self.wantChar = 1
+        self.moveToLine(0, forceRender=True)
+
+    def JumpToEnd(self):
+        self.wantChar = 1
+        self.moveToLine(self.buffer.lineCount() - 1, forceRender=True)
+
+    async def GotoLine(self):
+        answer = await self.prompt("Go to line: ")
+        if answer is None:
+            self.renderStatus()
+            return
+        try:
+            line = int(answer)
+        except ValueError:
+            self.debug = f"Not a line number: {answer}"
+            self.renderStatus()
+            return
+        self.moveToLine(line - 1, forceRender=True)
+
+    async def ReplayMacro(self):
+        if self.macro.recording is not None or not self.macro.keys:
+            self.debug = "No macro to replay, record one with Ctrl-K"
+            self.renderStatus()
+            return
+        answer = await self.prompt("Replay macro how many times (empty to the end): ")
+        if answer is None:
+            self.renderStatus()
+            return
+        try:
+            times = int(answer) if answer else None
+        except ValueError:
+            self.debug = f"Not a number: {answer}"
+            self.renderStatus()
+            return
+        # the main loop reads the keys through getKey
+        self.replayedKeys = 0
+        self.replaying = self.macro.replay(times, lambda: self.buffer.lineCount() - 1 - self.pos[1])
+
+    def finishReplay(self, stopped=False):
+        # one render for everything the replay changed
+        self.replaying = None
+        for view in leaves(self.layoutRoot):
+            view.damaged = None
+        if stopped:
+            self.debug = f"Replay stopped after {self.macro.runs} runs"
+        else:
+            self.debug = f"Replayed the macro {self.macro.runs} times"
+        self.render()
+
+    def clearCursors(self):
+        self.cursors = []
+        self.anchor = None
+        self.selection = None
+
+    def AddCursorBelow(self):
+        below = self.lineAtRow(self.rowOf(self.pos[1]) + 1)
+        if below == self.pos[1]:
+            return
+        # the cursor that was here stays, the main cursor moves down
+        self.cursors.append(Cursor(self.pos[1], self.pos[0]))
+        self.anchor = None
+        self.moveToLine(below, forceRender=True)
+
+    def SelectNextOccurrence(self):
+        line = self.buffer.getLine(self.pos[1])
+        if self.anchor is None:
+            # the first press selects the word at the cursor
+            word = wordAt(line, self.pos[0])
+            if word is None:
+                return
+            self.anchor = word[0]
+            self.wantChar = word[1] + 1
+            self.moveToLine(self.pos[1], forceRender=True)
+            return
+
+        start, end = sorted((self.anchor, self.pos[0]))
+        found = nextOccurrence(self.buffer, line[start:end], self.pos[1], end)
+        taken = {cursor.key() for cursor in self.cursors} | {(self.pos[1], start, end)}
+        if found is None or (found[0], found[1], found[1] + end - start) in taken:
+            self.debug = "No more occurrences"
+            self.renderStatus()
+            return
+        # the new occurrence gets the main cursor, so the view follows it
+        self.cursors.append(Cursor(self.pos[1], self.pos[0], self.anchor))
+        self.anchor = found[1]
+        self.wantChar = found[1] + end - start + 1
+        self.moveToLine(found[0], forceRender=True)
+
+    def editCursors(self, key):
+        # the key at every cursor as one transaction and one render
+        main = Cursor(self.pos[1], self.pos[0], self.anchor)
+        cursors = unique(self.cursors + [main], keep=main)
+        if key in ("\r", "\x7f"):
+            # splitting or joining at a fold start opens the fold
+            folds = self.buffer.folds
+            unfolded = [folds.unfold(cursor.line) for cursor in cursors if folds.hiddenLines(cursor.line)]
+            if key == "\x7f":
+                unfolded += [folds.unfold(cursor.line - 1) for cursor in cursors if cursor.char == 0]
+            if any(unfolded):
+                self.foldsChanged()
+        changed, shifted, edits = applyKey(self.buffer, cursors, key)
+        for start, old, new in reversed(edits):
+            self.wordsEdited(start, old, new)
+        self.cursors = [cursor for cursor in unique(cursors, keep=main) if cursor is not main]
+        self.anchor = None
+
+        if shifted:
+            self.linesChanged(changed[0])
+        else:
+            for line in changed:
+                self.damageViews(line)
+        self.wantChar = main.char + 1
+        self.moveToLine(main.line, forceRender=True)
+
+    def CycleSelection(self):
+        if self.selection is None:
+            self.clearCursors()
+            self.selection = (MODES[0], self.pos[1], self.pos[0])
+        else:
+            mode, line, char = self.selection
+            following = MODES.index(mode) + 1
+            self.selection = (MODES[following], line, char) if following < len(MODES) else None
+        self.render()
+
+    def selectionEnds(self):
+        # (mode, anchor, cursor) of the selection, the cursor line without one
+        if self.selection is None:
+            return LINE, (self.pos[1], 0), (self.pos[1], 0)
+        mode, line, char = self.selection
+        return mode, (line, char), (self.pos[1], self.pos[0])
+
+    def Copy(self):
+        # Copying keeps runs of untouched lines by their line numbers, only
+        # text small enough for the terminal clipboard is put together
+        self.register = copySelection(self.buffer, *self.selectionEnds())
+        self.selection = None
+        lines = self.register.lineCount()
+        if self.register.size() <= EXPORT_LIMIT:
+            self.tui.set_clipboard(self.register.text())
+            self.debug = f"Copied {lines} lines"
+        else:
+            self.debug = f"Copied {lines} lines, too big for the system clipboard"
+        self.render()
+
+    def Cut(self):
+        if self.isReadOnly() or self.document.source is not None or self.stillLoading():
+            return
+        mode, anchor, cursor = self.selectionEnds()
+        self.register = copySelection(self.buffer, mode, anchor, cursor)
+        self.selection = None
+        start, stop, pieces = cutSelection(self.buffer, mode, anchor, cursor)
+        self.replaceRange(start, stop, pieces)
+        line, char = min(anchor, cursor)
+        self.debug = f"Cut {self.register.lineCount()} lines"
+        self.wantChar = (0 if mode == LINE else char) + 1
+        self.moveToLine(line, forceRender=True)
+
+    def Paste(self):
+        if self.isReadOnly() or self.document.source is not None or self.stillLoading() or self.register is None:
+            return
+        self.selection = None
+        (start, stop, pieces), (line, char) = pasteClip(self.buffer, self.register, self.pos[1], self.pos[0])
+        self.replaceRange(start, stop, pieces)
+        self.wantChar = char + 1
+        self.moveToLine(line, forceRender=True)
+
+    def replaceRange(self, start, stop, pieces):
+        # Lines [start, stop) replaced by pieces in one buffer edit. Runs of
+        # untouched lines go in without being read, so are not counted for
+        # completion when there are many of them.
+        self.clearCursors()
+        words = self.document.words
+        if words is not None and words.buffer is not self.buffer:
+            words = None
+        count = sum(piece[1] - piece[0] if isinstance(piece, tuple) else len(piece) for piece in pieces)
+        small = stop - start + count <= SCAN_LINES
+        old = self.buffer.getLines(start, stop) if words is not None and small else None
+        self.buffer.replacePieces(start, stop, pieces)
+        if words is not None and small:
+            words.edited(start, old, self.buffer.getLines(start, start + count))
+        elif words is not None:
+            words.moved(start, stop - start, count)
+        self.linesChanged(start)
+
+    def cursorMarks(self):
+        # rows of the active view with the extra cursors and the selections
+        # filled in, None when there is only the main cursor
+        if not self.cursors and self.anchor is None and self.selection is None:
+            return None
+        from TUI import CLEAR
+
+        folds = self.buffer.folds
+        top = self.rowOf(self.linesScrolled)
+        height = self.viewHeight()
+        width = self.Scrollrenderer.textWidth()
+        rows = {}
+        if self.selection is not None:
+            # only the rows on screen are looked at, however much is selected
+            mode, line, char = self.selection
+            for row in range(max(min(height, folds.rowCount(self.buffer.lineCount()) - top), 0)):
+                shown = folds.lineAt(top + row)
+                text = self.buffer.getLine(shown)
+                span = selectedSpan(mode, (line, char), (self.pos[1], self.pos[0]), shown, len(text))
+                if span is None:
+                    continue
+                cells = rows.setdefault(row, [CLEAR] * width)
+                for i in range(span[0], min(span[1], width)):
+                    cells[i] = text[i] if i < len(text) else " "
+        # cursors on folded away lines are not shown
+        marks = [cursor for cursor in self.cursors
+                 if top <= self.rowOf(cursor.line) < top + height and folds.lineAt(self.rowOf(cursor.line)) == cursor.line]
+        if self.anchor is not None:
+            marks.append(Cursor(self.pos[1], self.pos[0], self.anchor))
+        for cursor in marks:
+            text = self.buffer.getLine(cursor.line)
+            row = rows.setdefault(self.rowOf(cursor.line) - top, [CLEAR] * width)
+            start, end = cursor.span()
+            if start == end:
+                # a cursor shows as the character under it
+                end += 1
+            for char in range(start, min(end, width)):
+                row[char] = text[char] if char < len(text) else " "
+        return ["".join(rows[i]) if i in rows else "" for i in range(height)]
+
+    async def prompt(self, label):
+        # read an answer in the status bar, None when cancelled with escape
+        answer = ""
+        while True:
+            self.promptText = label + answer
+            self.renderStatus()
+            key = await self.getKey()
+            if key == "\r":
+                break
+            elif key == "ESC" or key == "\x03":
+                answer = None
+                break
+            elif key == "\x7f":
+                answer = answer[:-1]
+            elif key is not None and len(key) == 1 and key.isprintable():
+                answer += key
+        self.promptText = None
+        return answer
 
     async def main(self):
+        import asyncio
+
+        if self.follow:
+            self.startFollowing()
+        if self.pickOnStart:
+            await self.PickFile()
+        if self.pipeFd is not None:
+            from PipeReader import PipeReader
+
+            self.pipeOpen = True
+            PipeReader(self.pipeFd, asyncio.get_event_loop(), self.pipedData(), self.pipeClosed).start()
+        if not self.buffer.index.complete():
+            self.startTask(self.indexFile())
+        self.startTask(self.watchFiles())
+        self.startTask(self.indexWords())
+        self.startTask(self.countStatistics())
+        self.startTask(self.watchFilters())
+
         while True:
             # listen for down arrow key
             key = await self.getKey()
+            # any key but Tab closes the completion popup, typing more of
+            # the word opens it again
+            completing = bool(self.completions)
+            if completing and key != "\t":
+                self.completions = []
+                self.overlayText = None
+            # extra cursors move along with the arrow keys, their marks are
+            # drawn once the main cursor moved too
+            marksMoved = key in ("DOWN", "UP", "LEFT", "RIGHT") and (self.cursors or self.anchor is not None)
+            # and the selection follows every cursor move
+            selecting = self.selection is not None and key in ("DOWN", "UP", "LEFT", "RIGHT", "PGDN", "PGUP",
+                                                              "CTRL_HOME", "CTRL_END")
+            if marksMoved:
+                moveCursors(self.buffer, self.cursors, key)
+                self.cursors = unique(self.cursors)
+                self.anchor = None
+
             # Bugged beyond belief right now
             if key == "DOWN":
                 self.Down()
             
             elif key == "UP":
                 self.Up()
+
+            # alt down, add a cursor on the next line
+            elif key == "ALT_DOWN":
+                self.AddCursorBelow()
+
+            # control y, fold or unfold at the cursor
+            elif key == "\x19":
+                self.ToggleFold()
+
+            # control b, mark the start of a manual fold
+            elif key == "\x02":
+                self.SetFoldMark()
+
+            # control d, select the word, then add its next occurrence
+            elif key == "\x04":
+                self.SelectNextOccurrence()
+
+            # escape, back to a single cursor
+            elif key == "ESC":
+                if self.cursors or self.anchor is not None or self.selection is not None:
+                    self.clearCursors()
+                    self.render()
+
+            # control u, select from here, again for lines, blocks and off
+            elif key == "\x15":
+                self.CycleSelection()
+
+            # control a, copy the selection or the line
+            elif key == "\x01":
+                self.Copy()
+
+            # control x, cut the selection or the line
+            elif key == "\x18":
+                self.Cut()
+
+            # control v, paste
+            elif key == "\x16":
+                self.Paste()
+
+            elif key == "PGDN":
+                self.PageDown()
+
+            elif key == "PGUP":
+                self.PageUp()
+
+            elif key == "CTRL_HOME":
+                self.JumpToStart()
+
+            elif key == "CTRL_END":
+                self.JumpToEnd()
+
+            # control p
+            elif key == "\x10":
+                await self.PickFile()
+
+            # control n
+            elif key == "\x0e":
+                self.switchToDocument(self.buffers.next(self.document))
+
+            # control q, closes the view when the screen is split
+            elif key == "\x11":
+                if len(leaves(self.layoutRoot)) > 1:
+                    self.closeView()
+                elif self.closeDocument():
+                    break
+
+            # control e, split with the new view below
+            elif key == "\x05":
+                self.splitCurrentView(False)
+
+            # control r, split with the new view to the right
+            elif key == "\x12":
+                self.splitCurrentView(True)
+
+            # control o, move to the next view
+            elif key == "\x0f":
+                views = leaves(self.layoutRoot)
+                self.focusView(views[(views.index(self.view) + 1) % len(views)])
+
+            # control w, or / when paging
+            elif key == "\x17" or (self.isReadOnly() and key == "/"):
+                await self.Find()
+
+            # control l, show only the lines matching a pattern
+            elif key == "\x0c":
+                await self.Filter()
+
+            # control backslash, sort, de-duplicate or reverse lines
+            elif key == "\x1c":
+                await self.LineOperation()
+
+            # unknown escape sequence
+            elif key is None:
+                pass
+
+            # control g
+            elif key == "\x07":
+                await self.GotoLine()
+
+            # control k, start or stop recording a macro
+            elif key == RECORD_KEY:
+                if self.macro.recording is None:
+                    self.macro.start()
+                elif self.macro.stop():
+                    self.debug = f"Recorded a macro of {len(self.macro.keys)} keys"
+                self.renderStatus()
+
+            # control t, replay the macro
+            elif key == REPLAY_KEY:
+                await self.ReplayMacro()
+
+            # control f
+            elif key == "\x06":
+                if self.follow:
+                    self.follow = False
+                else:
+                    self.startFollowing()
+                self.renderStatus()
             
             elif key == "LEFT":
                 if self.tui.cursor_x > 0:
                     self.tui.cursor_x -= 1
                     self.wantChar = self.tui.cursor_x
                     self.placeCursor(self.tui.cursor_x, self.tui.cursor_y)
-                    self.render()
+                    self.renderStatus()
             
             elif key == "RIGHT":
-                if self.tui.cursor_x < self.width - 1:
+                if self.tui.cursor_x < self.Scrollrenderer.textWidth() - 1:
                     self.tui.cursor_x += 1
                     self.wantChar = self.tui.cursor_x
                     self.placeCursor(self.tui.cursor_x, self.tui.cursor_y)
-                    self.render()
+                    self.renderStatus()
             # if key == control c
             elif key == "\x03":
                 # throw exception
                 raise KeyboardInterrupt
+            elif self.document.source is not None:
+                # a filtered view is read only, enter goes to the line
+                if key == "\r":
+                    self.JumpToSource()
+            elif self.isReadOnly():
+                # a pager quits with q, everything else is ignored
+                if key == "q" or key == "SAVE":
+                    break
             # if key == backspace
             elif key == "\x7f":
                 self.deleteChar()
             # if key == enter
             elif key == "SAVE":
-                self.Save()
-                break
+                if self.stillLoading():
+                    continue
+                asked = not self.filename
+                if asked:
+                    # started without a file, ask where to save
+                    self.filename = await self.prompt("Save as: ") or ""
+                    self.document.filename = self.filename
+                    self.document.compression = compressionFor(self.filename)
+                    if not self.filename:
+                        self.renderStatus()
+                        continue
+                if not await self.confirmOverwrite():
+                    self.renderStatus()
+                    continue
+                if not self.Save():
+                    if asked:
+                        # the next save asks for another name
+                        self.filename = self.document.filename = ""
+                        self.document.compression = None
+                    self.renderStatus()
+                    continue
+                # only quit once no other buffer has unsaved changes
+                unsaved = self.buffers.modified()
+                if not unsaved or self.shared:
+                    break
+                self.switchToDocument(unsaved[0])
+                self.debug = f"{len(unsaved)} buffer(s) with unsaved changes"
+                self.renderStatus()
             elif key == "\r":
                 self.insertChar("\n")
+            # tab, take the first completion
+            elif key == "\t" and self.completions:
+                self.AcceptCompletion()
             else:
                 self.insertChar(key)
 
+            if marksMoved or selecting:
+                self.render()
+            elif completing and not self.completions:
+                self.tui.render_overlay(None)
+            if self.afterKey is not None:
+                self.afterKey(self)
+
     def Save(self):
-        file = open(self.filename, "w")
-        file.write(self.text)
-        file.close()
+        # Write next to the file and move it into place, so a crash never
+        # leaves half a file and a memory mapped buffer keeps its old bytes.
+        # A symlink is followed, so the link stays and its target is saved.
+        # Returns False when the file could not be written, the buffer and
+        # its changes stay as they were.
+        path = os.path.realpath(self.filename)
+        tempName = path + ".pyedit-save"
+        try:
+            if self.document.compression:
+                self.saveCompressed(path, tempName)
+            else:
+                self.saveFile(path, tempName)
+        except BaseException as error:
+            # a failed write leaves the file as it was and no temp file behind
+            if os.path.exists(tempName):
+                os.unlink(tempName)
+            if not isinstance(error, OSError):
+                raise
+            self.debug = f"Could not save {self.filename}: {error.strerror or error}"
+            return False
+        self.document.changedOnDisk = False
 
-    def insertChar(self, char):
-        # self.text = self.text[:self.pos[0]] + char + self.text[self.pos[0]:]
+        if self.follower is not None:
+            # our own write is not new data to follow
+            self.follower.size = os.path.getsize(path)
+        return True
+
+    def replaceFile(self, tempName, path):
+        import shutil
+
+        # the saved file keeps the permissions of the one it replaces
+        if os.path.exists(path):
+            shutil.copymode(path, tempName)
+        os.replace(tempName, path)
+
+    def saveFile(self, path, tempName):
+        import mmap
+        from array import array
+        from LineIndex import LineIndex
+
+        # untouched lines are copied byte for byte, with their own line
+        # endings and encoding, only edited lines are encoded
+        starts = array("q", [0])
+        with open(tempName, "wb") as file:
+            for chunk in self.buffer.encodedChunks(starts):
+                file.write(chunk)
+        self.replaceFile(tempName, path)
+        # what we wrote is what later changes on disk are compared with, it
+        # is mapped like a large file instead of kept as a second copy
+        file = open(path, "rb")
+        identity = fileIdentity(os.fstat(file.fileno()))
+        if identity[0] == 0:
+            # an empty file cannot be mapped
+            file.close()
+            file, data = None, bytearray()
+        else:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        index = LineIndex(data, starts=starts, indexed=len(data))
+        self.buffer.replaceBase(index, identity)
+        # grown through it like a memory mapped buffer when followed
+        self.buffer.mappedFile = file
+
+    def saveCompressed(self, path, tempName):
+        from array import array
+        from CompressedFile import MemberData, writeCompressed
+        from LineIndex import LineIndex
+
+        # compressed a chunk at a time while the line index is built, the
+        # whole text is never in memory
+        starts = array("q", [0])
+        kind = self.document.compression
+        seekPoints = writeCompressed(tempName, kind, self.buffer.encodedChunks(starts))
+        self.replaceFile(tempName, path)
+
+        file = open(path, "rb")
+        data = MemberData(file, kind, seekPoints)
+        index = LineIndex(data, starts=starts, indexed=len(data))
+        self.buffer.replaceBase(index, fileIdentity(os.fstat(file.fileno())))
+        self.document.seekPoints = seekPoints
+
+    async def confirmOverwrite(self):
+        # another program changed the file since we loaded or saved it
+        try:
+            identity = fileIdentity(os.stat(self.filename))
+        except OSError:
+            return True
+        if identity == self.buffer.identity and not self.document.changedOnDisk:
+            return True
+        answer = await self.prompt("File changed on disk, overwrite it? (y/n) ")
+        return answer is not None and answer.lower().startswith("y")
+
+    async def watchFiles(self):
+        import asyncio
+        from FileWatcher import POLL_INTERVAL, readChanges
+
+        # Poll the open files for changes by other programs. Only a stat runs
+        # on the loop, reading and comparing the new content happens on a
+        # worker thread.
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            for document in list(self.buffers.documents):
+                buffer = document.buffer
+                if buffer is None or buffer.identity is None or document.changedOnDisk or document.loading:
+                    continue
+                if document is self.document and self.follower is not None:
+                    # follow mode reads the new data itself
+                    continue
+                try:
+                    identity = fileIdentity(os.stat(document.filename))
+                except OSError:
+                    continue
+                if identity == buffer.identity:
+                    continue
+
+                if buffer.mappedFile is not None or document.compression or buffer.detached:
+                    # the mapping may already show the new bytes, and a
+                    # compressed file or a detached index cannot be compared
+                    # by its bytes
+                    self.reloadChanged(document)
+                    continue
+                changes = await loop.run_in_executor(None, readChanges, document.filename, buffer.index)
+                # the buffer may have been reloaded or closed in the meantime
+                if changes is not None and document.buffer is buffer:
+                    self.fileChanged(document, changes)
+
+    def fileChanged(self, document, changes):
+        buffer = document.buffer
+        if changes[0] == "append":
+            first = buffer.count - 1
+            buffer.appendData(changes[2])
+            buffer.identity = changes[1]
+            stop = newStop = first
+        else:
+            _, identity, index, first, stop, newStop = changes
+            if not buffer.rebase(index, identity, first, stop, newStop):
+                document.changedOnDisk = True
+                self.debug = f"{document.name()} changed on disk, your edits are kept"
+                self.renderStatus()
+                return
+        self.movedOnDisk(document, first, stop, newStop)
+
+    def reloadChanged(self, document):
+        if document.buffer.modified:
+            document.changedOnDisk = True
+            self.debug = f"{document.name()} changed on disk, your edits are kept"
+            self.renderStatus()
+            return
+        if document is self.document:
+            import asyncio
+
+            document.buffer.close()
+            document.keptIndex = None
+            self.buffers.load(document)
+            self.buffer = document.buffer
+            self.Scrollrenderer.buffer = self.buffer
+            if not self.buffer.index.complete():
+                self.startTask(self.indexFile())
+            self.movedOnDisk(document, 0, 0, 0)
+            if self.afterReload is not None:
+                self.afterReload(self, document)
+        elif not document.views:
+            # loaded again, and indexed, when it is switched to
+            self.buffers.unload(document)
 
-        # split text into lines
-        text = self.text.splitlines()
+    def bufferReplaced(self, document):
+        # another client loaded the document again and closed the buffer
+        # this one drew from
+        for view in leaves(self.layoutRoot):
+            if view.document is document:
+                view.damaged = None
+        if document is not self.document:
+            return
+        self.buffer = document.buffer
+        self.Scrollrenderer.buffer = self.buffer
+        self.linesChanged(0)
+        self.linesScrolled = min(self.linesScrolled, self.maxScroll())
+        self.moveToLine(min(self.pos[1], self.buffer.lineCount() - 1), forceRender=True)
 
-        # get the line the cursor is on
-        line = text[self.pos[1]]
+    def movedOnDisk(self, document, first, stop, newStop):
+        # lines after the changed ones moved, positions there move with them
+        if stop > first or newStop > first:
+            # what the replaced lines held is gone, count the words again
+            document.words = None
+        def moved(line):
+            return line + newStop - stop if line >= stop else line
 
-        # if char == "\n":
-        #     # move the cursor to the start of the next line
-        #     self.tui.cursor_y += 1
-        #     self.tui.cursor_x = 0
+        for view in leaves(self.layoutRoot):
+            if view.document is document and view is not self.view:
+                view.linesScrolled = moved(view.linesScrolled)
+                view.pos[1] = moved(view.pos[1])
+                view.damaged = None
+        if document is not self.document:
+            document.linesScrolled = moved(document.linesScrolled)
+            document.pos[1] = moved(document.pos[1])
+            self.renderStatus()
+            return
 
-        #     self.pos = [0, self.pos[1] + 1]
-        # get the char the cursor is on and add the new char
-        line = line[:self.pos[0]] + char + line[self.pos[0]:]
+        self.linesScrolled = moved(self.linesScrolled)
+        self.clearCursors()
+        self.linesChanged(first)
+        self.moveToLine(moved(self.pos[1]), forceRender=True)
 
-        # replace the line with the new line
-        text[self.pos[1]] = line
+    async def PickFile(self):
+        from FilePicker import FileIndex, FuzzyMatcher
 
-        # join the lines back together
-        self.text = "\n".join(text)
+        # the tree is walked on a thread, matches show up as they are found
+        index = FileIndex(self.cwd or os.getcwd())
+        index.start()
+        matcher = FuzzyMatcher(index)
+        query = ""
+        selected = 0
+        chosen = None
+
+        while True:
+            busy = matcher.step()
+            choices = matcher.best(max(self.viewHeight() - 2, 1))
+            selected = min(selected, max(len(choices) - 1, 0))
+            self.drawPicker(query, choices, selected, len(matcher.matches), len(index.files), busy)
+
+            # keep matching between keys while there is work left
+            key = await self.getKey(timeout=0 if busy else None)
+            if key is None:
+                continue
+            if key == "\r":
+                if choices:
+                    chosen = choices[selected]
+                break
+            elif key == "ESC" or key == "\x03":
+                break
+            elif key == "UP":
+                selected = max(selected - 1, 0)
+            elif key == "DOWN":
+                selected += 1
+            elif key == "\x7f":
+                query = query[:-1]
+                matcher.setQuery(query)
+            elif len(key) == 1 and key.isprintable():
+                query += key
+                matcher.setQuery(query)
+
+        self.overlayText = None
+        if chosen is None:
+            self.render()
+        else:
+            self.switchToFile(os.path.join(index.root, chosen))
+
+    def drawPicker(self, query, choices, selected, matched, total, busy):
+        width = max(min(self.width - 4, 80), 20)
+        lines = [f" Open: {query}".ljust(width)]
+        lines.append(f" {matched} of {total} files{' ...' if busy else ''}".ljust(width))
+        for i, choice in enumerate(choices):
+            marker = ">" if i == selected else " "
+            lines.append(f"{marker} {choice}"[:width].ljust(width))
+        self.overlayText = "\n".join(lines)
+        self.tui.render_overlay(self.overlayText)
+
+    def openPipe(self, fd):
+        from LineIndex import LineIndex
+        from SpooledData import SpooledData
+
+        # read-only pager over piped input, filled in chunks by a reader thread
+        self.open("", TextBuffer(LineIndex(SpooledData())))
+        self.document.piped = True
+        self.document.readOnly = True
+        self.pipeFd = fd
+
+    @staticmethod
+    def startLoading(buffers, document, buffer, editors):
+        import asyncio
+        from CompressedFile import DecompressReader
+
+        # a compressed file is inflated on a reader thread and arrives in
+        # chunks like piped input, editors() are the ones to show it
+        def loaded(data):
+            if document.buffer is not buffer or document not in buffers.documents:
+                # closed or reloaded in the meantime
+                return
+            shown = editors()
+            pinned = [editor.document is document and editor.pinnedToBottom() for editor in shown]
+            changedFrom = buffer.appendData(data)
+            for editor, follow in zip(shown, pinned):
+                editor.documentGrew(document, changedFrom, follow)
+
+        def finished():
+            if document.buffer is not buffer:
+                return
+            document.loading = False
+            document.seekPoints = reader.seekPoints
+            for editor in editors():
+                editor.renderStatus()
+
+        loop = asyncio.get_event_loop()
+        reader = DecompressReader(document.filename, document.compression, loop, loaded, finished)
+        # the loop may not run yet when the file is opened from the command line
+        loop.call_soon(reader.start)
+
+    def documentGrew(self, document, changedFrom, pinned):
+        if document is self.document:
+            self.bufferGrew(changedFrom, pinned)
+            return
+        for view in leaves(self.layoutRoot):
+            if view.document is document:
+                view.linesChanged(changedFrom, True)
+
+    def isReadOnly(self):
+        return self.readOnly or self.document.readOnly
+
+    def stillLoading(self):
+        if self.document.loading:
+            self.debug = "Still decompressing, try again in a moment"
+            self.renderStatus()
+        return self.document.loading
+
+    def pipedData(self):
+        # stdin goes to the pager document, not whichever file is active
+        document, buffer = self.document, self.buffer
+
+        def read(data):
+            if document.buffer is not buffer or document not in self.buffers.documents:
+                # the pager was closed
+                return
+            pinned = document is self.document and self.pinnedToBottom()
+            self.documentGrew(document, buffer.appendData(data), pinned)
+
+        return read
+
+    def pipeClosed(self):
+        self.pipeOpen = False
+        self.renderStatus()
+
+    async def Find(self):
+        answer = await self.prompt("Search: ")
+        if answer == "":
+            # search again for the last text
+            answer = self.lastSearch
+        if not answer:
+            self.renderStatus()
+            return
+        self.lastSearch = answer
+
+        line = self.buffer.find(answer, self.pos[1] + 1)
+        if line is None:
+            self.debug = f"Not found: {answer}"
+            self.renderStatus()
+            return
+        self.wantChar = self.buffer.getLine(line).find(answer) + 1
+        self.moveToLine(line, forceRender=True)
+
+    async def Filter(self):
+        from LineFilter import LineFilter
+
+        answer = await self.prompt("Filter lines (text or /regex/): ")
+        if answer == "":
+            answer = self.lastFilter
+        if not answer:
+            self.renderStatus()
+            return
+        self.lastFilter = answer
+        # filtering a filtered view filters its source again
+        source = self.document.source or self.document
+        for document in self.buffers.documents:
+            if document.source is source and document.buffer.text == answer:
+                self.switchToDocument(document)
+                return
+        try:
+            lines = LineFilter(source, answer)
+        except re.error as error:
+            self.debug = f"Bad expression: {error}"
+            self.renderStatus()
+            return
+        lines.refresh()
+        self.switchToDocument(self.buffers.openFilter(source, lines))
+
+    def JumpToSource(self):
+        # the source shows where the pattern is on the line of the row
+        line = self.buffer.sourceLine(self.pos[1])
+        if line is None:
+            return
+        source = self.document.source
+        char = self.buffer.matchColumn(source.buffer.getLine(line))
+        source.pos = [char, line]
+        source.wantChar = char + 1
+        self.switchToDocument(source)
+
+    async def watchFilters(self):
+        import asyncio
+        from LineFilter import POLL_INTERVAL
+
+        # Filtered views get their new matches drawn as the workers find
+        # them, and search again once their source changed
+        shown = {}
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            states = {}
+            for document in list(self.buffers.documents):
+                if document.source is None:
+                    continue
+                lines = document.buffer
+                lines.refresh()
+                states[document] = (lines.generation, len(lines.matches), lines.done)
+                if shown.get(document) != states[document]:
+                    self.filterChanged(document, shown.get(document), states[document])
+            shown = states
+
+    def filterChanged(self, document, old, new):
+        for view in leaves(self.layoutRoot):
+            if view.document is document and view is not self.view:
+                view.damaged = None
+        if document is not self.document or self.replaying is not None:
+            self.renderStatus()
+        elif old is not None and old[0] == new[0] and old[1] >= self.rowOf(self.linesScrolled) + self.viewHeight():
+            # the new rows are below the view, only the count changed
+            self.renderStatus()
+        else:
+            self.moveToLine(self.pos[1], forceRender=True)
+
+    async def LineOperation(self):
+        from LineSort import OPERATIONS
+
+        if self.isReadOnly() or self.document.source is not None or self.stillLoading():
+            return
+        answer = await self.prompt("Lines: s sort, u unique, r reverse: ")
+        operation = OPERATIONS.get((answer or "").strip()[:1].lower())
+        if operation is None:
+            self.renderStatus()
+            return
+        # the selected lines, or all of them
+        start, stop = 0, self.buffer.lineCount()
+        if self.selection is not None:
+            mode, anchor, cursor = self.selectionEnds()
+            start, stop = min(anchor, cursor)[0], max(anchor, cursor)[0] + 1
+        self.selection = None
+        self.debug = f"{operation} of {stop - start} lines running"
+        self.render()
+        self.startTask(self.runLineOperation(operation, start, stop))
+
+    async def runLineOperation(self, operation, start, stop):
+        import asyncio
+        import threading
+        from LineSort import runOperation
+
+        # The lines are read and sorted on a worker thread from a copy of
+        # their pieces, and the result goes in as one edit, unless the
+        # buffer was edited in the meantime
+        document, buffer = self.document, self.buffer
+        version = buffer.version
+        pieces = buffer.copyPieces(start, stop)
+        before, after = buffer.copyPieces(0, start), buffer.copyPieces(stop, buffer.lineCount())
+        newline = buffer.newline.encode("ascii")
+        cancelled = threading.Event()
+        loop = asyncio.get_event_loop()
+        try:
+            result = await loop.run_in_executor(None, runOperation, operation, buffer.index, buffer.encoding, pieces,
+                                                before, after, newline, buffer.endsWithNewline(), cancelled.is_set)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        except (OSError, ValueError) as error:
+            # out of disk space, or the file was closed under the worker
+            self.debug = f"{operation} of lines failed: {error}"
+            self.renderStatus()
+            return
+        if result is None:
+            return
+        if document.buffer is not buffer or buffer.version != version:
+            self.debug = f"The buffer was edited during the {operation}, nothing was changed"
+            self.renderStatus()
+            return
+
+        kind, value = result
+        if kind == "lines" and document is self.document:
+            self.replaceRange(start, stop, [value])
+        else:
+            if kind == "lines":
+                buffer.replacePieces(start, stop, [value])
+            else:
+                buffer.replaceIndex(value)
+            # the words are counted again
+            document.words = None
+            for view in leaves(self.layoutRoot):
+                if view.document is document:
+                    view.damaged = None
+            if document is self.document:
+                self.linesChanged(0)
+        self.debug = f"{operation} of {stop - start} lines done"
+        if document is self.document:
+            self.moveToLine(self.pos[1], forceRender=True)
+        else:
+            self.renderStatus()
+
+    def startFollowing(self):
+        if self.document.compression:
+            self.debug = "Cannot follow a compressed file"
+            self.renderStatus()
+            return
+        self.follow = True
+        # piped input is followed as it arrives, there is no file to poll
+        if self.follower is None and self.filename:
+            import asyncio
+            from TailFollower import TailFollower
+
+            self.follower = TailFollower(self.filename, self.buffer.index.indexed)
+            self.startTask(self.followFile())
+
+    async def followFile(self):
+        import asyncio
+
+        # poll the file size on the event loop next to the key reader, until
+        # another file is opened
+        follower = self.follower
+        while self.follower is follower:
+            await asyncio.sleep(follower.interval)
+            if not self.follow or self.follower is not follower:
+                continue
+
+            data = follower.poll()
+            if data is None:
+                self.reloadFile()
+            elif data:
+                self.appendToBuffer(data)
+
+    async def indexFile(self):
+        import asyncio
+
+        # index a memory mapped file a chunk at a time between key presses,
+        # also while another document is shown, filtered views of it wait
+        # for the lines
+        document, buffer = self.document, self.buffer
+        while document.buffer is buffer:
+            pinned = document is self.document and self.pinnedToBottom()
+            changedFrom = buffer.indexMore()
+            if changedFrom is None:
+                break
+            if document is self.document:
+                self.bufferGrew(changedFrom, pinned)
+                if self.startLine is not None and (self.startLine <= buffer.lineCount() or buffer.index.complete()):
+                    self.moveToLine(min(self.startLine, buffer.lineCount()) - 1, forceRender=True)
+                    self.startLine = None
+            else:
+                for view in leaves(self.layoutRoot):
+                    if view.document is document:
+                        view.linesChanged(changedFrom, True)
+                self.renderStatus()
+            await asyncio.sleep(0)
+
+    async def indexWords(self):
+        import asyncio
+
+        # Count the words of every loaded buffer for completion, a few
+        # thousand lines at a time between key presses. Edits keep the
+        # counts up to date, so a buffer is only scanned once, and appended
+        # or newly indexed lines are picked up on the next pass.
+        while True:
+            busy = False
+            for document in list(self.buffers.documents):
+                if document.buffer is None or document.source is not None:
+                    continue
+                if document.words is None or document.words.buffer is not document.buffer:
+                    document.words = WordIndex(document.buffer)
+                if not document.words.done():
+                    document.words.scanMore()
+                    busy = True
+                    await asyncio.sleep(0)
+            if not busy:
+                await asyncio.sleep(0.5)
+
+    async def countStatistics(self):
+        import asyncio
+
+        # Count the words, characters and bytes of the buffers the status
+        # bar showed, a chunk at a time between key presses. Edits keep the
+        # counts up to date, so a buffer is only scanned once.
+        while True:
+            busy = False
+            for document in list(self.buffers.documents):
+                if document.buffer is None or document.source is not None:
+                    continue
+                stats = document.buffer.stats
+                if stats is None or stats.done():
+                    continue
+                stats.scanMore()
+                busy = True
+                if stats.done() and document is self.document:
+                    self.renderStatus()
+                await asyncio.sleep(0)
+            if self.selection is not None and not self.selectionCounted and self.promptText is None \
+                    and self.replaying is None:
+                # blocks the selection covers that were not counted yet
+                self.renderStatus()
+                busy = True
+                await asyncio.sleep(0)
+            if not busy:
+                await asyncio.sleep(0.5)
+
+    def wordsEdited(self, line, old, new):
+        words = self.document.words
+        if words is not None and words.buffer is self.buffer:
+            words.edited(line, old, new)
+
+    def updateCompletion(self):
+        # the most frequent words of the open buffers that start with the
+        # one before the cursor, only what the scan counted so far
+        self.completions = []
+        self.overlayText = None
+        if self.replaying is not None or self.cursors or self.anchor is not None:
+            return
+        prefix = prefixBefore(self.buffer.getLine(self.pos[1]), self.pos[0])
+        indexes = [document.words for document in self.buffers.documents
+                   if document.words is not None and document.words.buffer is document.buffer]
+        self.completions = complete(indexes, prefix, max(min(self.viewHeight() - 1, 8), 1))
+        if self.completions:
+            width = max(len(word) for word in self.completions) + 3
+            lines = [f"{'>' if i == 0 else ' '} {word} " for i, word in enumerate(self.completions)]
+            self.overlayText = "\n".join(line.ljust(width) for line in lines)
+
+    def AcceptCompletion(self):
+        # the rest of the first completion goes in after the cursor
+        line = self.buffer.getLine(self.pos[1])
+        word = self.completions[0]
+        rest = word[len(prefixBefore(line, self.pos[0])):]
+        self.completions = []
+        self.overlayText = None
+        new = line[:self.pos[0]] + rest + line[self.pos[0]:]
+        self.buffer.setLine(self.pos[1], new)
+        self.wordsEdited(self.pos[1], [line], [new])
+        self.damageViews(self.pos[1])
+
+        self.wantChar = self.pos[0] + len(rest) + 1
+        self.placeCursor(self.wantChar, self.tui.cursor_y)
+        self.render()
+
+    def appendToBuffer(self, data):
+        pinned = self.pinnedToBottom()
+        self.bufferGrew(self.buffer.appendData(data), pinned)
+
+    def pinnedToBottom(self):
+        # when following, a view scrolled to the bottom stays pinned there
+        return self.follow and self.linesScrolled >= self.maxScroll()
+
+    def bufferGrew(self, changedFrom, pinned):
+        self.linesChanged(changedFrom)
+
+        if pinned:
+            self.wantChar = 1
+            self.moveToLine(self.buffer.lineCount() - 1, forceRender=True)
+        elif self.rowOf(changedFrom) < self.rowOf(self.linesScrolled) + self.viewHeight():
+            self.render()
+        else:
+            self.renderStatus()
+
+    def reloadFile(self):
+        # the file was truncated or rotated, start over from its new content
+        old = self.buffer
+        self.buffer = TextBuffer.fromFile(self.filename, old.encoding, self.large)
+        self.document.buffer = self.buffer
+        self.Scrollrenderer.buffer = self.buffer
+        old.close()
+        self.follower.size = self.buffer.index.indexed
+        self.linesChanged(0)
+        self.linesScrolled = min(self.linesScrolled, self.maxScroll())
+        self.moveToLine(self.pos[1], forceRender=True)
+        if self.afterReload is not None:
+            self.afterReload(self, self.document)
+
+    def insertChar(self, char):
+        if self.isReadOnly() or self.stillLoading():
+            return
+        self.selection = None
+        if self.cursors or self.anchor is not None:
+            self.editCursors("\r" if char == "\n" else char)
+            return
 
         if char == "\n":
+            # splitting the start of a fold opens it
+            if self.pos[0] > 0 and self.buffer.folds.hiddenLines(self.pos[1]) and self.buffer.folds.unfold(self.pos[1]):
+                self.foldsChanged()
+            # split the line at the cursor
+            _, edit = typeKey(self.buffer, self.pos[1], self.pos[0], "\r")
+            self.wordsEdited(*edit)
+            self.linesChanged(self.pos[1])
+
             # move the cursor to the start of the next line
-            self.tui.cursor_y += 1 + self.linesScrolled
-            self.tui.cursor_x = 1
+            self.wantChar = 1
+            self.moveToLine(self.pos[1] + 1, forceRender=True)
+            return
 
-            self.pos = [0, self.pos[1] + 1]
-        else:
-            self.pos[0] += 1
-            self.numChar += 1
-            self.tui.cursor_x += 1
+        # add the new char at the cursor
+        _, edit = typeKey(self.buffer, self.pos[1], self.pos[0], char)
+        self.wordsEdited(*edit)
+        self.damageViews(self.pos[1])
 
         # move the cursor
-        # self.tui.cursor_x += 1
-        self.wantChar = self.tui.cursor_x
-        self.placeCursor(self.tui.cursor_x, self.tui.cursor_y)
+        self.wantChar = self.pos[0] + 2
+        self.placeCursor(self.wantChar, self.tui.cursor_y)
 
+        self.updateCompletion()
         self.render()
 
     def deleteChar(self):
-        # split text into lines
-        text = self.text.splitlines()
+        if self.isReadOnly() or self.stillLoading():
+            return
+        self.selection = None
+        if self.cursors or self.anchor is not None:
+            self.editCursors("\x7f")
+            return
 
         # if the cursor is at the start of the line
         if self.pos[0] == 0:
+            if self.pos[1] == 0:
+                return
+            # joining onto a folded line opens its fold
+            if self.buffer.folds.unfold(self.pos[1] - 1):
+                self.foldsChanged()
             # add the current line to the previous line
-            text[self.pos[1] - 1] += text[self.pos[1]]
-            # remove the current line
-            text.pop(self.pos[1])
-            self.pos[1] -= 1
-            self.pos[0] = len(text[self.pos[1]])
-        else:
-            # get the line the cursor is on
-            line = text[self.pos[1]]
-
-            # get the char the cursor is on and add the new char
-            line = line[:self.pos[0] - 1] + line[self.pos[0]:]
+            (line, char), edit = typeKey(self.buffer, self.pos[1], 0, "\x7f")
+            self.wordsEdited(*edit)
+            self.linesChanged(line)
 
-            # replace the line with the new line
-            text[self.pos[1]] = line
-            self.pos[0] -= 1
-            self.numChar -= 1
-
-        # join the lines back together
-        self.text = "\n".join(text)
+            self.wantChar = char + 1
+            self.moveToLine(line, forceRender=True)
+            return
 
+        # remove the char before the cursor
+        _, edit = typeKey(self.buffer, self.pos[1], self.pos[0], "\x7f")
+        self.wordsEdited(*edit)
+        self.damageViews(self.pos[1])
 
         # move the cursor
-        self.tui.cursor_x = self.pos[0] + 1
-        self.tui.cursor_y = self.pos[1] + 2 + self.linesScrolled
-        self.wantChar = self.tui.cursor_x
-        self.placeCursor(self.tui.cursor_x, self.tui.cursor_y)
+        self.wantChar = self.pos[0]
+        self.placeCursor(self.wantChar, self.tui.cursor_y)
 
+        self.updateCompletion()
         self.render()
 
-    async def getKey(self):
+    async def getKey(self, timeout=None):
+        # keys of a macro being replayed come first, straight from memory
+        if self.replaying is not None:
+            self.replayedKeys += 1
+            typed = None
+            if self.replayedKeys % CHECK_KEYS == 0:
+                import asyncio
+
+                # other tasks and attached clients get their turn, and a key
+                # typed meanwhile stops the replay; Ctrl-C does only that
+                await asyncio.sleep(0)
+                typed = await self.readKey(0)
+            key = next(self.replaying, None) if typed is None else None
+            if key is not None:
+                return key
+            self.finishReplay(stopped=typed is not None)
+            if typed is not None and typed != "\x03":
+                self.macro.record(typed)
+                return typed
+        key = await self.readKey(timeout)
+        if key is not None:
+            self.macro.record(key)
+        return key
+
+    async def readKey(self, timeout=None):
+        # None when no key came within the timeout
+        import asyncio
+        import time
+
+        deadline = None if timeout is None else time.monotonic() + timeout
 
         # Created using help from StackOverflow 
 
@@ -267,73 +1732,198 @@ class pyEdit:
                                 return "RIGHT"
                             if key_stroke == b'K':
                                 return "LEFT"
+                            if key_stroke == b'I':
+                                return "PGUP"
+                            if key_stroke == b'Q':
+                                return "PGDN"
+                            if key_stroke == b'w':
+                                return "CTRL_HOME"
+                            if key_stroke == b'u':
+                                return "CTRL_END"
+                        elif key_stroke == b'\x1b':
+                            return "ESC"
                         else:
                             decoded_key = key_stroke.decode("utf-8")
                             if decoded_key == chr(19):  # Control + S
                                 return "SAVE"
                             return decoded_key
 
+            # wait without blocking the loop, other tasks keep running
+            while not msvcrt.kbhit():
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                await asyncio.sleep(0.01)
+
             return getKey()
         else:
             # macOS and Linux
+            import select
             import termios
             import tty
 
-            fd = sys.stdin.fileno()
-            old_settings = termios.tcgetattr(fd)
+            fd = self.tui.input_fd
+
+            # wait without blocking the loop, other tasks keep running
+            while not select.select([fd], [], [], 0)[0]:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                await asyncio.sleep(0.01)
 
+            # keys of an attached client come through a pipe, its terminal
+            # is in raw mode at the client's end
+            terminal = os.isatty(fd)
+            old_settings = termios.tcgetattr(fd) if terminal else None
+
+            # read straight from the descriptor, sys.stdin would buffer the
+            # rest of an escape sequence where select cannot see it
             try:
-                tty.setraw(sys.stdin.fileno())
-                ch = sys.stdin.read(1)
+                # TCSANOW, the default would flush the key we waited for
+                if terminal:
+                    tty.setraw(fd, termios.TCSANOW)
+                ch = self.readChar(fd)
+                if ch == '\x1b':
+                    # a lone escape key has nothing following it
+                    if not select.select([fd], [], [], 0.05)[0]:
+                        return "ESC"
+                    ch = ch + self.readChar(fd)
+                    if ch == '\x1b[' or ch == '\x1bO':
+                        # read up to the final byte of the sequence
+                        while True:
+                            last = self.readChar(fd)
+                            ch = ch + last
+                            if '@' <= last <= '~':
+                                break
             finally:
-                termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-
-            if ch == '\x1b':
-                ch = ch + sys.stdin.read(2)
-                if ch == '\x1b[A':
-                    return "UP"
-                if ch == '\x1b[B':
-                    return "DOWN"
-                if ch == '\x1b[C':
-                    return "RIGHT"
-                if ch == '\x1b[D':
-                    return "LEFT"
+                if terminal:
+                    termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+
+            if ch.startswith('\x1b'):
+                return ESCAPE_SEQUENCES.get(ch)
             else:
                 if ch == chr(19):  # Control + S
                     return "SAVE"
                 return ch
 
+    def readChar(self, fd):
+        # one character, which can be several bytes of utf-8
+        data = os.read(fd, 1)
+        while True:
+            try:
+                return data.decode("utf-8")
+            except UnicodeDecodeError:
+                if len(data) >= 4:
+                    return data.decode("utf-8", "replace")
+                data += os.read(fd, 1)
+
 
     def render(self):
+        if self.replaying is not None:
+            # a macro is being replayed, finishReplay draws the result
+            return
         self.setWidthHeight()
+        self.layoutViews()
 
-        self.Scrollrenderer.width = self.width
-        self.Scrollrenderer.height = self.height - 1
+        self.Scrollrenderer.width = self.view.width
+        self.Scrollrenderer.height = self.view.height
+        # a split or resize can leave the view scrolled past the end, a fold
+        # can hide the top line
+        self.linesScrolled = min(self.lineAtRow(self.rowOf(self.linesScrolled)), self.maxScroll())
         self.Scrollrenderer.linesScrolled = self.linesScrolled
-        self.Scrollrenderer.text = self.text
-
-        # clear screen
-        print("\033c", end="")
 
         scrollRenderedLines = self.Scrollrenderer.renderLines()   
+        gutterLines = self.Scrollrenderer.renderGutter()
+        self.drawViews()
 
-        # set cursor position
-        self.tui.show_cursor()
-        self.tui.move_cursor(self.tui.cursor_x, self.tui.cursor_y)
-        self.tui.render(scrollRenderedLines, "Hello World! This is my text editor. Press q to quit. Ctrl-S to Save. " + self.debug, overlay="Hello guys! = none \n Testing again! \n")
+        # the TUI draws the frame over the previous one and places the cursor
+        self.tui.render(scrollRenderedLines, self.statusText(), overlay=self.overlayText, gutter=gutterLines,
+                        marks=self.cursorMarks())
+
+    def linesChanged(self, line):
+        # a line was inserted or removed, rows below it shift
+        if self.Scrollrenderer.gutter is not None:
+            self.Scrollrenderer.gutter.linesChanged(line)
+        self.damageViews(line, shifted=True)
+
+    def renderStatus(self):
+        # cursor moved inside the view, only the status bar needs redrawing
+        # along with rows of other views that follow mode or indexing damaged
+        if self.replaying is not None:
+            return
+        self.drawViews()
+        self.tui.render_status(self.statusText())
+
+    def statusText(self):
+        if self.promptText is not None:
+            return self.promptText
+        status = "Hello World! This is my text editor. Press q to quit. Ctrl-S to Save. " + self.debug
+        if self.document.source is None:
+            status = self.statisticsText() + status
+        if self.follow:
+            status = f"[follow {self.buffer.lineCount()} lines] " + status
+        if self.buffer.encoding != "utf-8" or self.buffer.newline != "\n":
+            # files that are not plain utf-8 with unix line endings say so
+            newline = "CRLF" if self.buffer.newline == "\r\n" else "LF"
+            status = f"[{self.buffer.encoding} {newline}] " + status
+        if self.buffer.modified:
+            # lines added, changed and removed since the file was saved
+            status = f"[{self.buffer.changes().summary()}] " + status
+        if self.selection is not None:
+            status = f"[{self.selectionText()}] " + status
+        if self.document.source is not None:
+            lines = self.buffer
+            searching = "" if lines.done else ", searching"
+            status = f"[{len(lines.matches)} of {lines.sourceLineCount()} lines{searching}] Enter goes to the line. " + status
+        if self.macro.recording is not None:
+            status = f"[recording macro, {len(self.macro.recording)} keys] " + status
+        if self.document.loading:
+            status = f"[decompressing {self.buffer.lineCount()} lines] " + status
+        if self.document.piped:
+            reading = "reading" if self.pipeOpen else "done"
+            status = f"[pager {self.buffer.lineCount()} lines, {reading}] Press q to quit. / to search. " + self.debug
+        if len(self.buffers.documents) > 1:
+            number = self.buffers.documents.index(self.document) + 1
+            status = f"[{number}/{len(self.buffers.documents)} {self.document.name()}] " + status
+        return status
+
+    def statisticsText(self):
+        # kept up to date by every edit, the scan only counts a buffer once
+        stats = self.buffer.statistics()
+        lines, words, chars, size = stats.totals()
+        if not stats.done():
+            return f"[{lines} lines, counting {100 * stats.scanned // lines}%] "
+        return f"[{lines} lines {words} words {chars} chars {size} bytes] "
+
+    def selectionText(self):
+        mode = self.selection[0]
+        self.selectionCounted = True
+        if self.document.source is not None:
+            return f"{mode} selection"
+        counts = self.buffer.statistics().countSelection(*self.selectionEnds())
+        # countStatistics draws the status again until the counts are done
+        self.selectionCounted = counts is not None
+        if counts is None:
+            return f"{mode} selection, counting"
+        lines, words, chars = counts
+        if words is None:
+            return f"{mode} selection {lines} lines"
+        return f"{mode} selection {lines} lines {words} words {chars} chars"
 
     def placeCursor(self, char, relLine):
-        line = self.linesScrolled + relLine - 2 # -2 because of the header and index
-        if line < len(self.text.splitlines()):
+        # -2 because of the header and index
+        row = self.rowOf(self.linesScrolled) + relLine - 2
+        line = self.buffer.folds.lineAt(row)
+        if 0 <= row < self.buffer.folds.rowCount(self.buffer.lineCount()):
             self.numLine = line
-            if char <= len(self.text.splitlines()[line]):
-                self.numChar = char
+            length = len(self.buffer.getLine(line))
+            if char <= length:
+                self.numChar = max(char, 1)
             else:
-                self.numChar = len(self.text.splitlines()[line]) + 1
+                self.numChar = length + 1
             
             self.tui.cursor_x = self.numChar
-            self.tui.cursor_y = self.numLine - self.linesScrolled + 2
-            self.tui.move_cursor(self.tui.cursor_x, self.tui.cursor_y)
+            self.tui.cursor_y = row - self.rowOf(self.linesScrolled) + 2
+            if self.replaying is None:
+                self.tui.move_cursor(self.tui.cursor_x, self.tui.cursor_y)
 
             # Text index
             self.pos[0] = self.numChar - 1